@@ -7,40 +7,36 @@ import timm
 import torch
 import torch.nn as nn
 import torch.optim as optim
-import torchmetrics.classification
 from torch.utils.data import DataLoader
 from tqdm import tqdm
 
 sys.path.append(str(Path(__file__).parent.parent))
 
-from kvasircapsuleloader import KvasirCapsuleDataset, fix_random_seed
+from kvasircapsuleloader import (
+    Evaluator,
+    KvasirCapsuleDataset,
+    autotune_loader,
+    fix_random_seed,
+)
 
 
 def evaluate(device: torch.device, model: nn.Module, dataloader: DataLoader) -> float:
     model.eval()
-    acc_multi_micro = torchmetrics.classification.Accuracy(
-        task="multiclass", num_classes=14, average="micro"
-    ).to(device)
-    acc_multi_macro = torchmetrics.classification.Accuracy(
-        task="multiclass", num_classes=14, average="macro"
-    ).to(device)
-    acc_multi_weighted = torchmetrics.classification.Accuracy(
-        task="multiclass", num_classes=14, average="weighted"
-    ).to(device)
+    evaluator = Evaluator(14, dataloader.dataset.samples)
     with torch.no_grad():
         for images, _, labels in dataloader:
-            images, labels = images.to(device), labels.to(device)
-            outputs = model(images)
-            _, predicted = torch.max(outputs.data, 1)
-            acc_multi_micro(predicted, labels)
-            acc_multi_macro(predicted, labels)
-            acc_multi_weighted(predicted, labels)
-    click.secho(f"  Micro    avg. accuracy: {acc_multi_micro.compute():.4f}", fg="blue")
-    click.secho(f"  Macro    avg. accuracy: {acc_multi_macro.compute():.4f}", fg="blue")
+            outputs = model(images.to(device))
+            evaluator.update(outputs, labels)
+    metrics = evaluator.compute()
+    click.secho(f"  Micro    avg. accuracy: {metrics['accuracy_micro']:.4f}", fg="blue")
+    click.secho(f"  Macro    avg. accuracy: {metrics['accuracy_macro']:.4f}", fg="blue")
     click.secho(
-        f"  Weighted avg. accuracy: {acc_multi_weighted.compute():.4f}", fg="blue"
+        f"  Weighted avg. accuracy: {metrics['accuracy_weighted']:.4f}", fg="blue"
     )
-    return acc_multi_macro.compute()
+    click.secho(
+        f"  Patient  macro accuracy: {metrics['patient_accuracy_macro']:.4f}", fg="blue"
+    )
+    return metrics["accuracy_macro"]
 
 
 def train(
@@ -88,7 +84,8 @@ def train(
     default="resnet50",
 )
 @click.option("--epochs", "-E", type=int, default=100)
-def main(lr: float, model_name: str, epochs: int):
+@click.option("--autotune/--no-autotune", default=False)
+def main(lr: float, model_name: str, epochs: int, autotune: bool):
     fix_random_seed()
 
     dataset = KvasirCapsuleDataset()
@@ -99,11 +96,20 @@ def main(lr: float, model_name: str, epochs: int):
     model = model.to(device)
 
     # TODO random weighted sampling
-    train_loader = DataLoader(
-        dataset.train(), batch_size=8, shuffle=True, num_workers=4
-    )
-    val_loader = DataLoader(dataset.val(), batch_size=32, shuffle=False)
-    test_loader = DataLoader(dataset.test(), batch_size=32, shuffle=False)
+    if autotune:
+        train_config = autotune_loader(dataset.train())
+        eval_config = autotune_loader(dataset.val())
+        click.secho(f"Train loader: {train_config}", fg="blue")
+        click.secho(f"Eval loader: {eval_config}", fg="blue")
+        train_loader = train_config.dataloader(dataset.train(), shuffle=True)
+        val_loader = eval_config.dataloader(dataset.val(), shuffle=False)
+        test_loader = eval_config.dataloader(dataset.test(), shuffle=False)
+    else:
+        train_loader = DataLoader(
+            dataset.train(), batch_size=8, shuffle=True, num_workers=4
+        )
+        val_loader = DataLoader(dataset.val(), batch_size=32, shuffle=False)
+        test_loader = DataLoader(dataset.test(), batch_size=32, shuffle=False)
 
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.Adam(model.parameters(), lr=lr)
@@ -12,6 +12,7 @@ def main():
     out_path = Path("splits/default_80_10_10.json")
     out_path.parent.mkdir(parents=True, exist_ok=True)
     dataset.split.save(out_path)
+    dataset.split.save(out_path.with_suffix(".splits"))
 
 
 if __name__ == "__main__":
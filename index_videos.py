@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+from typing import Optional
+
+import click
+
+from kvasircapsuleloader.config import KVASIR_CAPSULE_VIDEO_PATH
+from kvasircapsuleloader.download import download_unlabelled_videos
+from kvasircapsuleloader.video import index_videos
+
+
+@click.command()
+@click.option("--download/--no-download", default=True)
+@click.option("--workers", "-W", type=int, default=None)
+@click.option("--overwrite", is_flag=True, default=False)
+def main(download: bool, workers: Optional[int], overwrite: bool):
+    if download and not KVASIR_CAPSULE_VIDEO_PATH.is_dir():
+        download_unlabelled_videos()
+    videos = index_videos(num_workers=workers, overwrite=overwrite)
+    num_frames = sum(video.num_frames for video in videos)
+    num_keyframes = sum(len(video.keyframes) for video in videos)
+    click.secho(
+        f"Indexed {len(videos)} videos, {num_frames} frames, {num_keyframes} keyframes.",
+        fg="green",
+    )
+
+
+if __name__ == "__main__":
+    main()
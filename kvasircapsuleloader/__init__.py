@@ -1,7 +1,19 @@
+from .augmentation import (  # noqa
+    AugmentationBank,
+    KvasirCapsuleAugmentedDataset,
+    build_augmentation_bank,
+)
+from .autotune import LoaderConfig, autotune_loader  # noqa
+from .batching import BatchAssembler  # noqa
 from .bbox import BoundingBox  # noqa
+from .cache import DecodedImageCache, EncodedImageArena  # noqa
+from .crossval import CrossValidation  # noqa
 from .dataset import KvasirCapsuleDataset  # noqa
-from .split import PatientRatioSplit  # noqa
-from .utils import fix_random_seed  # noqa
+from .evaluation import Evaluator, confusion_metrics  # noqa
+from .features import KvasirCapsuleFeatureDataset, extract_features  # noqa
+from .roi import KvasirCapsuleRoiDataset, RoiStore, extract_rois  # noqa
+from .sampler import PatientBlockDistributedSampler, PrioritySampler  # noqa
+from .split import PatientRatioSplit, SplitArchive, save_splits  # noqa
 from .types import (  # noqa
     FindingCategory,
     FindingClass,
@@ -9,3 +21,6 @@ from .types import (  # noqa
     str_to_findingcategory,
     str_to_findingclass,
 )
+from .utils import fix_random_seed  # noqa
+from .video import KvasirCapsuleVideoDataset, VideoIndex, index_videos  # noqa
+from .visualization import render_atlas, render_atlases  # noqa
@@ -0,0 +1,295 @@
+import copy
+import json
+import threading
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+import albumentations as A  # type: ignore[import-untyped]
+import numpy as np
+from torch.utils.data import Dataset
+
+from .config import DEFAULT_RANDOM_SEED, KVASIR_CAPSULE_CACHE_PATH
+from .dataset import KvasirCapsuleSubset
+from .utils import hash_strings, parallel_map, publish_directory
+
+
+def split_pipeline(transform: A.Compose) -> Tuple[A.Compose, A.Compose]:
+    """
+    Split a pipeline at its first Normalize into the random augmentations, which
+    are materialized as uint8 images, and the deterministic tail (Normalize,
+    ToTensorV2) that is applied when serving.
+
+    :param transform: Pipeline, e.g. make_transforms()["train"]
+    :type transform: A.Compose
+    :return: Augmentation pipeline (with the bbox parameters of transform) and tail
+    :rtype: Tuple[A.Compose, A.Compose]
+    """
+    transforms = list(transform.transforms)
+    split = next(
+        (i for i, t in enumerate(transforms) if isinstance(t, A.Normalize)),
+        len(transforms),
+    )
+    bbox_params = transform.processors.get("bboxes")
+    augment = A.Compose(
+        transforms[:split],
+        bbox_params=None if bbox_params is None else bbox_params.params,
+    )
+    return augment, A.Compose(transforms[split:])
+
+
+class AugmentationBank:
+    """
+    On-disk store of K precomputed augmented variants per sample of a subset.
+
+    A bank is a directory with a memory-mapped uint8 array (images.u8) of shape
+    (N, K, H, W, C), the transformed bboxes (N, K, 4) in YOLO format with a mask of
+    samples that have one, labels and a meta.json that also holds the serialized
+    tail of the pipeline. Variant k of sample i is generated with a seed derived
+    from (seed, i, k), so a bank is reproducible bit by bit. Note that a bank
+    needs K times the memory of the augmented images, about 150 KB per variant at
+    224x224.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: Directory of an existing bank
+        :type path: Path
+        :raises FileNotFoundError: If the bank is incomplete
+        """
+        if not (path / "meta.json").is_file():
+            raise FileNotFoundError(f"No augmentation bank in {path}.")
+        self.path = path
+        with open(path / "meta.json", "r") as f:
+            self.meta = json.load(f)
+        self.images = np.memmap(
+            path / "images.u8",
+            dtype=np.uint8,
+            mode="r",
+            shape=(len(self), self.num_variants, *self.meta["image_shape"]),
+        )
+        self.bboxes = np.load(path / "bboxes.npy")
+        self.has_bbox = np.load(path / "has_bbox.npy")
+        self.labels = np.load(path / "labels.npy")
+        self.tail = A.from_dict(self.meta["tail"])
+
+    def __len__(self) -> int:
+        return self.meta["num_samples"]
+
+    @property
+    def num_variants(self) -> int:
+        return self.meta["num_variants"]
+
+
+def _variant_seed(seed: int, index: int, variant: int) -> int:
+    return int(np.random.SeedSequence([seed, index, variant]).generate_state(1)[0])
+
+
+def augmentation_bank_path(
+    subset: KvasirCapsuleSubset, augment: A.Compose, num_variants: int, seed: int
+) -> Path:
+    """
+    Return the bank directory for a subset, augmentation pipeline, number of
+    variants and seed.
+
+    :param subset: Subset the bank is built for
+    :type subset: KvasirCapsuleSubset
+    :param augment: Augmentation part of the pipeline
+    :type augment: A.Compose
+    :param num_variants: Number of variants per sample
+    :type num_variants: int
+    :param seed: Random seed
+    :type seed: int
+    :return: Directory of the augmentation bank
+    :rtype: Path
+    """
+    key = hash_strings(
+        [repr(augment), str(num_variants), str(seed)]
+        + [sample.filename for sample in subset.samples]
+    )
+    return KVASIR_CAPSULE_CACHE_PATH / "augmentations" / f"{subset.phase}_{key[:16]}"
+
+
+def build_augmentation_bank(
+    subset: KvasirCapsuleSubset,
+    num_variants: int = 8,
+    transform: Optional[A.Compose] = None,
+    seed: int = DEFAULT_RANDOM_SEED,
+    num_workers: Optional[int] = None,
+    overwrite: bool = False,
+) -> AugmentationBank:
+    """
+    Materialize num_variants augmented variants of every sample of a subset in
+    parallel, or return the existing bank for the same inputs.
+
+    :param subset: Subset to augment, usually the train subset
+    :type subset: KvasirCapsuleSubset
+    :param num_variants: Number of variants per sample, defaults to 8
+    :type num_variants: int, optional
+    :param transform: Pipeline to materialize up to its Normalize, see
+        split_pipeline(), defaults to the subset's transform
+    :type transform: A.Compose, optional
+    :param seed: Random seed, defaults to DEFAULT_RANDOM_SEED
+    :type seed: int, optional
+    :param num_workers: Number of workers, defaults to the number of CPUs
+    :type num_workers: int, optional
+    :param overwrite: Build again even if the bank exists, defaults to False
+    :type overwrite: bool, optional
+    :raises ValueError: If the subset is empty or augmented images differ in shape
+    :return: Augmentation bank of the subset
+    :rtype: AugmentationBank
+    """
+    if len(subset.samples) == 0:
+        raise ValueError("Cannot build an augmentation bank of an empty subset.")
+    augment, tail = split_pipeline(subset.transform if transform is None else transform)
+    path = augmentation_bank_path(subset, augment, num_variants, seed)
+    if (path / "meta.json").is_file() and not overwrite:
+        return AugmentationBank(path)
+
+    N, K = len(subset.samples), num_variants
+    local = threading.local()
+
+    def generate(i: int) -> np.ndarray:
+        # pipelines keep their random state, every thread needs its own copy
+        if not hasattr(local, "augment"):
+            local.augment = copy.deepcopy(augment)
+        sample = subset.samples[i]
+        if subset.image_cache is None:
+            image = sample.load_image()
+        else:
+            image = subset.image_cache.load(sample)
+        bboxes = [sample.bbox.to_yolo()] if sample.bbox else []
+        variants = []
+        for k in range(K):
+            local.augment.set_random_seed(_variant_seed(seed, i, k))
+            augmented = local.augment(
+                image=image, bboxes=bboxes, class_labels=sample.finding_class.value
+            )
+            variants.append(np.clip(np.round(augmented["image"] * 255.0), 0, 255))
+            if len(augmented["bboxes"]) > 0:
+                out_bboxes[i, k] = augmented["bboxes"][0]
+                has_bbox[i, k] = True
+        return np.stack(variants).astype(np.uint8)
+
+    # the first sample determines the image shape
+    out_bboxes = np.zeros((N, K, 4), dtype=np.float32)
+    has_bbox = np.zeros((N, K), dtype=bool)
+    first = generate(0)
+    image_shape = first.shape[1:]
+
+    with publish_directory(path, overwrite=overwrite) as tmp_path:
+        images = np.memmap(
+            tmp_path / "images.u8",
+            dtype=np.uint8,
+            mode="w+",
+            shape=(N, K, *image_shape),
+        )
+        images[0] = first
+
+        def store(i: int):
+            variants = generate(i)
+            if variants.shape[1:] != image_shape:
+                raise ValueError(
+                    f"Augmented {subset.samples[i].filename} has shape "
+                    f"{variants.shape[1:]}, expected {image_shape}"
+                )
+            images[i] = variants
+
+        parallel_map(
+            store,
+            range(1, N),
+            num_workers=num_workers,
+            desc="Materializing augmentations",
+        )
+        images.flush()
+        np.save(tmp_path / "bboxes.npy", out_bboxes)
+        np.save(tmp_path / "has_bbox.npy", has_bbox)
+        np.save(
+            tmp_path / "labels.npy",
+            np.array([s.finding_class.value for s in subset.samples], dtype=np.int64),
+        )
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump(
+                {
+                    "phase": subset.phase,
+                    "num_samples": N,
+                    "num_variants": K,
+                    "seed": seed,
+                    "image_shape": list(image_shape),
+                    "augment": repr(augment),
+                    "tail": A.to_dict(tail),
+                    "filenames": [s.filename for s in subset.samples],
+                },
+                f,
+            )
+    return AugmentationBank(path)
+
+
+class KvasirCapsuleAugmentedDataset(Dataset):
+    """
+    Dataset that serves one precomputed variant per sample and epoch from an
+    AugmentationBank, so training costs a copy and the cheap pipeline tail per
+    sample.
+
+    Variants follow a seeded schedule: within every cycle of K epochs each variant
+    of a sample is served once, in an order drawn per sample and cycle. Call
+    set_epoch() before every epoch, like for DistributedSampler; persistent
+    DataLoader workers keep the dataset of the first epoch and must not be used.
+    Items are (image, bboxes, label) like KvasirCapsuleSubset.
+    """
+
+    def __init__(
+        self, bank: AugmentationBank, seed: int = DEFAULT_RANDOM_SEED, tail: bool = True
+    ):
+        """
+        :param bank: Augmentation bank to serve
+        :type bank: AugmentationBank
+        :param seed: Random seed of the schedule, defaults to DEFAULT_RANDOM_SEED
+        :type seed: int, optional
+        :param tail: Apply the pipeline tail (e.g. Normalize, ToTensorV2), otherwise
+            uint8 HWC arrays are served, defaults to True
+        :type tail: bool, optional
+        """
+        self.bank = bank
+        self.seed = seed
+        self.tail = tail
+        self.set_epoch(0)
+
+    def schedule(self, epoch: int) -> np.ndarray:
+        """
+        Return the variant of every sample in an epoch.
+
+        :param epoch: Epoch
+        :type epoch: int
+        :return: Variant index per sample (N,)
+        :rtype: np.ndarray
+        """
+        N, K = len(self.bank), self.bank.num_variants
+        rng = np.random.default_rng([self.seed, epoch // K])
+        orders = rng.permuted(np.tile(np.arange(K), (N, 1)), axis=1)
+        return orders[:, epoch % K]
+
+    def set_epoch(self, epoch: int):
+        """
+        Select the variants served in an epoch.
+
+        :param epoch: Epoch
+        :type epoch: int
+        """
+        self.epoch = epoch
+        self.variants = self.schedule(epoch)
+
+    def __len__(self) -> int:
+        return len(self.bank)
+
+    def __getitem__(self, index) -> Any:
+        k = self.variants[index]
+        image = np.array(self.bank.images[index, k])
+        if self.bank.has_bbox[index, k]:
+            bboxes = [self.bank.bboxes[index, k]]
+        else:
+            bboxes = [np.zeros(4, dtype=np.float32)]
+        class_labels = int(self.bank.labels[index])
+        if not self.tail:
+            return image, bboxes, class_labels
+        image = image.astype(np.float32) / np.float32(255.0)
+        return self.bank.tail(image=image)["image"], bboxes, class_labels
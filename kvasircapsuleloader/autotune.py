@@ -0,0 +1,280 @@
+import io
+import json
+import socket
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Subset
+
+from .config import DEFAULT_RANDOM_SEED, KVASIR_CAPSULE_CACHE_PATH
+from .dataset import KvasirCapsuleSubset
+from .utils import default_num_workers, temporary_path
+
+AUTOTUNE_CACHE_PATH = KVASIR_CAPSULE_CACHE_PATH / "autotune.json"
+
+
+class LoaderConfig:
+    """
+    DataLoader settings found by autotune_loader(), with the measured throughput
+    and the pipeline stage that dominates per-sample cost.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        num_workers: int,
+        prefetch_factor: Optional[int],
+        pin_memory: bool,
+        throughput: float = 0.0,
+        bottleneck: str = "unknown",
+    ):
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.prefetch_factor = prefetch_factor if num_workers > 0 else None
+        self.pin_memory = pin_memory
+        self.throughput = throughput
+        self.bottleneck = bottleneck
+
+    def kwargs(self) -> Dict[str, Any]:
+        """
+        Return keyword arguments for torch.utils.data.DataLoader.
+
+        :return: DataLoader keyword arguments
+        :rtype: Dict[str, Any]
+        """
+        return {
+            "batch_size": self.batch_size,
+            "num_workers": self.num_workers,
+            "prefetch_factor": self.prefetch_factor,
+            "pin_memory": self.pin_memory,
+            "persistent_workers": self.num_workers > 0,
+        }
+
+    def dataloader(self, dataset, **kwargs) -> DataLoader:
+        """
+        Create a DataLoader with this configuration.
+
+        :param dataset: Dataset to load, e.g. KvasirCapsuleSubset
+        :param kwargs: Additional or overriding DataLoader arguments, e.g. shuffle
+        :return: Configured DataLoader
+        :rtype: DataLoader
+        """
+        return DataLoader(dataset, **{**self.kwargs(), **kwargs})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "batch_size": self.batch_size,
+            "num_workers": self.num_workers,
+            "prefetch_factor": self.prefetch_factor,
+            "pin_memory": self.pin_memory,
+            "throughput": self.throughput,
+            "bottleneck": self.bottleneck,
+        }
+
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> "LoaderConfig":
+        return LoaderConfig(**d)
+
+    def __repr__(self) -> str:
+        return f"LoaderConfig({self.to_dict()})"
+
+
+def profile_stages(
+    subset: KvasirCapsuleSubset, num_samples: int = 32, seed: int = DEFAULT_RANDOM_SEED
+) -> Dict[str, float]:
+    """
+    Measure mean seconds per sample spent on file I/O, JPEG decoding and
+    augmentation in a single process.
+
+    :param subset: Subset to profile
+    :type subset: KvasirCapsuleSubset
+    :param num_samples: Number of random samples to measure, defaults to 32
+    :type num_samples: int, optional
+    :param seed: Random seed for sample selection, defaults to DEFAULT_RANDOM_SEED
+    :type seed: int, optional
+    :return: Seconds per sample for the stages "io", "decode" and "augment"
+    :rtype: Dict[str, float]
+    """
+    rng = np.random.default_rng(seed)
+    indices = rng.choice(len(subset), min(num_samples, len(subset)), replace=False)
+    times = {"io": 0.0, "decode": 0.0, "augment": 0.0}
+    for i in indices:
+        sample = subset.samples[i]
+        t0 = time.perf_counter()
+        with sample.open_file() as f:
+            data = f.read()
+        t1 = time.perf_counter()
+        image = np.asarray(
+            Image.open(io.BytesIO(data)).convert("RGB"), dtype=np.float32
+        ) / np.float32(255.0)
+        t2 = time.perf_counter()
+        if subset.transform is not None:
+            # same calls as KvasirCapsuleSubset.__getitem__
+            label = sample.finding_class.value
+            if sample.bbox is None:
+                subset.transform(image=image, class_labels=label)
+            else:
+                bboxes = [sample.bbox.to_yolo()]
+                subset.transform(image=image, bboxes=bboxes, class_labels=label)
+        t3 = time.perf_counter()
+        times["io"] += t1 - t0
+        times["decode"] += t2 - t1
+        times["augment"] += t3 - t2
+    return {stage: t / max(len(indices), 1) for stage, t in times.items()}
+
+
+def _measure(
+    subset: KvasirCapsuleSubset,
+    config: LoaderConfig,
+    indices: np.ndarray,
+    num_batches: int,
+    collate_fn: Optional[Callable],
+) -> float:
+    """
+    Return samples per second of a DataLoader, excluding worker startup and the
+    first batch.
+    """
+    batch_indices = indices[: config.batch_size * (num_batches + 1)]
+    kwargs = config.kwargs()
+    kwargs["persistent_workers"] = False
+    loader = DataLoader(
+        Subset(subset, batch_indices.tolist()), **kwargs, collate_fn=collate_fn
+    )
+    iterator = iter(loader)
+    next(iterator)
+    count = 0
+    start = time.perf_counter()
+    for batch in iterator:
+        count += len(batch[0])
+    elapsed = time.perf_counter() - start
+    return count / elapsed if elapsed > 0 else 0.0
+
+
+def _qualified_name(fn: Optional[Callable]) -> str:
+    if fn is None:
+        return "default"
+    # callable objects, e.g. BatchAssembler, are keyed by their class
+    named = fn if hasattr(fn, "__qualname__") else type(fn)
+    return f"{named.__module__}.{named.__qualname__}"
+
+
+def _cache_key(
+    subset: KvasirCapsuleSubset,
+    batch_sizes: Sequence[int],
+    worker_counts: Sequence[int],
+    prefetch_factors: Sequence[int],
+    num_batches: int,
+    collate_fn: Optional[Callable],
+) -> str:
+    grid = json.dumps(
+        [list(batch_sizes), list(worker_counts), list(prefetch_factors), num_batches]
+    )
+    return (
+        f"{socket.gethostname()}|{Path(subset.parent.path).resolve()}|{subset.phase}"
+        f"|{grid}|{_qualified_name(collate_fn)}"
+    )
+
+
+def autotune_loader(
+    subset: KvasirCapsuleSubset,
+    batch_sizes: Sequence[int] = (8, 16, 32, 64),
+    worker_counts: Optional[Sequence[int]] = None,
+    prefetch_factors: Sequence[int] = (2, 4),
+    num_batches: int = 8,
+    collate_fn: Optional[Callable] = None,
+    use_cache: bool = True,
+    seed: int = DEFAULT_RANDOM_SEED,
+) -> LoaderConfig:
+    """
+    Probe DataLoader throughput of a subset and return the fastest configuration.
+
+    The grid is searched coordinate-wise (workers, then prefetch factor, pin memory
+    and batch size) instead of exhaustively, which keeps probing to a few seconds.
+    Every probe reads different samples so that earlier probes do not warm the page
+    cache for later ones. Results are cached per host, dataset path, phase,
+    candidate grid and collate function.
+
+    :param subset: Subset to tune the loader for
+    :type subset: KvasirCapsuleSubset
+    :param batch_sizes: Candidate batch sizes, defaults to (8, 16, 32, 64)
+    :type batch_sizes: Sequence[int], optional
+    :param worker_counts: Candidate worker counts, defaults to 0 and powers of two
+        up to the number of CPUs
+    :type worker_counts: Sequence[int], optional
+    :param prefetch_factors: Candidate prefetch factors, defaults to (2, 4)
+    :type prefetch_factors: Sequence[int], optional
+    :param num_batches: Number of measured batches per probe, defaults to 8
+    :type num_batches: int, optional
+    :param collate_fn: Collate function used for probing, defaults to None
+    :type collate_fn: Callable, optional
+    :param use_cache: Return and store cached results, defaults to True
+    :type use_cache: bool, optional
+    :param seed: Random seed for sample selection, defaults to DEFAULT_RANDOM_SEED
+    :type seed: int, optional
+    :return: Fastest configuration found
+    :rtype: LoaderConfig
+    """
+    if worker_counts is None:
+        cpus = default_num_workers()
+        worker_counts = [0] + [2**i for i in range(cpus.bit_length()) if 2**i <= cpus]
+    key = _cache_key(
+        subset, batch_sizes, worker_counts, prefetch_factors, num_batches, collate_fn
+    )
+    cache: Dict[str, Any] = {}
+    if AUTOTUNE_CACHE_PATH.is_file():
+        with open(AUTOTUNE_CACHE_PATH, "r") as f:
+            cache = json.load(f)
+    if use_cache and key in cache:
+        return LoaderConfig.from_dict(cache[key])
+    stages = profile_stages(subset, seed=seed)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(subset))
+    pointer = 0
+
+    def measure(config: LoaderConfig) -> float:
+        nonlocal pointer
+        needed = config.batch_size * (num_batches + 1)
+        # wrap around once all samples have been probed
+        if pointer + needed > len(order):
+            pointer = 0
+        indices = order[pointer : pointer + needed]
+        pointer += needed
+        config.throughput = _measure(subset, config, indices, num_batches, collate_fn)
+        return config.throughput
+
+    batch_size = sorted(batch_sizes)[len(batch_sizes) // 2]
+    candidates: List[LoaderConfig] = [
+        LoaderConfig(batch_size, w, prefetch_factors[0], False) for w in worker_counts
+    ]
+    best = max(candidates, key=measure)
+    if best.num_workers > 0:
+        candidates = [
+            LoaderConfig(best.batch_size, best.num_workers, p, False)
+            for p in prefetch_factors
+        ]
+        best = max(candidates, key=measure)
+    if torch.cuda.is_available():
+        candidates = [
+            best,
+            LoaderConfig(best.batch_size, best.num_workers, best.prefetch_factor, True),
+        ]
+        best = max(candidates, key=measure)
+    candidates = [
+        LoaderConfig(b, best.num_workers, best.prefetch_factor, best.pin_memory)
+        for b in batch_sizes
+    ]
+    best = max(candidates, key=measure)
+    best.bottleneck = max(stages, key=lambda stage: stages[stage])
+
+    if use_cache:
+        cache[key] = best.to_dict()
+        AUTOTUNE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = temporary_path(AUTOTUNE_CACHE_PATH)
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=2)
+        tmp_path.replace(AUTOTUNE_CACHE_PATH)
+    return best
@@ -0,0 +1,153 @@
+import os
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from torch.utils.data import get_worker_info
+
+
+class BatchAssembler:
+    """
+    Collate function that writes samples directly into a ring of preallocated
+    batch buffers instead of allocating and stacking fresh tensors per batch.
+
+    Images are copied once, straight from the per-sample output of the transform
+    (CHW tensor) or from HWC arrays, into a uint8 or float16 buffer in NCHW or
+    channels_last layout. Labels and bboxes are written in place as well.
+
+    In the main process (num_workers=0) the buffers are page-locked if CUDA is
+    available, so batches can be moved with ``.to(device, non_blocking=True)`` and
+    DataLoader(pin_memory=...) should stay False. In DataLoader workers the buffers
+    are allocated in shared memory, which makes handing the batch to the main
+    process zero-copy. On CPU-only hosts plain buffers are used.
+
+    A returned batch is a view into the ring and is overwritten after num_buffers
+    further batches. num_buffers must therefore exceed the number of batches in
+    flight, i.e. prefetch_factor + 1 per worker.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        image_size: Tuple[int, int] = (224, 224),
+        channels: int = 3,
+        dtype: torch.dtype = torch.float16,
+        channels_last: bool = True,
+        max_bboxes: int = 1,
+        num_buffers: int = 4,
+        pin_memory: Optional[bool] = None,
+    ):
+        """
+        :param batch_size: Maximum number of samples per batch
+        :type batch_size: int
+        :param image_size: Height and width of the images, defaults to (224, 224)
+        :type image_size: Tuple[int, int], optional
+        :param channels: Number of image channels, defaults to 3
+        :type channels: int, optional
+        :param dtype: torch.float16 or torch.uint8, defaults to torch.float16
+        :type dtype: torch.dtype, optional
+        :param channels_last: Use channels_last memory format, defaults to True
+        :type channels_last: bool, optional
+        :param max_bboxes: Number of bbox slots per sample, defaults to 1
+        :type max_bboxes: int, optional
+        :param num_buffers: Number of batch buffers in the ring, defaults to 4
+        :type num_buffers: int, optional
+        :param pin_memory: Page-lock buffers in the main process, defaults to
+            torch.cuda.is_available()
+        :type pin_memory: bool, optional
+        :raises ValueError: If dtype is not supported
+        """
+        if dtype not in (torch.float16, torch.uint8):
+            raise ValueError(f"dtype must be torch.float16 or torch.uint8, is: {dtype}")
+        self.batch_size = batch_size
+        self.image_shape = (channels, *image_size)
+        self.dtype = dtype
+        self.channels_last = channels_last
+        self.max_bboxes = max_bboxes
+        self.num_buffers = num_buffers
+        self.pin_memory = (
+            torch.cuda.is_available() if pin_memory is None else pin_memory
+        )
+        self._buffers: List[Tuple[torch.Tensor, torch.Tensor, torch.Tensor]] = []
+        self._next = 0
+        self._owner_pid = -1
+
+    def __getstate__(self):
+        # every worker allocates its own ring
+        state = self.__dict__.copy()
+        state["_buffers"] = []
+        state["_next"] = 0
+        return state
+
+    def _allocate(self):
+        """
+        Allocate the ring in the calling process (main process or worker).
+        """
+        self._buffers, self._next = [], 0
+        self._owner_pid = os.getpid()
+        in_worker = get_worker_info() is not None
+        pin = self.pin_memory and not in_worker
+        memory_format = (
+            torch.channels_last if self.channels_last else torch.contiguous_format
+        )
+        for _ in range(self.num_buffers):
+            images = torch.empty(
+                (self.batch_size, *self.image_shape),
+                dtype=self.dtype,
+                memory_format=memory_format,
+                pin_memory=pin,
+            )
+            bboxes = torch.empty(
+                (self.batch_size, self.max_bboxes, 4),
+                dtype=torch.float32,
+                pin_memory=pin,
+            )
+            labels = torch.empty(self.batch_size, dtype=torch.int64, pin_memory=pin)
+            if in_worker:
+                images.share_memory_()
+                bboxes.share_memory_()
+                labels.share_memory_()
+            self._buffers.append((images, bboxes, labels))
+
+    def _write_image(self, out: torch.Tensor, image: Any):
+        if isinstance(image, np.ndarray):
+            # HWC array without ToTensorV2
+            image = torch.from_numpy(image).permute(2, 0, 1)
+        if self.dtype == torch.uint8 and image.is_floating_point():
+            # float images in [0, 1] as returned by load_image()
+            out.copy_(image.mul(255.0).round_())
+        else:
+            out.copy_(image)
+
+    def __call__(
+        self, batch: Sequence[Tuple[Any, Any, Any]]
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Assemble (image, bboxes, label) samples into one batch.
+
+        :param batch: Samples as returned by KvasirCapsuleSubset.__getitem__
+        :type batch: Sequence[Tuple[Any, Any, Any]]
+        :raises ValueError: If the batch is larger than batch_size
+        :return: Views of images (B, C, H, W), bboxes (B, max_bboxes, 4) and
+            labels (B,) into the current ring buffer
+        :rtype: Tuple[torch.Tensor, torch.Tensor, torch.Tensor]
+        """
+        if len(batch) > self.batch_size:
+            raise ValueError(
+                f"Batch of {len(batch)} samples exceeds batch_size {self.batch_size}"
+            )
+        if self._owner_pid != os.getpid():
+            # first call, or a forked worker that inherited the parent's ring
+            self._allocate()
+        images, bboxes, labels = self._buffers[self._next]
+        self._next = (self._next + 1) % self.num_buffers
+        B = len(batch)
+        bboxes[:B].zero_()
+        for i, (image, sample_bboxes, label) in enumerate(batch):
+            self._write_image(images[i], image)
+            boxes = np.asarray(sample_bboxes, dtype=np.float32).reshape(-1, 4)
+            n = min(len(boxes), self.max_bboxes)
+            if n > 0:
+                bboxes[i, :n] = torch.from_numpy(boxes[:n])
+        labels[:B] = torch.as_tensor([label for _, _, label in batch])
+        return images[:B], bboxes[:B], labels[:B]
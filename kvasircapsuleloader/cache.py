@@ -0,0 +1,279 @@
+import io
+import os
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .config import KVASIR_CAPSULE_CACHE_PATH
+from .sample import KvasirCapsuleSample, image_to_array
+from .utils import hash_strings, parallel_map, temporary_path
+
+IMAGE_SHAPE = (336, 336, 3)
+
+
+def _create_file(path: Path, size: int):
+    """
+    Create a zero-filled (sparse) file of size bytes unless it exists. The file is
+    prepared under a temporary name and linked into place, which fails instead of
+    replacing a file that another process has created and may already be writing.
+    """
+    if path.is_file():
+        return
+    tmp_path = temporary_path(path)
+    with open(tmp_path, "wb") as f:
+        f.truncate(size)
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        tmp_path.unlink()
+
+
+class DecodedImageCache:
+    """
+    File-backed cache of decoded uint8 images, one fixed-size slot per sample.
+
+    The cache is a np.memmap, so it is shared by all DataLoader workers, all views
+    over the same samples and subsequent runs, and every image is decoded once. The
+    backing file is sparse until slots are filled; a full KvasirCapsule cache needs
+    about 16 GB.
+    """
+
+    def __init__(
+        self,
+        samples: Sequence[KvasirCapsuleSample],
+        path: Optional[Path] = None,
+        image_shape: Tuple[int, int, int] = IMAGE_SHAPE,
+    ):
+        """
+        :param samples: Samples with one slot each, e.g. KvasirCapsuleMetadata.samples
+        :type samples: Sequence[KvasirCapsuleSample]
+        :param path: Directory of the cache files, defaults to a directory in
+            KVASIR_CAPSULE_CACHE_PATH keyed by the sample filenames
+        :type path: Path, optional
+        :param image_shape: Shape of every image, defaults to IMAGE_SHAPE
+        :type image_shape: Tuple[int, int, int], optional
+        """
+        if path is None:
+            key = hash_strings(sample.filename for sample in samples)
+            path = KVASIR_CAPSULE_CACHE_PATH / "images" / key[:16]
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.image_shape = image_shape
+        self._index = {sample.filename: i for i, sample in enumerate(samples)}
+        self._samples = samples
+        self._open()
+
+    def _open(self):
+        shape = (len(self._samples), *self.image_shape)
+        data_path, filled_path = self.path / "images.u8", self.path / "filled.u8"
+        # several processes may open the same cache, never truncate existing files
+        _create_file(data_path, int(np.prod(shape)))
+        _create_file(filled_path, len(self._samples))
+        self._data = np.memmap(data_path, dtype=np.uint8, mode="r+", shape=shape)
+        self._filled = np.memmap(
+            filled_path, dtype=np.uint8, mode="r+", shape=(len(self._samples),)
+        )
+
+    def __getstate__(self):
+        # memmaps would be pickled as in-memory copies, e.g. for spawned workers
+        state = self.__dict__.copy()
+        del state["_data"], state["_filled"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def __contains__(self, sample: KvasirCapsuleSample) -> bool:
+        return bool(self._filled[self._index[sample.filename]])
+
+    def load(self, sample: KvasirCapsuleSample, scale: bool = True) -> np.ndarray:
+        """
+        Return the image of a sample, decoding and storing it on first access.
+
+        :param sample: Sample covered by this cache
+        :type sample: KvasirCapsuleSample
+        :param scale: Whether to scale to float32 in [0, 1], defaults to True
+        :type scale: bool, optional
+        :raises ValueError: If the decoded image does not match the slot shape
+        :return: Image as returned by KvasirCapsuleSample.load_image()
+        :rtype: np.ndarray
+        """
+        image = self._data[self._ensure(sample)]
+        if not scale:
+            return np.array(image)
+        return image.astype(np.float32) / 255.0
+
+    def _ensure(self, sample: KvasirCapsuleSample) -> int:
+        """
+        Decode the image of sample into its slot if necessary, return the slot.
+        """
+        i = self._index[sample.filename]
+        if not self._filled[i]:
+            image = sample.load_image(scale=False)
+            if image.shape != self.image_shape:
+                raise ValueError(
+                    f"Image {sample.filename} has shape {image.shape}, expected {self.image_shape}"
+                )
+            # concurrent fills write identical bytes, the flag is set last
+            self._data[i] = image
+            self._filled[i] = 1
+        return i
+
+    def fill(self, num_workers: Optional[int] = None):
+        """
+        Decode all missing images in parallel.
+
+        :param num_workers: Number of workers, defaults to the number of CPUs
+        :type num_workers: int, optional
+        """
+        missing = [s for s, filled in zip(self._samples, self._filled) if not filled]
+        parallel_map(
+            self._ensure,
+            missing,
+            num_workers=num_workers,
+            desc="Decoding images",
+        )
+        self.flush()
+
+    def flush(self):
+        """
+        Write pending changes of the memory maps to disk.
+        """
+        self._data.flush()
+        self._filled.flush()
+
+
+class EncodedImageArena:
+    """
+    All encoded JPEG files of a set of samples in one contiguous bytes buffer.
+
+    Files are read once with parallel readinto() calls directly into their slot of
+    the arena, and an offsets array marks where each file starts. Images are then
+    decoded without any filesystem access; the decoder reads from a copy of the
+    encoded bytes, which is small compared to the decoded frame. The labelled
+    KvasirCapsule JPEGs take a small fraction of the memory of decoded frames, so
+    the whole dataset fits in RAM on modest nodes.
+
+    With shared=True the arena lives in POSIX shared memory and is attached by name
+    in spawned DataLoader workers; forked workers share the buffer either way.
+    """
+
+    def __init__(
+        self,
+        samples: Sequence[KvasirCapsuleSample],
+        shared: bool = False,
+        num_workers: Optional[int] = None,
+    ):
+        """
+        :param samples: Samples to load, e.g. KvasirCapsuleMetadata.samples
+        :type samples: Sequence[KvasirCapsuleSample]
+        :param shared: Allocate the arena in shared memory, defaults to False
+        :type shared: bool, optional
+        :param num_workers: Number of parallel reads, defaults to the number of CPUs
+        :type num_workers: int, optional
+        """
+        self._index = {sample.filename: i for i, sample in enumerate(samples)}
+        # sizes from the primary root, which unlike the scratch root is never evicted
+        sizes = parallel_map(
+            lambda s: s.image_path.stat().st_size, samples, num_workers=num_workers
+        )
+        self.offsets = np.zeros(len(samples) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.offsets[1:])
+        self.nbytes = int(self.offsets[-1])
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._owner = True
+        if shared:
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=max(self.nbytes, 1)
+            )
+            self._buffer = np.ndarray(self.nbytes, dtype=np.uint8, buffer=self._shm.buf)
+        else:
+            self._buffer = np.empty(self.nbytes, dtype=np.uint8)
+        view = memoryview(self._buffer)
+
+        def read(i: int):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            # resolve and read in one step, eviction cannot remove an open file
+            with samples[i].open_file() as f:
+                if f.readinto(view[start:end]) != end - start:
+                    raise IOError(f"Short read of {samples[i].relative_path}")
+
+        parallel_map(
+            read, range(len(samples)), num_workers=num_workers, desc="Reading images"
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __contains__(self, sample: KvasirCapsuleSample) -> bool:
+        return sample.filename in self._index
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._shm is not None:
+            # attach by name instead of pickling the whole arena
+            state["_shm"] = self._shm.name
+            state["_owner"] = False
+            del state["_buffer"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self._shm, str):
+            self._shm = shared_memory.SharedMemory(name=self._shm)
+            self._buffer = np.ndarray(self.nbytes, dtype=np.uint8, buffer=self._shm.buf)
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """
+        Release the shared memory segment, unlinking it if this arena created it.
+        """
+        shm = getattr(self, "_shm", None)
+        if isinstance(shm, shared_memory.SharedMemory):
+            self._buffer = np.empty(0, dtype=np.uint8)
+            shm.close()
+            if self._owner:
+                shm.unlink()
+            self._shm = None
+
+    def encoded(self, sample: KvasirCapsuleSample) -> memoryview:
+        """
+        Return the encoded file of a sample as zero-copy view into the arena.
+
+        :param sample: Sample contained in the arena
+        :type sample: KvasirCapsuleSample
+        :return: Encoded JPEG bytes
+        :rtype: memoryview
+        """
+        i = self._index[sample.filename]
+        return memoryview(self._buffer)[self.offsets[i] : self.offsets[i + 1]]
+
+    def load(self, sample: KvasirCapsuleSample, scale: bool = True) -> np.ndarray:
+        """
+        Decode the image of a sample from the arena.
+
+        The encoded bytes are copied into a BytesIO for PIL, so decoded pixels are
+        identical to KvasirCapsuleSample.load_image().
+
+        :param sample: Sample contained in the arena
+        :type sample: KvasirCapsuleSample
+        :param scale: Whether to scale to float32 in [0, 1], defaults to True
+        :type scale: bool, optional
+        :return: Image as returned by KvasirCapsuleSample.load_image()
+        :rtype: np.ndarray
+        """
+        return image_to_array(Image.open(io.BytesIO(self.encoded(sample))), scale)
+
+
+ImageSource = Union[DecodedImageCache, EncodedImageArena]
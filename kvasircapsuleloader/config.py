@@ -27,3 +27,20 @@ for path in CONFIG_PATHS:
 KVASIR_CAPSULE_PATH = Path(CONFIG["kvasir-capsule-path"]).expanduser()
 KVASIR_CAPSULE_PATH.mkdir(exist_ok=True, parents=True)
 DEFAULT_RANDOM_SEED = CONFIG.get("random-seed", 1337)
+KVASIR_CAPSULE_CACHE_PATH = Path(
+    CONFIG.get("kvasir-capsule-cache-path", KVASIR_CAPSULE_PATH / ".cache")
+).expanduser()
+# Optional local scratch directory that caches images of the (network) dataset path
+KVASIR_CAPSULE_SCRATCH_PATH = (
+    Path(CONFIG["kvasir-capsule-scratch-path"]).expanduser()
+    if CONFIG.get("kvasir-capsule-scratch-path")
+    else None
+)
+KVASIR_CAPSULE_SCRATCH_SIZE = (
+    int(CONFIG["kvasir-capsule-scratch-size-gb"] * 1024**3)
+    if CONFIG.get("kvasir-capsule-scratch-size-gb")
+    else None
+)
+KVASIR_CAPSULE_VIDEO_PATH = Path(
+    CONFIG.get("kvasir-capsule-video-path", KVASIR_CAPSULE_PATH / "unlabelled_videos")
+).expanduser()
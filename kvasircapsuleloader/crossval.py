@@ -0,0 +1,148 @@
+from collections import Counter
+from typing import Iterator, List, Literal, Optional, Tuple
+
+import albumentations as A  # type: ignore[import-untyped]
+import numpy as np
+
+from .cache import DecodedImageCache
+from .config import DEFAULT_RANDOM_SEED
+from .dataset import KvasirCapsuleDataset, KvasirCapsuleSubset
+from .split import PatientRatioSplit, generate_kfold_split
+
+
+class CrossValidation:
+    """
+    Patient-disjoint k-fold cross-validation over one KvasirCapsuleDataset.
+
+    Folds are generated with generate_kfold_split(), which assigns every patient
+    with all its samples to one fold, so no patient is shared between folds and the
+    folds together cover every sample. A precomputed split, e.g. loaded from a
+    SplitArchive, is checked to be patient-disjoint. All k folds are generated in one pass and
+    stored as row indices into the dataset's metadata table. Train and val views of
+    a fold are index concatenations over the same metadata samples and share one
+    decoded-image cache, so a full k-fold run parses metadata once and decodes each
+    image once.
+    """
+
+    def __init__(
+        self,
+        dataset: KvasirCapsuleDataset,
+        k: int,
+        strategy: Literal["shuffle", "sort", "solve"] = "solve",
+        seed: int = DEFAULT_RANDOM_SEED,
+        cache_images: bool = True,
+        split: Optional[PatientRatioSplit] = None,
+    ):
+        """
+        :param dataset: Dataset whose metadata is split into folds
+        :type dataset: KvasirCapsuleDataset
+        :param k: Number of folds, must be > 0
+        :type k: int
+        :param strategy: Patient assignment strategy, see generate_kfold_split(),
+            defaults to "solve"
+        :type strategy: Literal["shuffle", "sort", "solve"], optional
+        :param seed: Random seed, defaults to DEFAULT_RANDOM_SEED
+        :type seed: int, optional
+        :param cache_images: Whether views share a DecodedImageCache, defaults to True
+        :type cache_images: bool, optional
+        :param split: Split with phases "fold0" to "fold{k-1}" over the dataset's
+            metadata, e.g. from SplitArchive.load(), generated if None, then
+            strategy and seed are ignored, defaults to None
+        :type split: PatientRatioSplit, optional
+        :raises ValueError: If there are fewer patients than folds, or split has
+            other phases or folds that share patients
+        """
+        self.dataset = dataset
+        self.k = k
+        if split is None:
+            split = generate_kfold_split(dataset.metadata, k, strategy, seed)
+        elif list(split.samples) != [f"fold{i}" for i in range(k)]:
+            raise ValueError(
+                f"Split must have the phases fold0 to fold{k - 1}, has: "
+                f"{', '.join(split.samples)}"
+            )
+        self.split = split
+        self.folds: List[np.ndarray] = [
+            dataset.metadata.indices(self.split.samples[f"fold{i}"]) for i in range(k)
+        ]
+        # count the folds of every patient
+        folds_of = Counter(
+            video_id
+            for i in range(k)
+            for video_id in {s.video_id for s in self.split.samples[f"fold{i}"]}
+        )
+        shared = sorted(video_id for video_id, n in folds_of.items() if n > 1)
+        if shared:
+            raise ValueError(f"Folds share the patients: {', '.join(shared)}")
+        self.image_cache: Optional[DecodedImageCache] = (
+            DecodedImageCache(dataset.metadata.samples) if cache_images else None
+        )
+
+    def __len__(self) -> int:
+        return self.k
+
+    def __iter__(self) -> Iterator[Tuple[KvasirCapsuleSubset, KvasirCapsuleSubset]]:
+        for i in range(self.k):
+            yield self.fold(i)
+
+    def train_indices(self, i: int) -> np.ndarray:
+        """
+        Return metadata row indices of the training set of fold i (all other folds).
+
+        :param i: Fold index
+        :type i: int
+        :return: Int64 array of row indices
+        :rtype: np.ndarray
+        """
+        return np.concatenate([f for j, f in enumerate(self.folds) if j != i])
+
+    def val_indices(self, i: int) -> np.ndarray:
+        """
+        Return metadata row indices of the validation set of fold i.
+
+        :param i: Fold index
+        :type i: int
+        :return: Int64 array of row indices
+        :rtype: np.ndarray
+        """
+        return self.folds[i]
+
+    def fold(
+        self,
+        i: int,
+        transform_train: Optional[A.BaseCompose] = None,
+        transform_val: Optional[A.BaseCompose] = None,
+    ) -> Tuple[KvasirCapsuleSubset, KvasirCapsuleSubset]:
+        """
+        Return train and val views of fold i.
+
+        :param i: Fold index
+        :type i: int
+        :param transform_train: Training transform, defaults to the dataset's "train"
+            transform
+        :type transform_train: A.BaseCompose, optional
+        :param transform_val: Validation transform, defaults to the dataset's "val"
+            transform
+        :type transform_val: A.BaseCompose, optional
+        :raises IndexError: If i is not a valid fold index
+        :return: Train and val subsets
+        :rtype: Tuple[KvasirCapsuleSubset, KvasirCapsuleSubset]
+        """
+        if not 0 <= i < self.k:
+            raise IndexError(f"Fold index must be in [0, {self.k}), is: {i}")
+        samples = self.dataset.metadata.samples
+        train = KvasirCapsuleSubset(
+            "train",
+            self.dataset,
+            [samples[j] for j in self.train_indices(i)],
+            transform_train,
+            self.image_cache,
+        )
+        val = KvasirCapsuleSubset(
+            "val",
+            self.dataset,
+            [samples[j] for j in self.val_indices(i)],
+            transform_val,
+            self.image_cache,
+        )
+        return train, val
@@ -1,15 +1,19 @@
 import os
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 
 import albumentations as A  # type: ignore[import-untyped]
 from torch.utils.data import Dataset
 
+from .cache import EncodedImageArena, ImageSource
 from .config import KVASIR_CAPSULE_PATH
 from .download import download_all
 from .metadata import KvasirCapsuleMetadata
+from .roi import KvasirCapsuleRoiDataset, extract_rois
 from .sample import KvasirCapsuleSample
 from .split import PatientRatioSplit
+from .statistics import DatasetStatistics, load_statistics
+from .storage import get_tiered_storage
 from .transforms import kvasir_capsule_transforms
 from .types import FindingClass, findingclass_to_dirname
 
@@ -21,12 +25,14 @@ class KvasirCapsuleSubset(Dataset):
         parent: "KvasirCapsuleDataset",
         samples: List[KvasirCapsuleSample],
         transform: Optional[A.BaseCompose] = None,
+        image_cache: Optional[ImageSource] = None,
     ):
         self.phase = phase
         self.parent = parent
         self.samples: List[KvasirCapsuleSample] = samples
+        self.image_cache = image_cache
         self.transform = (
-            kvasir_capsule_transforms.get(phase) if transform is None else transform
+            parent.transforms.get(phase) if transform is None else transform
         )
 
     def __len__(self):
@@ -34,7 +40,10 @@ class KvasirCapsuleSubset(Dataset):
 
     def __getitem__(self, index) -> Any:
         sample: KvasirCapsuleSample = self.samples[index]
-        image = sample.load_image()
+        if self.image_cache is None:
+            image = sample.load_image()
+        else:
+            image = self.image_cache.load(sample)
         bboxes = [sample.bbox.to_yolo()] if sample.bbox else []
         class_labels = sample.finding_class.value
         if self.transform is not None:
@@ -53,9 +62,16 @@ class KvasirCapsuleDataset:
         split: Optional[PatientRatioSplit | Path] = None,
         download: bool = True,
         path: Optional[Path] = None,
+        transforms: Optional[Dict[str, A.BaseCompose]] = None,
     ):
         super().__init__()
         self.path = KVASIR_CAPSULE_PATH if path is None else path
+        # default transforms per phase, e.g. from DatasetStatistics.transforms()
+        self.transforms = (
+            kvasir_capsule_transforms if transforms is None else transforms
+        )
+        # image source of subsets, e.g. set by load_into_memory()
+        self.image_cache: Optional[ImageSource] = None
 
         if download:
             self.download(overwrite=False)
@@ -68,16 +84,21 @@ class KvasirCapsuleDataset:
             self.split = PatientRatioSplit(train=0.8, val=0.1, test=0.1)
             self.split.generate(self.metadata)
         elif isinstance(split, Path) or isinstance(split, str):
-            self.split.load(Path(split), self.metadata)
+            self.split = PatientRatioSplit.load(Path(split), self.metadata)
         else:
             self.split = split
 
         # dynamically add methods to myself to retrieve subsets
         for phase in self.split._ratios:
 
-            def get_subset(transform: Optional[A.BaseCompose] = None):
+            # bind phase as default argument, closures would all see the last phase
+            def get_subset(
+                transform: Optional[A.BaseCompose] = None, phase: str = phase
+            ):
                 samples = self.split.samples[phase]
-                return KvasirCapsuleSubset(phase, self, samples, transform)
+                return KvasirCapsuleSubset(
+                    phase, self, samples, transform, self.image_cache
+                )
 
             setattr(self, phase, get_subset)
 
@@ -128,6 +149,109 @@ class KvasirCapsuleDataset:
             return False
         return True
 
+    def statistics(
+        self,
+        phase: str = "train",
+        num_workers: Optional[int] = None,
+        overwrite: bool = False,
+    ) -> DatasetStatistics:
+        """
+        Return normalization statistics and per-class colour histograms of a split
+        phase. Results are cached in KVASIR_CAPSULE_CACHE_PATH.
+
+        Use ``KvasirCapsuleDataset(transforms=dataset.statistics().transforms())``
+        or pass single pipelines to the subset getters to normalize with them.
+
+        :param phase: Split phase to compute statistics for, defaults to "train"
+        :type phase: str, optional
+        :param num_workers: Number of workers, defaults to the number of CPUs
+        :type num_workers: int, optional
+        :param overwrite: Recompute even if cached, defaults to False
+        :type overwrite: bool, optional
+        :return: Statistics of the phase
+        :rtype: DatasetStatistics
+        """
+        return load_statistics(
+            self.split.samples[phase], num_workers=num_workers, overwrite=overwrite
+        )
+
+    def prewarm(self, phase: str = "train", num_workers: Optional[int] = None):
+        """
+        Copy all images of a split phase to the local scratch directory in parallel.
+
+        :param phase: Split phase to prewarm, defaults to "train"
+        :type phase: str, optional
+        :param num_workers: Number of parallel copies, defaults to the number of CPUs
+        :type num_workers: int, optional
+        :raises RuntimeError: If no scratch directory is configured
+        """
+        storage = get_tiered_storage()
+        if storage is None:
+            raise RuntimeError(
+                "No tiered storage configured, set 'kvasir-capsule-scratch-path'."
+            )
+        storage.prewarm(
+            [sample.relative_path for sample in self.split.samples[phase]],
+            num_workers=num_workers,
+        )
+
+    def load_into_memory(self, shared: bool = False, num_workers: Optional[int] = None):
+        """
+        Read all encoded images into one in-memory arena, subsets created afterwards
+        decode from RAM instead of opening files.
+
+        :param shared: Allocate the arena in shared memory, defaults to False
+        :type shared: bool, optional
+        :param num_workers: Number of parallel reads, defaults to the number of CPUs
+        :type num_workers: int, optional
+        """
+        self.image_cache = EncodedImageArena(
+            self.metadata.samples, shared=shared, num_workers=num_workers
+        )
+
+    def rois(
+        self,
+        phase: str = "train",
+        transform: Optional[A.BaseCompose] = None,
+        margin: float = 0.5,
+        output_size: int = 128,
+        pad: float = 0.25,
+        jitter: float = 0.0,
+        scale_jitter: float = 0.0,
+        num_workers: Optional[int] = None,
+    ) -> KvasirCapsuleRoiDataset:
+        """
+        Return bbox-centred crops of the samples of a split phase that have a
+        bounding box, extracting them once into a RoiStore in KVASIR_CAPSULE_CACHE_PATH.
+
+        :param phase: Split phase, defaults to "train"
+        :type phase: str, optional
+        :param transform: Transform applied to every crop, defaults to None
+        :type transform: A.BaseCompose, optional
+        :param margin: Context around the bbox, see extract_rois(), defaults to 0.5
+        :type margin: float, optional
+        :param output_size: Edge length of crops in pixels, defaults to 128
+        :type output_size: int, optional
+        :param pad: Stored border for jitter, see extract_rois(), defaults to 0.25
+        :type pad: float, optional
+        :param jitter: Maximum crop shift, see KvasirCapsuleRoiDataset, defaults to 0.0
+        :type jitter: float, optional
+        :param scale_jitter: Maximum crop scale change, defaults to 0.0
+        :type scale_jitter: float, optional
+        :param num_workers: Number of extraction workers, defaults to the number of CPUs
+        :type num_workers: int, optional
+        :return: Crop dataset of the phase
+        :rtype: KvasirCapsuleRoiDataset
+        """
+        store = extract_rois(
+            self.split.samples[phase],
+            margin=margin,
+            output_size=output_size,
+            pad=pad,
+            num_workers=num_workers,
+        )
+        return KvasirCapsuleRoiDataset(store, transform, jitter, scale_jitter)
+
     def download(self, overwrite: bool = False):
         # TODO implement proper overwrite with user prompt
         if self.exists() and not overwrite:
@@ -6,7 +6,7 @@ import click
 import requests
 import tqdm
 
-from .config import KVASIR_CAPSULE_PATH
+from .config import KVASIR_CAPSULE_PATH, KVASIR_CAPSULE_VIDEO_PATH
 
 
 DOWNLOAD_URLS = {
@@ -15,6 +15,11 @@ DOWNLOAD_URLS = {
     "labelled_images.zip": "https://files.osf.io/v1/resources/dv2ag/providers/googledrive/labelled_images/?zip=",
 }
 
+# Not part of download_all(), the unlabelled videos are large
+VIDEO_DOWNLOAD_URLS = {
+    "unlabelled_videos.zip": "https://files.osf.io/v1/resources/dv2ag/providers/googledrive/unlabelled_videos/?zip=",
+}
+
 CHECKSUMS = {
     "metadata.json": "c8f2b076283be42485fdb0d5b486a1f5095ce87b5a69f8c8d394cbf05fc2ab4f",
     "metadata.csv": "480373e840c48d7cad45aede92bdc8fa5a7c0064e6b22470d38af9f2032642f5",
@@ -22,6 +27,7 @@ CHECKSUMS = {
     # zip has "last modified" time in header, which changes every time the zip is packed.
     # That's my explanation why the checksum changes with each download.
     "labelled_images.zip": None,
+    "unlabelled_videos.zip": None,
 }
 
 
@@ -71,7 +77,7 @@ def download_file(filename):
     :param filename: Filename on disk (not path!)
     :ptype filename: str
     """
-    url = DOWNLOAD_URLS[filename]
+    url = {**DOWNLOAD_URLS, **VIDEO_DOWNLOAD_URLS}[filename]
     destination = KVASIR_CAPSULE_PATH / filename
     click.secho(f"File: {filename}", fg="blue")
     click.secho(f"Downloading file from URL {url}...", fg="blue")
@@ -90,10 +96,10 @@ def download_file(filename):
     click.secho("")
 
 
-def extract_archive(filename):
+def extract_archive(filename, destination=KVASIR_CAPSULE_PATH):
     """ """
     click.secho(f"Extracting archive {filename}...", fg="blue")
-    shutil.unpack_archive(KVASIR_CAPSULE_PATH / filename, KVASIR_CAPSULE_PATH)
+    shutil.unpack_archive(KVASIR_CAPSULE_PATH / filename, destination)
     click.secho("Done.", fg="green")
 
 
@@ -112,8 +118,27 @@ def extract_images():
         os.remove(archive)
 
 
+def extract_videos():
+    """
+    Extract the unlabelled videos into KVASIR_CAPSULE_VIDEO_PATH.
+    """
+    filename = "unlabelled_videos.zip"
+    KVASIR_CAPSULE_VIDEO_PATH.mkdir(parents=True, exist_ok=True)
+    extract_archive(filename, KVASIR_CAPSULE_VIDEO_PATH)
+    os.remove(KVASIR_CAPSULE_PATH / filename)
+    # extract tar.gz archives inside of the zip
+    for archive in KVASIR_CAPSULE_VIDEO_PATH.glob("*.gz"):
+        extract_archive(archive, KVASIR_CAPSULE_VIDEO_PATH)
+        os.remove(archive)
+
 
 def download_all():
     for filename in DOWNLOAD_URLS:
         download_file(filename)
     extract_images()
+
+
+def download_unlabelled_videos():
+    for filename in VIDEO_DOWNLOAD_URLS:
+        download_file(filename)
+    extract_videos()
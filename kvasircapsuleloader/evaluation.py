@@ -0,0 +1,219 @@
+from typing import Dict, Literal, Optional, Sequence
+
+import numpy as np
+import torch
+
+from .sample import KvasirCapsuleSample
+from .types import CategoryByClass, FindingCategory, FindingClass
+
+
+def confusion_metrics(confusion: torch.Tensor, prefix: str = "") -> Dict[str, float]:
+    """
+    Derive micro, macro and weighted metrics from a confusion matrix.
+
+    Macro and weighted averages only include classes that occur in the targets,
+    consistent with torchmetrics' multiclass accuracy.
+
+    :param confusion: Matrix (C, C) with targets as rows and predictions as columns
+    :type confusion: torch.Tensor
+    :param prefix: Prefix for all metric names, defaults to ""
+    :type prefix: str, optional
+    :return: Metrics by name
+    :rtype: Dict[str, float]
+    """
+    confusion = confusion.double()
+    tp = confusion.diag()
+    support = confusion.sum(dim=1)
+    predicted = confusion.sum(dim=0)
+    total = support.sum().clamp(min=1)
+    present = support > 0
+    recall = tp / support.clamp(min=1)
+    precision = tp / predicted.clamp(min=1)
+    f1 = 2 * precision * recall / (precision + recall).clamp(min=1e-12)
+    weights = support / total
+    num_present = present.sum().clamp(min=1)
+    return {
+        f"{prefix}accuracy_micro": float(tp.sum() / total),
+        f"{prefix}accuracy_macro": float(recall[present].sum() / num_present),
+        f"{prefix}accuracy_weighted": float((recall * weights).sum()),
+        f"{prefix}precision_macro": float(precision[present].sum() / num_present),
+        f"{prefix}precision_weighted": float((precision * weights).sum()),
+        f"{prefix}f1_macro": float(f1[present].sum() / num_present),
+        f"{prefix}f1_weighted": float((f1 * weights).sum()),
+    }
+
+
+class Evaluator:
+    """
+    Streaming multiclass evaluation with frame-, category-, patient- and
+    finding-level aggregation.
+
+    Every batch updates a confusion matrix with one bincount. Class indices are
+    FindingClass values, so the frame confusion matrix is also reduced to a
+    FindingCategory (luminal vs. anatomy) confusion matrix. If the samples of the
+    evaluated subset are given, predictions are additionally aggregated per
+    (patient, finding class) group, i.e. per finding of a patient, by majority vote
+    or mean probability, and frame accuracy is accumulated per patient. All
+    aggregation uses index_add/bincount, there are no per-sample Python loops.
+    """
+
+    def __init__(
+        self,
+        num_classes: int,
+        samples: Optional[Sequence[KvasirCapsuleSample]] = None,
+        aggregation: Literal["majority", "mean"] = "majority",
+    ):
+        """
+        :param num_classes: Number of classes
+        :type num_classes: int
+        :param samples: Samples of the evaluated subset, e.g. KvasirCapsuleSubset.samples,
+            enables patient-level metrics, defaults to None
+        :type samples: Sequence[KvasirCapsuleSample], optional
+        :param aggregation: Aggregation of frame predictions per finding, majority vote
+            or mean probability, defaults to "majority"
+        :type aggregation: Literal["majority", "mean"], optional
+        """
+        self.num_classes = num_classes
+        self.aggregation = aggregation
+        self._category_of: Optional[torch.Tensor] = None
+        if num_classes <= len(FindingClass):
+            self._category_of = torch.tensor(
+                [CategoryByClass[FindingClass(c)].value for c in range(num_classes)]
+            )
+        self.patients: np.ndarray = np.array([])
+        if samples is not None:
+            self.patients, patient_of = np.unique(
+                [s.video_id for s in samples], return_inverse=True
+            )
+            labels = np.array([s.finding_class.value for s in samples], dtype=np.int64)
+            groups, group_of = np.unique(
+                patient_of * num_classes + labels, return_inverse=True
+            )
+            self._patient_of = torch.from_numpy(patient_of.astype(np.int64))
+            self._group_of = torch.from_numpy(group_of.astype(np.int64))
+            self._group_targets = torch.from_numpy(groups % num_classes)
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all accumulated state.
+        """
+        C = self.num_classes
+        self.confusion = torch.zeros((C, C), dtype=torch.int64)
+        self._pointer = 0
+        if len(self.patients) > 0:
+            num_groups = len(self._group_targets)
+            self._group_scores = torch.zeros((num_groups, C), dtype=torch.float64)
+            self._patient_correct = torch.zeros(len(self.patients), dtype=torch.int64)
+            self._patient_total = torch.zeros(len(self.patients), dtype=torch.int64)
+
+    def update(
+        self,
+        outputs: torch.Tensor,
+        targets: torch.Tensor,
+        indices: Optional[torch.Tensor] = None,
+    ):
+        """
+        Accumulate a batch.
+
+        :param outputs: Logits (B, C) or predicted class indices (B,)
+        :type outputs: torch.Tensor
+        :param targets: Target class indices (B,)
+        :type targets: torch.Tensor
+        :param indices: Subset indices of the batch samples, defaults to consecutive
+            indices, which matches a DataLoader without shuffling
+        :type indices: torch.Tensor, optional
+        """
+        outputs, targets = outputs.detach().cpu(), targets.detach().cpu().long()
+        predictions = outputs.argmax(dim=1) if outputs.dim() == 2 else outputs.long()
+        C = self.num_classes
+        self.confusion += torch.bincount(
+            targets * C + predictions, minlength=C * C
+        ).reshape(C, C)
+        if indices is None:
+            indices = torch.arange(self._pointer, self._pointer + len(targets))
+        self._pointer += len(targets)
+        if len(self.patients) == 0:
+            return
+        indices = indices.cpu().long()
+        if self.aggregation == "mean" and outputs.dim() == 2:
+            scores = outputs.double().softmax(dim=1)
+        else:
+            scores = torch.nn.functional.one_hot(predictions, C).double()
+        self._group_scores.index_add_(0, self._group_of[indices], scores)
+        patients = self._patient_of[indices]
+        self._patient_correct.index_add_(0, patients, (predictions == targets).long())
+        self._patient_total.index_add_(0, patients, torch.ones_like(patients))
+
+    def category_confusion(self) -> torch.Tensor:
+        """
+        Return the frame-level confusion matrix of finding categories, i.e. of
+        targets and predictions mapped to their FindingCategory.
+
+        :raises ValueError: If classes are not FindingClass values
+        :return: Matrix (2, 2) with targets as rows and predictions as columns,
+            indexed by FindingCategory value
+        :rtype: torch.Tensor
+        """
+        if self._category_of is None:
+            raise ValueError(
+                f"Category metrics require at most {len(FindingClass)} classes, "
+                f"got {self.num_classes}."
+            )
+        M = torch.nn.functional.one_hot(self._category_of, len(FindingCategory))
+        return M.T @ self.confusion @ M
+
+    def _check_patients(self):
+        if len(self.patients) == 0:
+            raise ValueError(
+                "Patient-level metrics require the samples of the evaluated subset."
+            )
+
+    def patient_confusion(self) -> torch.Tensor:
+        """
+        Return the confusion matrix of aggregated predictions per finding of a
+        patient, only including findings with at least one evaluated frame.
+
+        :raises ValueError: If the evaluator was created without samples
+        :return: Matrix (C, C) with targets as rows and predictions as columns
+        :rtype: torch.Tensor
+        """
+        self._check_patients()
+        C = self.num_classes
+        seen = self._group_scores.sum(dim=1) > 0
+        predictions = self._group_scores[seen].argmax(dim=1)
+        targets = self._group_targets[seen]
+        return torch.bincount(targets * C + predictions, minlength=C * C).reshape(C, C)
+
+    def patient_accuracies(self) -> Dict[str, float]:
+        """
+        Return frame-level accuracy per patient (video ID).
+
+        :raises ValueError: If the evaluator was created without samples
+        :return: Accuracy by video ID, for patients with evaluated frames
+        :rtype: Dict[str, float]
+        """
+        self._check_patients()
+        seen = self._patient_total > 0
+        accuracies = self._patient_correct[seen].double() / self._patient_total[seen]
+        return dict(zip(self.patients[seen.numpy()].tolist(), accuracies.tolist()))
+
+    def compute(self) -> Dict[str, float]:
+        """
+        Return frame-level metrics, frame-level metrics of finding categories
+        (prefixed "category_") and, if samples were given, finding-level metrics
+        (prefixed "patient_") and the mean per-patient frame accuracy.
+
+        :return: Metrics by name
+        :rtype: Dict[str, float]
+        """
+        metrics = confusion_metrics(self.confusion)
+        if self._category_of is not None:
+            metrics.update(confusion_metrics(self.category_confusion(), "category_"))
+        if len(self.patients) > 0:
+            metrics.update(confusion_metrics(self.patient_confusion(), "patient_"))
+            accuracies = list(self.patient_accuracies().values())
+            metrics["patient_mean_frame_accuracy"] = (
+                float(np.mean(accuracies)) if accuracies else 0.0
+            )
+        return metrics
@@ -0,0 +1,249 @@
+import json
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import albumentations as A  # type: ignore[import-untyped]
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset
+from tqdm import tqdm
+
+from .config import KVASIR_CAPSULE_CACHE_PATH
+from .dataset import KvasirCapsuleSubset
+from .utils import hash_strings, publish_directory
+
+
+class FeatureStore:
+    """
+    On-disk store of frozen-backbone embeddings for the samples of one subset.
+
+    A store is a directory with a memory-mapped float16 feature matrix
+    (features.f16, one row per sample), int64 labels, video IDs and a meta.json.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: Directory of an existing store
+        :type path: Path
+        :raises FileNotFoundError: If the store is incomplete
+        """
+        if not (path / "meta.json").is_file():
+            raise FileNotFoundError(f"No feature store in {path}.")
+        self.path = path
+        with open(path / "meta.json", "r") as f:
+            self.meta = json.load(f)
+        self.features = np.memmap(
+            path / "features.f16",
+            dtype=np.float16,
+            mode="r",
+            shape=(self.meta["num_samples"], self.meta["dim"]),
+        )
+        self.labels = np.load(path / "labels.npy")
+        self.video_ids = np.load(path / "video_ids.npy")
+
+    def __len__(self) -> int:
+        return self.meta["num_samples"]
+
+    @property
+    def dim(self) -> int:
+        return self.meta["dim"]
+
+
+def feature_store_path(
+    model_name: str, transform: Optional[A.BaseCompose], subset: KvasirCapsuleSubset
+) -> Path:
+    """
+    Return the store directory for a model, transform and subset.
+
+    The key hashes the transform's repr and the ordered filenames of the subset, so
+    a store is reused only for exactly the same inputs.
+
+    :param model_name: Name of the model, e.g. the timm model name
+    :type model_name: str
+    :param transform: Transform applied before the model
+    :type transform: A.BaseCompose, optional
+    :param subset: Subset the features are extracted for
+    :type subset: KvasirCapsuleSubset
+    :return: Directory of the feature store
+    :rtype: Path
+    """
+    transform_key = hash_strings([repr(transform)])[:16]
+    split_key = hash_strings(sample.filename for sample in subset.samples)[:16]
+    return (
+        KVASIR_CAPSULE_CACHE_PATH
+        / "features"
+        / model_name.replace("/", "_")
+        / f"{subset.phase}_{transform_key}_{split_key}"
+    )
+
+
+def _collate_images(batch: List[Tuple]) -> torch.Tensor:
+    return torch.stack([torch.as_tensor(image) for image, _, _ in batch])
+
+
+def extract_features(
+    model: nn.Module,
+    model_name: str,
+    subset: KvasirCapsuleSubset,
+    transform: Optional[A.BaseCompose] = None,
+    batch_size: int = 64,
+    num_workers: int = 0,
+    device: Optional[torch.device] = None,
+    overwrite: bool = False,
+) -> FeatureStore:
+    """
+    Run a frozen model once over a subset and store its embeddings, or return the
+    existing store for the same model, transform and subset.
+
+    The model must return one embedding per image, e.g.
+    ``timm.create_model(model_name, pretrained=True, num_classes=0)``. It runs in
+    eval mode on device; its training modes and device are restored afterwards.
+
+    :param model: Feature extractor
+    :type model: nn.Module
+    :param model_name: Name of the model, part of the store key
+    :type model_name: str
+    :param subset: Subset to extract features for
+    :type subset: KvasirCapsuleSubset
+    :param transform: Deterministic transform, defaults to the dataset's "val"
+        transform (augmented features should not be cached)
+    :type transform: A.BaseCompose, optional
+    :param batch_size: Batch size, defaults to 64
+    :type batch_size: int, optional
+    :param num_workers: DataLoader workers, defaults to 0
+    :type num_workers: int, optional
+    :param device: Device to run the model on, defaults to cuda if available
+    :type device: torch.device, optional
+    :param overwrite: Extract again even if the store exists, defaults to False
+    :type overwrite: bool, optional
+    :return: Feature store of the subset
+    :rtype: FeatureStore
+    """
+    if transform is None:
+        transform = subset.parent.transforms.get("val")
+    path = feature_store_path(model_name, transform, subset)
+    if (path / "meta.json").is_file() and not overwrite:
+        return FeatureStore(path)
+    if device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    view = KvasirCapsuleSubset(
+        subset.phase, subset.parent, subset.samples, transform, subset.image_cache
+    )
+    dataloader = DataLoader(
+        view,
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+        collate_fn=_collate_images,
+    )
+    # restore the caller's model afterwards, e.g. when extracting during training
+    training = [module.training for module in model.modules()]
+    parameter = next(model.parameters(), None)
+    model_device = None if parameter is None else parameter.device
+    model.to(device).eval()
+    try:
+        with publish_directory(path, overwrite=overwrite) as tmp_path:
+            features: Optional[np.memmap] = None
+            pointer = 0
+            with torch.no_grad():
+                for images in tqdm(dataloader, desc=f"Extracting {model_name}"):
+                    embeddings = model(images.to(device)).flatten(1).cpu().numpy()
+                    if features is None:
+                        features = np.memmap(
+                            tmp_path / "features.f16",
+                            dtype=np.float16,
+                            mode="w+",
+                            shape=(len(view), embeddings.shape[1]),
+                        )
+                    features[pointer : pointer + len(embeddings)] = embeddings
+                    pointer += len(embeddings)
+            if features is None:
+                raise ValueError("Cannot extract features of an empty subset.")
+            features.flush()
+            np.save(
+                tmp_path / "labels.npy",
+                np.array([s.finding_class.value for s in view.samples], dtype=np.int64),
+            )
+            np.save(
+                tmp_path / "video_ids.npy", np.array([s.video_id for s in view.samples])
+            )
+            with open(tmp_path / "meta.json", "w") as f:
+                json.dump(
+                    {
+                        "model_name": model_name,
+                        "phase": subset.phase,
+                        "transform": repr(transform),
+                        "num_samples": len(view),
+                        "dim": int(features.shape[1]),
+                    },
+                    f,
+                )
+    finally:
+        if model_device is not None:
+            model.to(model_device)
+        for module, mode in zip(model.modules(), training):
+            module.training = mode
+    return FeatureStore(path)
+
+
+class KvasirCapsuleFeatureDataset(Dataset):
+    """
+    Dataset of precomputed (feature, label, video_id) rows from a FeatureStore,
+    for training classification heads without decoding images.
+    """
+
+    def __init__(self, store: FeatureStore, in_memory: bool = False):
+        """
+        :param store: Feature store to serve
+        :type store: FeatureStore
+        :param in_memory: Load the whole feature matrix into RAM as float32,
+            defaults to False
+        :type in_memory: bool, optional
+        """
+        self.store = store
+        self.features = (
+            np.asarray(store.features, dtype=np.float32)
+            if in_memory
+            else store.features
+        )
+        self.labels = store.labels
+        self.video_ids = store.video_ids
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __getitem__(self, index) -> Tuple[torch.Tensor, int, str]:
+        feature = torch.from_numpy(np.asarray(self.features[index], dtype=np.float32))
+        return feature, int(self.labels[index]), str(self.video_ids[index])
+
+    def iter_batches(
+        self, batch_size: int, shuffle: bool = True, seed: Optional[int] = None
+    ) -> Iterator[Tuple[torch.Tensor, torch.Tensor, np.ndarray]]:
+        """
+        Iterate over batches by slicing the feature matrix directly, which avoids
+        per-row indexing and collation of a DataLoader.
+
+        :param batch_size: Batch size
+        :type batch_size: int
+        :param shuffle: Whether to shuffle rows, defaults to True
+        :type shuffle: bool, optional
+        :param seed: Random seed for shuffling, defaults to None
+        :type seed: int, optional
+        :return: Iterator over (features, labels, video_ids) batches
+        :rtype: Iterator[Tuple[torch.Tensor, torch.Tensor, np.ndarray]]
+        """
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else None
+        for start in range(0, len(self), batch_size):
+            # contiguous slices of the memmap are plain sequential reads
+            idx = (
+                slice(start, start + batch_size)
+                if order is None
+                else order[start : start + batch_size]
+            )
+            yield (
+                torch.from_numpy(np.asarray(self.features[idx], dtype=np.float32)),
+                torch.from_numpy(self.labels[idx]),
+                self.video_ids[idx],
+            )
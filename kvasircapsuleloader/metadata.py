@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 
 import pandas as pd
 import numpy as np
@@ -8,6 +8,7 @@ from .bbox import BoundingBox
 from .config import KVASIR_CAPSULE_PATH
 from .sample import KvasirCapsuleSample
 from .types import FindingClass, str_to_findingcategory, str_to_findingclass
+from .utils import hash_strings
 
 
 class KvasirCapsuleMetadata:
@@ -19,6 +20,8 @@ class KvasirCapsuleMetadata:
         self._data = pd.read_csv(KVASIR_CAPSULE_PATH / "metadata.csv", delimiter=";")
         self.video_ids = self._data.video_id
         self.samples: List[KvasirCapsuleSample] = []
+        self._index_by_filename: Dict[str, int] = {}
+        self._content_hash: Optional[str] = None
         self._load_samples()
 
     def _load_samples(self):
@@ -61,6 +64,40 @@ class KvasirCapsuleMetadata:
         # TODO cache
         return {sample.filename: sample for sample in self.samples}
 
+    def indices(self, samples: Iterable[KvasirCapsuleSample]) -> np.ndarray:
+        """
+        Return the row indices of samples in this metadata table.
+
+        :param samples: Samples of this metadata table
+        :type samples: Iterable[KvasirCapsuleSample]
+        :return: Int64 array of row indices into self.samples
+        :rtype: np.ndarray
+        """
+        if len(self._index_by_filename) != len(self.samples):
+            self._index_by_filename = {
+                sample.filename: i for i, sample in enumerate(self.samples)
+            }
+        return np.fromiter(
+            (self._index_by_filename[sample.filename] for sample in samples),
+            dtype=np.int64,
+        )
+
+    def content_hash(self) -> str:
+        """
+        Return a hash of filename, video ID and finding class of all rows, in order.
+        Split definitions store it to detect that row indices refer to a different
+        metadata table.
+
+        :return: SHA256 hex digest
+        :rtype: str
+        """
+        if self._content_hash is None:
+            self._content_hash = hash_strings(
+                f"{s.filename}|{s.video_id}|{s.finding_class.name}"
+                for s in self.samples
+            )
+        return self._content_hash
+
     def samples_by_class_by_patient(
         self,
     ) -> Dict[FindingClass, Dict[str, List[KvasirCapsuleSample]]]:
@@ -0,0 +1,296 @@
+import json
+import math
+from pathlib import Path
+from typing import Any, Optional, Sequence, Tuple
+
+import albumentations as A  # type: ignore[import-untyped]
+import cv2
+import numpy as np
+from PIL import Image
+from torch.utils.data import Dataset
+
+from .config import KVASIR_CAPSULE_CACHE_PATH
+from .sample import KvasirCapsuleSample
+from .utils import hash_strings, parallel_map, publish_directory
+
+
+class RoiStore:
+    """
+    On-disk store of bbox-centred crops, one row per sample with a bounding box.
+
+    Every row is a square region of stored_size pixels around the bbox centre: the
+    context square (bbox plus margin) resampled to output_size, surrounded by a
+    border of pad * output_size pixels that leaves room for jittered re-cropping.
+    A store is a directory with a memory-mapped uint8 array (crops.u8), the bboxes
+    in YOLO format relative to the stored region (bboxes.npy), labels and a
+    meta.json with the parameters and sample filenames.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: Directory of an existing store
+        :type path: Path
+        :raises FileNotFoundError: If the store is incomplete
+        """
+        if not (path / "meta.json").is_file():
+            raise FileNotFoundError(f"No ROI store in {path}.")
+        self.path = path
+        with open(path / "meta.json", "r") as f:
+            self.meta = json.load(f)
+        shape = (len(self.meta["filenames"]), self.stored_size, self.stored_size, 3)
+        self.crops = (
+            np.memmap(path / "crops.u8", dtype=np.uint8, mode="r", shape=shape)
+            if shape[0] > 0
+            else np.zeros(shape, dtype=np.uint8)
+        )
+        self.bboxes = np.load(path / "bboxes.npy")
+        self.labels = np.load(path / "labels.npy")
+        self._index = {filename: i for i, filename in enumerate(self.meta["filenames"])}
+
+    def __len__(self) -> int:
+        return len(self.meta["filenames"])
+
+    def __contains__(self, sample: KvasirCapsuleSample) -> bool:
+        return sample.filename in self._index
+
+    @property
+    def output_size(self) -> int:
+        return self.meta["output_size"]
+
+    @property
+    def stored_size(self) -> int:
+        return self.meta["stored_size"]
+
+    def index(self, sample: KvasirCapsuleSample) -> int:
+        """
+        Return the row of a sample.
+
+        :param sample: Sample with a bounding box covered by this store
+        :type sample: KvasirCapsuleSample
+        :return: Row index into crops, bboxes and labels
+        :rtype: int
+        """
+        return self._index[sample.filename]
+
+
+def _stored_size(output_size: int, pad: float) -> int:
+    return output_size + 2 * int(math.ceil(pad * output_size))
+
+
+def _extract_roi(
+    sample: KvasirCapsuleSample, margin: float, output_size: int, stored_size: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Crop the padded region around the bbox of a sample, pixels outside the frame
+    are black. Return the region and the bbox in YOLO format relative to it.
+    """
+    assert sample.bbox is not None
+    image = sample.open_image().convert("RGB")
+    sx, sy = image.width / sample.bbox.norm_x, image.height / sample.bbox.norm_y
+    x0, y0, x1, y1 = sample.bbox.to_pascal_voc() * np.array([sx, sy, sx, sy])
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    context = max(x1 - x0, y1 - y0, 1.0) * (1 + 2 * margin)
+    half = context * stored_size / output_size / 2
+    left, top = int(round(cx - half)), int(round(cy - half))
+    side = max(int(round(2 * half)), 1)
+    region = image.crop((left, top, left + side, top + side)).resize(
+        (stored_size, stored_size), Image.Resampling.BILINEAR
+    )
+    bbox = np.array(
+        [(cx - left) / side, (cy - top) / side, (x1 - x0) / side, (y1 - y0) / side],
+        dtype=np.float32,
+    )
+    return np.asarray(region, dtype=np.uint8), bbox
+
+
+def roi_store_path(
+    samples: Sequence[KvasirCapsuleSample], margin: float, output_size: int, pad: float
+) -> Path:
+    """
+    Return the store directory for samples and crop parameters.
+
+    :param samples: Samples with bounding boxes, in store order
+    :type samples: Sequence[KvasirCapsuleSample]
+    :param margin: Context margin
+    :type margin: float
+    :param output_size: Edge length of served crops in pixels
+    :type output_size: int
+    :param pad: Stored border for jitter
+    :type pad: float
+    :return: Directory of the ROI store
+    :rtype: Path
+    """
+    key = hash_strings(
+        [f"{margin}|{output_size}|{pad}"] + [sample.filename for sample in samples]
+    )
+    return KVASIR_CAPSULE_CACHE_PATH / "rois" / key[:16]
+
+
+def extract_rois(
+    samples: Sequence[KvasirCapsuleSample],
+    margin: float = 0.5,
+    output_size: int = 128,
+    pad: float = 0.25,
+    num_workers: Optional[int] = None,
+    overwrite: bool = False,
+) -> RoiStore:
+    """
+    Crop the bbox regions of all samples with a bounding box once, in parallel, or
+    return the existing store for the same samples and parameters.
+
+    :param samples: Samples to extract, samples without bbox are skipped
+    :type samples: Sequence[KvasirCapsuleSample]
+    :param margin: Context around the bbox on every side, relative to its longer
+        edge, defaults to 0.5
+    :type margin: float, optional
+    :param output_size: Edge length of served crops in pixels, defaults to 128
+    :type output_size: int, optional
+    :param pad: Additional stored border on every side for jittered re-cropping,
+        relative to output_size, defaults to 0.25
+    :type pad: float, optional
+    :param num_workers: Number of workers, defaults to the number of CPUs
+    :type num_workers: int, optional
+    :param overwrite: Extract again even if the store exists, defaults to False
+    :type overwrite: bool, optional
+    :return: ROI store of the samples with bounding boxes
+    :rtype: RoiStore
+    """
+    samples = [sample for sample in samples if sample.bbox is not None]
+    path = roi_store_path(samples, margin, output_size, pad)
+    if (path / "meta.json").is_file() and not overwrite:
+        return RoiStore(path)
+    stored_size = _stored_size(output_size, pad)
+
+    with publish_directory(path, overwrite=overwrite) as tmp_path:
+        crops = np.memmap(
+            tmp_path / "crops.u8",
+            dtype=np.uint8,
+            mode="w+",
+            shape=(max(len(samples), 1), stored_size, stored_size, 3),
+        )
+        bboxes = np.zeros((len(samples), 4), dtype=np.float32)
+
+        def extract(i: int):
+            crops[i], bboxes[i] = _extract_roi(
+                samples[i], margin, output_size, stored_size
+            )
+
+        parallel_map(
+            extract,
+            range(len(samples)),
+            num_workers=num_workers,
+            desc="Extracting ROIs",
+        )
+        crops.flush()
+        np.save(tmp_path / "bboxes.npy", bboxes)
+        np.save(
+            tmp_path / "labels.npy",
+            np.array([s.finding_class.value for s in samples], dtype=np.int64),
+        )
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump(
+                {
+                    "margin": margin,
+                    "output_size": output_size,
+                    "pad": pad,
+                    "stored_size": stored_size,
+                    "filenames": [s.filename for s in samples],
+                },
+                f,
+            )
+    return RoiStore(path)
+
+
+class KvasirCapsuleRoiDataset(Dataset):
+    """
+    Dataset of bbox-centred crops from a RoiStore, for lesion-level training
+    without decoding full frames.
+
+    Items are (image, bboxes, label) like KvasirCapsuleSubset, with a float32 crop
+    in [0, 1] of output_size pixels and the bbox in YOLO format relative to the
+    crop. Without jitter the centre crop of the stored region is served. With
+    jitter, the crop window is shifted and scaled randomly within the stored
+    border and resampled to output_size.
+    """
+
+    def __init__(
+        self,
+        store: RoiStore,
+        transform: Optional[A.BaseCompose] = None,
+        jitter: float = 0.0,
+        scale_jitter: float = 0.0,
+    ):
+        """
+        :param store: ROI store to serve
+        :type store: RoiStore
+        :param transform: Transform applied to every crop, defaults to None
+        :type transform: A.BaseCompose, optional
+        :param jitter: Maximum shift of the crop centre relative to output_size,
+            limited by the stored border, defaults to 0.0
+        :type jitter: float, optional
+        :param scale_jitter: Maximum relative change of the crop window size,
+            defaults to 0.0
+        :type scale_jitter: float, optional
+        """
+        self.store = store
+        self.transform = transform
+        self.jitter = jitter
+        self.scale_jitter = scale_jitter
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __getitem__(self, index) -> Any:
+        S, o = self.store.stored_size, self.store.output_size
+        region = self.store.crops[index]
+        size = o
+        if self.scale_jitter > 0:
+            factor = np.exp(
+                np.random.uniform(
+                    np.log1p(-self.scale_jitter), np.log1p(self.scale_jitter)
+                )
+            )
+            size = int(np.clip(round(o * factor), 1, S))
+        max_shift = min(self.jitter * o, (S - size) / 2)
+        dx, dy = (
+            np.random.uniform(-max_shift, max_shift, size=2)
+            if max_shift > 0
+            else (0, 0)
+        )
+        x0 = int(round((S - size) / 2 + dx))
+        y0 = int(round((S - size) / 2 + dy))
+        crop = region[y0 : y0 + size, x0 : x0 + size]
+        if size != o:
+            crop = cv2.resize(
+                np.ascontiguousarray(crop), (o, o), interpolation=cv2.INTER_LINEAR
+            )
+        image = crop.astype(np.float32) / np.float32(255.0)
+
+        # bbox relative to the crop window, clipped to it
+        cx, cy, w, h = self.store.bboxes[index] * S
+        box = np.clip(
+            np.array(
+                [cx - w / 2 - x0, cy - h / 2 - y0, cx + w / 2 - x0, cy + h / 2 - y0]
+            )
+            / size,
+            0.0,
+            1.0,
+        )
+        bboxes = [
+            np.array(
+                [
+                    (box[0] + box[2]) / 2,
+                    (box[1] + box[3]) / 2,
+                    box[2] - box[0],
+                    box[3] - box[1],
+                ],
+                dtype=np.float32,
+            )
+        ]
+        class_labels = int(self.store.labels[index])
+        if self.transform is not None:
+            augmented = self.transform(
+                image=image, bboxes=bboxes, class_labels=class_labels
+            )
+            return augmented["image"], augmented["bboxes"], augmented["class_labels"]
+        return image, bboxes, class_labels
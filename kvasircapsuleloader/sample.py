@@ -1,3 +1,5 @@
+import io
+from pathlib import Path
 from typing import Optional
 
 import numpy as np
@@ -5,6 +7,7 @@ from PIL import Image
 
 from .bbox import BoundingBox
 from .config import KVASIR_CAPSULE_PATH
+from .storage import get_tiered_storage
 from .types import FindingCategory, FindingClass, findingclass_to_dirname
 
 
@@ -29,18 +32,94 @@ class KvasirCapsuleSample:
         self.finding_class = finding_class
         self.bbox = bbox
 
-    def load_image(self) -> np.ndarray:
+    @property
+    def relative_path(self) -> Path:
+        """
+        Path of the image file relative to the KvasirCapsule root directory.
+
+        :return: Relative path to the JPEG file
+        :rtype: Path
+        """
+        return Path(findingclass_to_dirname(self.finding_class)) / self.filename
+
+    @property
+    def image_path(self) -> Path:
+        """
+        Path of the image file inside the KvasirCapsule directory structure.
+
+        :return: Absolute path to the JPEG file
+        :rtype: Path
+        """
+        return KVASIR_CAPSULE_PATH / self.relative_path
+
+    def local_path(self) -> Path:
+        """
+        Path to read the image from, inside the tiered storage if configured.
+
+        :return: Absolute path to the JPEG file
+        :rtype: Path
+        """
+        storage = get_tiered_storage()
+        if storage is None:
+            return self.image_path
+        return storage.resolve(self.relative_path)
+
+    def open_file(self) -> io.BufferedReader:
+        """
+        Open the encoded image file for binary reading, through the tiered storage
+        if configured.
+
+        :return: File object
+        :rtype: io.BufferedReader
+        """
+        storage = get_tiered_storage()
+        if storage is None:
+            return open(self.image_path, "rb")
+        return storage.open_file(self.relative_path)
+
+    def open_image(self) -> Image.Image:
+        """
+        Open the image file lazily, reading through the tiered storage if configured.
+
+        :return: PIL image, not yet decoded
+        :rtype: Image.Image
+        """
+        storage = get_tiered_storage()
+        if storage is None:
+            return Image.open(self.image_path)
+        try:
+            return Image.open(storage.resolve(self.relative_path))
+        except FileNotFoundError:
+            # evicted by another process between resolve() and opening, fill again
+            return Image.open(storage.fill(self.relative_path))
+
+    def load_image(self, scale: bool = True) -> np.ndarray:
         """
         Load and return the image as numpy array in RGB format.
 
-        :return: Float32 numpy array of dimension (336, 336, 3)
+        :param scale: Whether to scale to float32 in [0, 1], otherwise the raw uint8
+            pixels are returned, defaults to True
+        :type scale: bool, optional
+        :return: Float32 (or uint8) numpy array of dimension (336, 336, 3)
         :rtype: np.ndarray
         """
-        image_path = (
-            KVASIR_CAPSULE_PATH
-            / findingclass_to_dirname(self.finding_class)
-            / self.filename
-        )
-        image = Image.open(image_path).convert("RGB")
-        image_arr = np.asarray(image, dtype=np.float32) / 255.0
-        return image_arr
+        return image_to_array(self.open_image(), scale)
+
+
+def image_to_array(image: Image.Image, scale: bool = True) -> np.ndarray:
+    """
+    Decode a PIL image to a numpy array in RGB format.
+
+    :param image: PIL image
+    :type image: Image.Image
+    :param scale: Whether to scale to float32 in [0, 1], otherwise the raw uint8
+        pixels are returned, defaults to True
+    :type scale: bool, optional
+    :return: Float32 (or uint8) numpy array of dimension (H, W, 3)
+    :rtype: np.ndarray
+    """
+    image = image.convert("RGB")
+    if not scale:
+        return np.asarray(image, dtype=np.uint8)
+    image_arr = np.asarray(image, dtype=np.float32) / 255.0
+    return image_arr
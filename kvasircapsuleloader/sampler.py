@@ -0,0 +1,422 @@
+import math
+from collections import deque
+from typing import Deque, Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+from .config import DEFAULT_RANDOM_SEED
+from .sample import KvasirCapsuleSample
+
+
+class PatientBlockDistributedSampler(Sampler[int]):
+    """
+    Distributed sampler that assigns every rank a stable, contiguous block of samples.
+
+    Samples are ordered by video_id (patient) and frame number and cut into
+    num_replicas contiguous blocks of equal size, so a rank reads few patients. Cuts
+    are not moved to patient boundaries, a patient whose samples straddle a cut is
+    read by two ranks. Ranks with a shorter block are padded by repeating samples
+    of their own block. A rank reads the same files in every epoch, which keeps the local
+    page cache warm, and only the order inside the block is reshuffled per epoch.
+
+    Like torch.utils.data.DistributedSampler, set_epoch() must be called at the
+    beginning of every epoch to obtain a different order.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
+        shuffle: bool = True,
+        seed: int = DEFAULT_RANDOM_SEED,
+        drop_last: bool = False,
+        balance_classes: bool = False,
+    ):
+        """
+        :param dataset: Dataset with a samples attribute, e.g. KvasirCapsuleSubset
+        :type dataset: KvasirCapsuleSubset
+        :param num_replicas: Number of processes, defaults to the world size
+        :type num_replicas: int, optional
+        :param rank: Rank of the current process, defaults to the global rank
+        :type rank: int, optional
+        :param shuffle: Whether to shuffle inside the block, defaults to True
+        :type shuffle: bool, optional
+        :param seed: Random seed shared by all ranks, defaults to DEFAULT_RANDOM_SEED
+        :type seed: int, optional
+        :param drop_last: Drop the remainder instead of padding every rank to the same
+            length with samples of its own block, defaults to False
+        :type drop_last: bool, optional
+        :param balance_classes: Draw samples inside the block with replacement,
+            weighted by inverse class frequency in the block, defaults to False
+        :type balance_classes: bool, optional
+        :raises ValueError: If rank is not in [0, num_replicas) or the dataset has
+            fewer samples than replicas
+        """
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_initialized() else 0
+        if rank < 0 or rank >= num_replicas:
+            raise ValueError(
+                f"Invalid rank {rank}, rank should be in the interval [0, {num_replicas - 1}]"
+            )
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_last = drop_last
+        self.balance_classes = balance_classes
+        self.epoch = 0
+
+        samples: List[KvasirCapsuleSample] = dataset.samples
+        N = len(samples)
+        if N < num_replicas:
+            raise ValueError(
+                f"Cannot split {N} samples into blocks for {num_replicas} replicas, "
+                "every rank needs at least one sample."
+            )
+        if drop_last:
+            self.num_samples = N // num_replicas
+        else:
+            self.num_samples = math.ceil(N / num_replicas)
+        self.block = self._make_block(samples)
+        self._block_video_ids = {samples[i].video_id for i in self.block}
+        # padding repeats samples, weight every sample of the block once
+        own = self.block[: self._block_length]
+        labels = np.array([samples[i].finding_class.value for i in own])
+        _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+        weights = np.zeros(len(self.block))
+        weights[: len(own)] = 1.0 / counts[inverse]
+        self._weights = torch.as_tensor(weights, dtype=torch.double)
+
+    def _make_block(self, samples: List[KvasirCapsuleSample]) -> np.ndarray:
+        """
+        Return the dataset indices that belong to this rank.
+        """
+        order = sorted(
+            range(len(samples)),
+            key=lambda i: (samples[i].video_id, samples[i].frame_id, i),
+        )
+        # first (N mod num_replicas) ranks get one sample more than the others
+        base, remainder = divmod(len(samples), self.num_replicas)
+        start = self.rank * base + min(self.rank, remainder)
+        length = base + (1 if self.rank < remainder else 0)
+        block = np.array(order[start : start + length], dtype=np.int64)
+        self._block_length = min(length, self.num_samples)
+        if self.drop_last:
+            return block[: self.num_samples]
+        if len(block) < self.num_samples:
+            # pad with samples of the own block to stay rank-local
+            block = np.resize(block, self.num_samples)
+        return block
+
+    def video_ids(self) -> List[str]:
+        """
+        Return the sorted video IDs (patients) that are read by this rank.
+
+        :return: Video IDs in this rank's block
+        :rtype: List[str]
+        """
+        return sorted(self._block_video_ids)
+
+    def __iter__(self) -> Iterator[int]:
+        # distinct seed per (epoch, rank), identical on every run
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch * self.num_replicas + self.rank)
+        if self.balance_classes:
+            positions = torch.multinomial(
+                self._weights, self.num_samples, replacement=True, generator=g
+            )
+        elif self.shuffle:
+            positions = torch.randperm(len(self.block), generator=g)
+        else:
+            positions = torch.arange(len(self.block))
+        return iter(self.block[positions.numpy()].tolist())
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    def set_epoch(self, epoch: int):
+        """
+        Set the epoch for this sampler, which determines the order inside the block.
+
+        :param epoch: Epoch number
+        :type epoch: int
+        """
+        self.epoch = epoch
+
+
+class SumTree:
+    """
+    Array-based binary sum tree over n non-negative priorities.
+
+    Leaves hold the priorities, every inner node the sum of its children, so
+    proportional sampling and priority updates take O(log n). Both are vectorized
+    over batches: updates recompute only the affected parents level by level and
+    sampling descends the tree for all query values at once.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: Number of leaves
+        :type capacity: int
+        """
+        self.capacity = capacity
+        self._leaf_offset = 1 << max(capacity - 1, 0).bit_length()
+        self._depth = self._leaf_offset.bit_length() - 1
+        # node 1 is the root, children of node i are 2i and 2i + 1
+        self._tree = np.zeros(2 * self._leaf_offset, dtype=np.float64)
+
+    @property
+    def total(self) -> float:
+        return float(self._tree[1])
+
+    def priorities(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Return leaf priorities.
+
+        :param indices: Leaf indices, defaults to all leaves
+        :type indices: np.ndarray, optional
+        :return: Priorities
+        :rtype: np.ndarray
+        """
+        leaves = self._tree[self._leaf_offset : self._leaf_offset + self.capacity]
+        return leaves.copy() if indices is None else leaves[indices]
+
+    def min(self) -> float:
+        """
+        Return the smallest leaf priority.
+
+        :return: Minimum priority
+        :rtype: float
+        """
+        return float(
+            self._tree[self._leaf_offset : self._leaf_offset + self.capacity].min()
+        )
+
+    def update(self, indices: np.ndarray, priorities: np.ndarray):
+        """
+        Set priorities of leaves and update all affected inner nodes.
+
+        :param indices: Leaf indices; for duplicates the last priority wins
+        :type indices: np.ndarray
+        :param priorities: Non-negative priorities
+        :type priorities: np.ndarray
+        """
+        nodes = np.asarray(indices, dtype=np.int64) + self._leaf_offset
+        self._tree[nodes] = priorities
+        nodes = np.unique(nodes)
+        for _ in range(self._depth):
+            nodes = np.unique(nodes >> 1)
+            self._tree[nodes] = self._tree[2 * nodes] + self._tree[2 * nodes + 1]
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """
+        Return the leaves whose prefix-sum interval contains each value.
+
+        :param values: Values in [0, total)
+        :type values: np.ndarray
+        :return: Leaf indices
+        :rtype: np.ndarray
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self._depth):
+            left = 2 * nodes
+            left_sum = self._tree[left]
+            go_right = values >= left_sum
+            values -= np.where(go_right, left_sum, 0.0)
+            nodes = left + go_right
+        # guard against rounding at the right edge landing on an empty leaf
+        return np.minimum(nodes - self._leaf_offset, self.capacity - 1)
+
+    def sample(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        Draw n leaves with probability proportional to their priority, using
+        stratified values so that a batch covers the whole priority mass.
+
+        :param n: Number of samples
+        :type n: int
+        :param rng: Random number generator
+        :type rng: np.random.Generator
+        :return: Leaf indices
+        :rtype: np.ndarray
+        """
+        segment = self.total / n
+        values = (np.arange(n) + rng.random(n)) * segment
+        return self.find(values)
+
+
+class PrioritySampler(Sampler[List[int]]):
+    """
+    Batch sampler for online hard-example mining with prioritized sampling.
+
+    Samples are drawn proportionally to priority (|loss| + eps) ** alpha from a
+    SumTree. A fraction of every batch is drawn uniformly per class so that every
+    class keeps at least min_class_probability of the sampling mass. Importance
+    weights correct for the non-uniform sampling; their exponent beta is annealed
+    from beta to 1 over anneal_steps priority updates.
+
+    Use it as ``DataLoader(subset, batch_sampler=sampler)``. Batches are drawn
+    lazily, so priority updates take effect on batches that have not been
+    prefetched yet. The sampler runs in the main process, therefore it works with
+    any number of workers. pop_batch() returns the indices and importance weights
+    of the oldest batch that has been handed to the DataLoader::
+
+        for images, _, labels in dataloader:
+            indices, weights = sampler.pop_batch()
+            losses = criterion(model(images), labels)  # reduction="none"
+            (losses * weights).mean().backward()
+            sampler.update(indices, losses.detach())
+    """
+
+    def __init__(
+        self,
+        dataset,
+        batch_size: int,
+        num_samples: Optional[int] = None,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        anneal_steps: int = 10000,
+        min_class_probability: float = 0.0,
+        eps: float = 1e-3,
+        seed: int = DEFAULT_RANDOM_SEED,
+    ):
+        """
+        :param dataset: Dataset with a samples attribute, e.g. KvasirCapsuleSubset
+        :type dataset: KvasirCapsuleSubset
+        :param batch_size: Batch size
+        :type batch_size: int
+        :param num_samples: Samples per epoch, defaults to len(dataset)
+        :type num_samples: int, optional
+        :param alpha: Priority exponent, 0 is uniform sampling, defaults to 0.6
+        :type alpha: float, optional
+        :param beta: Initial importance weight exponent, defaults to 0.4
+        :type beta: float, optional
+        :param anneal_steps: Number of update() calls until beta reaches 1,
+            defaults to 10000
+        :type anneal_steps: int, optional
+        :param min_class_probability: Minimum sampling probability of every class,
+            defaults to 0.0
+        :type min_class_probability: float, optional
+        :param eps: Added to losses so that no sample starves, defaults to 1e-3
+        :type eps: float, optional
+        :param seed: Random seed, defaults to DEFAULT_RANDOM_SEED
+        :type seed: int, optional
+        :raises ValueError: If the class probabilities cannot be guaranteed
+        """
+        samples: List[KvasirCapsuleSample] = dataset.samples
+        labels = np.array([s.finding_class.value for s in samples], dtype=np.int64)
+        classes, self._class_of, class_counts = np.unique(
+            labels, return_inverse=True, return_counts=True
+        )
+        self._class_mix = min_class_probability * len(classes)
+        if self._class_mix > 1.0:
+            raise ValueError(
+                f"min_class_probability {min_class_probability} is too large for "
+                f"{len(classes)} classes, must be at most {1 / len(classes)}"
+            )
+        self.batch_size = batch_size
+        self.num_samples = len(samples) if num_samples is None else num_samples
+        self.alpha = alpha
+        self.beta0 = beta
+        self.anneal_steps = anneal_steps
+        self.eps = eps
+        self.steps = 0
+        self._rng = np.random.default_rng(seed)
+        self._class_counts = class_counts
+        # sample indices grouped by class, for the uniform per-class draws
+        self._class_order = np.argsort(self._class_of, kind="stable")
+        self._class_start = np.concatenate([[0], np.cumsum(class_counts)[:-1]])
+        self._tree = SumTree(len(samples))
+        # equal initial priorities, i.e. uniform sampling until losses are reported
+        self._tree.update(np.arange(len(samples)), np.ones(len(samples)))
+        self._pending: Deque[np.ndarray] = deque()
+
+    @property
+    def beta(self) -> float:
+        progress = min(self.steps / max(self.anneal_steps, 1), 1.0)
+        return self.beta0 + (1.0 - self.beta0) * progress
+
+    def probabilities(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Return the current sampling probabilities of samples.
+
+        :param indices: Sample indices
+        :type indices: np.ndarray
+        :return: Probabilities
+        :rtype: np.ndarray
+        """
+        p_tree = self._tree.priorities(indices) / self._tree.total
+        counts = self._class_counts[self._class_of[indices]]
+        p_class = 1.0 / (len(self._class_counts) * counts)
+        return (1.0 - self._class_mix) * p_tree + self._class_mix * p_class
+
+    def importance_weights(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Return importance weights (N * P(i)) ** -beta, normalized by the largest
+        possible weight so that they are at most 1.
+
+        :param indices: Sample indices
+        :type indices: np.ndarray
+        :return: Float32 importance weights
+        :rtype: np.ndarray
+        """
+        N = self._tree.capacity
+        p_min = (1.0 - self._class_mix) * self._tree.min() / self._tree.total
+        p_min += self._class_mix / (len(self._class_counts) * self._class_counts.max())
+        weights = (N * self.probabilities(indices)) ** -self.beta
+        return (weights / (N * p_min) ** -self.beta).astype(np.float32)
+
+    def _draw(self, n: int) -> np.ndarray:
+        from_class = self._rng.random(n) < self._class_mix
+        indices = self._tree.sample(n, self._rng)
+        k = int(from_class.sum())
+        if k > 0:
+            c = self._rng.integers(len(self._class_counts), size=k)
+            offset = (self._rng.random(k) * self._class_counts[c]).astype(np.int64)
+            indices[from_class] = self._class_order[self._class_start[c] + offset]
+        return indices
+
+    def __iter__(self) -> Iterator[List[int]]:
+        self._pending.clear()
+        for start in range(0, self.num_samples, self.batch_size):
+            batch = self._draw(min(self.batch_size, self.num_samples - start))
+            self._pending.append(batch)
+            yield batch.tolist()
+
+    def __len__(self) -> int:
+        return math.ceil(self.num_samples / self.batch_size)
+
+    def pop_batch(self) -> Tuple[np.ndarray, torch.Tensor]:
+        """
+        Return indices and importance weights of the oldest batch handed out.
+
+        :raises RuntimeError: If no batch is pending
+        :return: Sample indices and float32 importance weights
+        :rtype: Tuple[np.ndarray, torch.Tensor]
+        """
+        if not self._pending:
+            raise RuntimeError("No pending batch, call pop_batch() once per batch.")
+        indices = self._pending.popleft()
+        return indices, torch.from_numpy(self.importance_weights(indices))
+
+    def update(self, indices: np.ndarray, losses):
+        """
+        Set priorities of samples from their per-sample losses.
+
+        :param indices: Sample indices
+        :type indices: np.ndarray
+        :param losses: Per-sample losses (array or tensor)
+        """
+        if isinstance(losses, torch.Tensor):
+            losses = losses.detach().float().cpu().numpy()
+        priorities = (
+            np.abs(np.asarray(losses, dtype=np.float64)) + self.eps
+        ) ** self.alpha
+        self._tree.update(np.asarray(indices), priorities)
+        self.steps += 1
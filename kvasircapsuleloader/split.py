@@ -1,16 +1,122 @@
 import itertools
 import json
 import logging
+import struct
 from pathlib import Path
-from typing import Dict, List, Literal, Set
+from typing import Dict, List, Literal, Set, Tuple
 
 import numpy as np
+import pandas as pd
 
 from .config import DEFAULT_RANDOM_SEED
 from .metadata import KvasirCapsuleMetadata
 from .sample import KvasirCapsuleSample
 from .types import FindingClass
-from .utils import fix_random_seed
+from .utils import fix_random_seed, temporary_path
+
+# binary split archives, see SplitArchive
+SPLIT_ARCHIVE_SUFFIX = ".splits"
+_ARCHIVE_MAGIC = b"KCSPLIT\x01"
+
+
+def _deviation(
+    rows: np.ndarray, phases: np.ndarray, targets: Tuple[np.ndarray, np.ndarray]
+) -> np.ndarray:
+    """
+    Loss of phase rows (..., K) of a count matrix: squared deviation of the
+    achieved from the target ratio per column plus one for every empty column.
+    """
+    totals, ratios = targets
+    achieved = rows / np.maximum(totals, 1)
+    squared = (achieved - ratios[phases][..., None]) ** 2
+    empty = (rows == 0) & (totals > 0)
+    return squared.sum(axis=-1) + empty.sum(axis=-1)
+
+
+def solve_patient_assignment(
+    counts: np.ndarray,
+    ratios: np.ndarray,
+    seed: int = DEFAULT_RANDOM_SEED,
+    max_passes: int = 50,
+) -> np.ndarray:
+    """
+    Assign every patient to one phase such that the sample counts of all classes
+    jointly match the target ratios.
+
+    The loss sums the squared deviation of achieved from target ratios over all
+    classes and the overall sample count, so rare classes weigh as much as
+    frequent ones, and penalizes phases without samples of a class. A greedy
+    assignment in random patient order is refined by local search over single
+    patient moves and pairwise swaps until no step improves the loss. Every step
+    evaluates all candidate phases or swap partners at once on the count matrix.
+
+    :param counts: Number of samples per patient and class (P, K)
+    :type counts: np.ndarray
+    :param ratios: Target ratio per phase (F,)
+    :type ratios: np.ndarray
+    :param seed: Random seed for the patient order, defaults to DEFAULT_RANDOM_SEED
+    :type seed: int, optional
+    :param max_passes: Maximum number of local search passes, defaults to 50
+    :type max_passes: int, optional
+    :return: Phase index per patient (P,)
+    :rtype: np.ndarray
+    """
+    rng = np.random.default_rng(seed)
+    # the last column tracks the overall number of samples
+    C = np.concatenate([counts, counts.sum(axis=1, keepdims=True)], axis=1)
+    C = C.astype(np.float64)
+    ratios = np.asarray(ratios, dtype=np.float64)
+    targets = (C.sum(axis=0), ratios)
+    P, F = len(C), len(ratios)
+    phases = np.arange(F)
+    A = np.zeros((F, C.shape[1]))
+    assignment = np.zeros(P, dtype=np.int64)
+
+    for p in rng.permutation(P):
+        delta = _deviation(A + C[p], phases, targets) - _deviation(A, phases, targets)
+        assignment[p] = np.argmin(delta)
+        A[assignment[p]] += C[p]
+
+    for _ in range(max_passes):
+        improved = False
+        for p in rng.permutation(P):
+            f0 = assignment[p]
+            loss = _deviation(A, phases, targets)
+            # move p to any other phase
+            moved = _deviation(A + C[p], phases, targets)
+            delta = (
+                moved - loss + _deviation(A[f0] - C[p], phases[f0], targets) - loss[f0]
+            )
+            delta[f0] = np.inf
+            f = int(np.argmin(delta))
+            if delta[f] < -1e-12:
+                A[f0] -= C[p]
+                A[f] += C[p]
+                assignment[p] = f
+                improved = True
+                continue
+            # swap p with any patient q of another phase
+            others = np.flatnonzero(assignment != f0)
+            if len(others) == 0:
+                continue
+            D = C[others] - C[p]
+            fq = assignment[others]
+            delta = (
+                _deviation(A[f0] + D, np.full(len(others), f0), targets)
+                - loss[f0]
+                + _deviation(A[fq] - D, fq, targets)
+                - loss[fq]
+            )
+            i = int(np.argmin(delta))
+            if delta[i] < -1e-12:
+                q = others[i]
+                A[f0] += D[i]
+                A[fq[i]] -= D[i]
+                assignment[p], assignment[q] = fq[i], f0
+                improved = True
+        if not improved:
+            break
+    return assignment
 
 
 class PatientRatioSplit:
@@ -31,16 +137,21 @@ class PatientRatioSplit:
     def generate(
         self,
         metadata: KvasirCapsuleMetadata,
-        strategy: Literal["shuffle", "sort"] = "sort",
+        strategy: Literal["shuffle", "sort", "solve"] = "sort",
         seed: int = DEFAULT_RANDOM_SEED,
     ):
         """
         Generate sample assignments for the split.
 
+        "shuffle" and "sort" partition the patients of every finding class
+        independently. "solve" assigns every patient to one phase for all classes
+        jointly, see solve_patient_assignment(), and keeps achieved ratios close to
+        the targets on rare classes.
+
         :param metadata: _description_
         :type metadata: KvasirCapsuleMetadata
-        :param strategy: _description_, defaults to "sort"
-        :type strategy: Literal[&quot;shuffle&quot;, &quot;sort&quot;], optional
+        :param strategy: Patient assignment strategy, defaults to "sort"
+        :type strategy: Literal[&quot;shuffle&quot;, &quot;sort&quot;, &quot;solve&quot;], optional
         :param seed: Random seed, defaults to DEFAULT_RANDOM_SEED
         :type seed: int, optional
         """
@@ -51,6 +162,9 @@ class PatientRatioSplit:
             key: [] for key in self._ratios
         }
         fix_random_seed(self._seed)
+        if strategy == "solve":
+            self._solve(metadata)
+            return
         S = metadata.samples_by_class_by_patient()
         for finding_class, patient_dict in S.items():
             patients = list(patient_dict.values())
@@ -88,38 +202,153 @@ class PatientRatioSplit:
             if finding_class not in self.classes:
                 self.classes.add(finding_class)
 
+    def _solve(self, metadata: KvasirCapsuleMetadata):
+        """
+        Assign patients jointly across classes, see generate().
+        """
+        samples = metadata.samples
+        F = len(self._ratios)
+        patients, patient_of = np.unique(
+            [s.video_id for s in samples], return_inverse=True
+        )
+        labels = np.array([s.finding_class.value for s in samples], dtype=np.int64)
+        counts = np.zeros((len(patients), len(FindingClass)), dtype=np.int64)
+        np.add.at(counts, (patient_of, labels), 1)
+        N_patients = (counts > 0).sum(axis=0)
+        keep = N_patients >= F
+        for c in np.flatnonzero(~keep & (N_patients > 0)):
+            logging.warning(
+                f"Could not split finding class {FindingClass(c)}, ignoring: "
+                f"Too few patients {N_patients[c]}, should be {F} or more."
+            )
+        phase_of = solve_patient_assignment(
+            counts[:, keep], np.array(list(self._ratios.values())), seed=self._seed
+        )
+        sample_phase = np.where(keep[labels], phase_of[patient_of], -1)
+        for f, phase in enumerate(self._ratios):
+            self.samples[phase] = [
+                samples[i] for i in np.flatnonzero(sample_phase == f)
+            ]
+        self.classes.update(FindingClass(c) for c in np.flatnonzero(keep))
+
+    def report(self) -> pd.DataFrame:
+        """
+        Compare achieved with target ratios of the generated split.
+
+        Rows are indexed by finding class name (and "ALL" for all samples) and phase.
+
+        :return: Number of samples and patients, target and achieved ratio of samples
+            and their difference per class and phase
+        :rtype: pd.DataFrame
+        """
+        frame = pd.DataFrame(
+            [
+                (s.finding_class.name, phase, s.video_id)
+                for phase, samples in self.samples.items()
+                for s in samples
+            ],
+            columns=["finding_class", "phase", "video_id"],
+        )
+        frame = pd.concat([frame, frame.assign(finding_class="ALL")])
+        report = frame.groupby(["finding_class", "phase"]).agg(
+            samples=("video_id", "size"), patients=("video_id", "nunique")
+        )
+        report = report.reindex(
+            pd.MultiIndex.from_product(
+                [frame.finding_class.unique(), list(self._ratios)],
+                names=["finding_class", "phase"],
+            ),
+            fill_value=0,
+        )
+        report["target"] = [self._ratios[phase] for _, phase in report.index]
+        report["achieved"] = report.samples / report.groupby(
+            level="finding_class"
+        ).samples.transform("sum")
+        report["deviation"] = report.achieved - report.target
+        return report
+
+    def _set_samples(
+        self,
+        metadata: KvasirCapsuleMetadata,
+        samples: Dict[str, List[KvasirCapsuleSample]],
+    ):
+        """
+        Populate a loaded split.
+        """
+        self.metadata = metadata
+        self.samples = samples
+        self.classes = {s.finding_class for phase in samples.values() for s in phase}
+
+    def indices(self) -> Dict[str, np.ndarray]:
+        """
+        Return the row indices of the samples of every phase in the metadata table.
+
+        :raises ValueError: If the split was neither generated nor loaded
+        :return: Int64 array of row indices by phase
+        :rtype: Dict[str, np.ndarray]
+        """
+        if self.metadata is None:
+            raise ValueError("Split has no metadata, generate or load it first.")
+        return {
+            phase: self.metadata.indices(self.samples[phase]) for phase in self._ratios
+        }
+
     @staticmethod
-    def load(path: Path, metadata: KvasirCapsuleMetadata) -> "PatientRatioSplit":
+    def load(
+        path: Path, metadata: KvasirCapsuleMetadata, name: str = "default"
+    ) -> "PatientRatioSplit":
         """
-        Load split definition from JSON.
+        Load split definition from JSON or from a split archive (SPLIT_ARCHIVE_SUFFIX).
 
         Requires an instantiated KvasirCapsuleMetadata object that can be obtained
         simply by constructing it.
 
-        :param path: Path to input JSON file.
+        :param path: Path to input JSON file or split archive.
         :type path: Path
         :param metadata: KvasirCapsuleMetadata object.
         :type metadata: KvasirCapsuleMetadata
+        :param name: Name of the split in a split archive, defaults to "default"
+        :type name: str, optional
+        :raises ValueError: If the split was saved for different metadata
         :return: Populated PatientRatioSplit object
         :rtype: PatientRatioSplit
         """
+        if Path(path).suffix == SPLIT_ARCHIVE_SUFFIX:
+            return SplitArchive(path).load(name, metadata)
         with open(path, "r") as f:
             data = json.load(f)
+        if (
+            data.get("metadata_hash", metadata.content_hash())
+            != metadata.content_hash()
+        ):
+            raise ValueError(f"Split {path} was saved for different metadata.")
         split = PatientRatioSplit(**data["ratios"])
         split._seed = data["seed"]
         split._strategy = data["strategy"]
         S = metadata.samples_by_filename()
-        for phase in split._ratios:
-            split.samples[phase] = [S[filename] for filename in data["samples"][phase]]
+        split._set_samples(
+            metadata,
+            {
+                phase: [S[filename] for filename in data["samples"][phase]]
+                for phase in split._ratios
+            },
+        )
         return split
 
-    def save(self, path: Path):
+    def save(self, path: Path, name: str = "default"):
         """
-        Save split definition to JSON.
+        Save split definition to JSON, or add it to a split archive if the path ends
+        with SPLIT_ARCHIVE_SUFFIX.
 
-        :param path: Path to output JSON. Parent directories must exist.
+        :param path: Path to output JSON or split archive. Parent directories must
+            exist.
         :type path: Path
+        :param name: Name of the split in a split archive, defaults to "default"
+        :type name: str, optional
         """
+        if Path(path).suffix == SPLIT_ARCHIVE_SUFFIX:
+            save_splits(path, {name: self})
+            return
         data = {
             "ratios": {**self._ratios},
             "seed": self._seed,
@@ -129,10 +358,183 @@ class PatientRatioSplit:
                 for phase in self._ratios
             },
         }
+        if self.metadata is not None:
+            data["metadata_hash"] = self.metadata.content_hash()
         with open(path, "w") as f:
             json.dump(data, f)
 
 
+class SplitArchive:
+    """
+    Read-only view of a binary file with many split definitions, e.g. all folds of
+    a k-fold split or a seed sweep.
+
+    The file starts with a magic number, the length of a JSON header and the header
+    itself, which holds the content hash of the metadata table and per split its
+    ratios, seed, strategy and the position of every phase in the index block.
+    The index block follows 8-byte aligned and holds little-endian int32 row
+    indices into the metadata table. It is memory-mapped, so opening an archive
+    only parses the header and loading a split only gathers samples by index.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: Path to the split archive
+        :type path: Path
+        :raises ValueError: If the file is not a split archive
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(_ARCHIVE_MAGIC)) != _ARCHIVE_MAGIC:
+                raise ValueError(f"{path} is not a split archive.")
+            (header_size,) = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(header_size))
+        offset = _archive_data_offset(header_size)
+        num_rows = self.header["num_rows"]
+        self._rows = (
+            np.memmap(
+                self.path, dtype="<i4", mode="r", offset=offset, shape=(num_rows,)
+            )
+            if num_rows > 0
+            else np.zeros(0, dtype="<i4")
+        )
+
+    @property
+    def metadata_hash(self) -> str:
+        return self.header["metadata_hash"]
+
+    def names(self) -> List[str]:
+        """
+        Return the names of all splits in the archive.
+
+        :return: Split names in insertion order
+        :rtype: List[str]
+        """
+        return list(self.header["splits"])
+
+    def __len__(self) -> int:
+        return len(self.header["splits"])
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.header["splits"]
+
+    def indices(self, name: str) -> Dict[str, np.ndarray]:
+        """
+        Return the row indices of every phase of a split without copying.
+
+        :param name: Split name
+        :type name: str
+        :return: Read-only int32 row indices into the metadata table by phase
+        :rtype: Dict[str, np.ndarray]
+        """
+        return {
+            phase: self._rows[start : start + length]
+            for phase, (start, length) in self.header["splits"][name]["phases"].items()
+        }
+
+    def load(self, name: str, metadata: KvasirCapsuleMetadata) -> PatientRatioSplit:
+        """
+        Load a split definition.
+
+        :param name: Split name
+        :type name: str
+        :param metadata: Metadata the split was saved for
+        :type metadata: KvasirCapsuleMetadata
+        :raises KeyError: If the archive has no split with this name
+        :raises ValueError: If the split was saved for different metadata
+        :return: Populated PatientRatioSplit object
+        :rtype: PatientRatioSplit
+        """
+        if name not in self:
+            raise KeyError(f"No split {name} in {self.path}, has: {self.names()}")
+        if self.metadata_hash != metadata.content_hash():
+            raise ValueError(
+                f"Split archive {self.path} was saved for different metadata."
+            )
+        entry = self.header["splits"][name]
+        split = PatientRatioSplit(**entry["ratios"])
+        split._seed = entry["seed"]
+        split._strategy = entry["strategy"]
+        samples = metadata.samples
+        split._set_samples(
+            metadata,
+            {
+                phase: [samples[i] for i in rows.tolist()]
+                for phase, rows in self.indices(name).items()
+            },
+        )
+        return split
+
+
+def _archive_data_offset(header_size: int) -> int:
+    """
+    Return the 8-byte aligned start of the index block.
+    """
+    end = len(_ARCHIVE_MAGIC) + 8 + header_size
+    return (end + 7) // 8 * 8
+
+
+def save_splits(path: Path, splits: Dict[str, PatientRatioSplit], append: bool = True):
+    """
+    Write split definitions to a split archive, see SplitArchive.
+
+    The archive is written to a temporary file and renamed, readers never see a
+    partially written archive.
+
+    :param path: Path to the split archive, should end with SPLIT_ARCHIVE_SUFFIX
+    :type path: Path
+    :param splits: Generated or loaded splits by name, all for the same metadata
+    :type splits: Dict[str, PatientRatioSplit]
+    :param append: Keep the splits of an existing archive at path, splits with the
+        same name are replaced, defaults to True
+    :type append: bool, optional
+    :raises ValueError: If splits were made for different metadata or have none
+    """
+    path = Path(path)
+    hashes = set()
+    for split in splits.values():
+        if split.metadata is None:
+            raise ValueError("Split has no metadata, generate or load it first.")
+        hashes.add(split.metadata.content_hash())
+    entries: Dict[str, Tuple[Dict, Dict[str, np.ndarray]]] = {}
+    if append and path.is_file():
+        archive = SplitArchive(path)
+        hashes.add(archive.metadata_hash)
+        for name in archive.names():
+            entries[name] = (archive.header["splits"][name], archive.indices(name))
+    for name, split in splits.items():
+        entry = {
+            "ratios": {**split._ratios},
+            "seed": split._seed,
+            "strategy": split._strategy,
+        }
+        entries[name] = (entry, split.indices())
+    if len(hashes) != 1:
+        raise ValueError("All splits of an archive must be made for the same metadata.")
+
+    header: Dict = {"metadata_hash": hashes.pop(), "num_rows": 0, "splits": {}}
+    blocks = []
+    for name, (entry, indices) in entries.items():
+        phases = {}
+        for phase, rows in indices.items():
+            phases[phase] = [header["num_rows"], len(rows)]
+            header["num_rows"] += len(rows)
+            blocks.append(np.asarray(rows, dtype="<i4"))
+        header["splits"][name] = {**entry, "phases": phases}
+    encoded = json.dumps(header).encode("utf-8")
+    offset = _archive_data_offset(len(encoded))
+
+    tmp_path = temporary_path(path)
+    with open(tmp_path, "wb") as f:
+        f.write(_ARCHIVE_MAGIC)
+        f.write(struct.pack("<Q", len(encoded)))
+        f.write(encoded)
+        f.write(b"\0" * (offset - f.tell()))
+        for block in blocks:
+            f.write(block.tobytes())
+    tmp_path.replace(path)
+
+
 def make_kfold_split(k: int):
     """
     Factoy function that creates a split definition for k-fold cross-validation.
@@ -142,3 +544,64 @@ def make_kfold_split(k: int):
     """
     assert k > 0
     return PatientRatioSplit(**{f"fold{i}": 1 / k for i in range(k)})
+
+
+def generate_kfold_split(
+    metadata: KvasirCapsuleMetadata,
+    k: int,
+    strategy: Literal["shuffle", "sort", "solve"] = "solve",
+    seed: int = DEFAULT_RANDOM_SEED,
+) -> PatientRatioSplit:
+    """
+    Generate a k-fold split that assigns every patient with all its samples to one
+    fold, so folds are patient-disjoint and together cover every row of metadata.
+
+    "shuffle" and "sort" visit patients in random order or descending by number of
+    samples and add each to the fold with the fewest samples so far. "solve" uses
+    solve_patient_assignment() to also balance the classes across folds. Unlike
+    PatientRatioSplit.generate(), classes with fewer than k patients are kept.
+
+    :param metadata: Metadata to split
+    :type metadata: KvasirCapsuleMetadata
+    :param k: Number of folds, must be > 0
+    :type k: int
+    :param strategy: Patient assignment strategy, defaults to "solve"
+    :type strategy: Literal["shuffle", "sort", "solve"], optional
+    :param seed: Random seed, defaults to DEFAULT_RANDOM_SEED
+    :type seed: int, optional
+    :raises ValueError: If there are fewer patients than folds
+    :return: Split with phases "fold0" to "fold{k-1}"
+    :rtype: PatientRatioSplit
+    """
+    split = make_kfold_split(k)
+    samples = metadata.samples
+    patients, patient_of = np.unique([s.video_id for s in samples], return_inverse=True)
+    if len(patients) < k:
+        raise ValueError(f"Cannot split {len(patients)} patients into {k} folds.")
+    if strategy == "solve":
+        labels = np.array([s.finding_class.value for s in samples], dtype=np.int64)
+        counts = np.zeros((len(patients), len(FindingClass)), dtype=np.int64)
+        np.add.at(counts, (patient_of, labels), 1)
+        fold_of = solve_patient_assignment(counts, np.full(k, 1 / k), seed=seed)
+    else:
+        sizes = np.bincount(patient_of, minlength=len(patients))
+        if strategy == "sort":
+            order = np.argsort(-sizes, kind="stable")
+        else:
+            order = np.random.default_rng(seed).permutation(len(patients))
+        totals = np.zeros(k, dtype=np.int64)
+        fold_of = np.zeros(len(patients), dtype=np.int64)
+        for p in order:
+            fold_of[p] = np.argmin(totals)
+            totals[fold_of[p]] += sizes[p]
+    sample_fold = fold_of[patient_of]
+    split._seed = seed
+    split._strategy = strategy
+    split._set_samples(
+        metadata,
+        {
+            f"fold{i}": [samples[j] for j in np.flatnonzero(sample_fold == i)]
+            for i in range(k)
+        },
+    )
+    return split
@@ -0,0 +1,277 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import albumentations as A  # type: ignore[import-untyped]
+import numpy as np
+
+from .config import KVASIR_CAPSULE_CACHE_PATH
+from .sample import KvasirCapsuleSample
+from .transforms import make_transforms
+from .types import FindingClass
+from .utils import hash_strings, parallel_map, temporary_path
+
+
+class ChannelMoments:
+    """
+    Running per-channel count, mean and sum of squared deviations (M2).
+
+    Partial moments of disjoint pixel sets are combined with the parallel update of
+    Chan et al., so images can be processed in any order on any number of workers
+    without losing numerical stability.
+    """
+
+    def __init__(self, num_channels: int = 3):
+        self.count = 0
+        self.mean = np.zeros(num_channels, dtype=np.float64)
+        self.m2 = np.zeros(num_channels, dtype=np.float64)
+
+    @staticmethod
+    def from_pixels(pixels: np.ndarray) -> "ChannelMoments":
+        """
+        Compute moments of a (N, C) pixel array in a single vectorized pass.
+
+        :param pixels: Pixel values, one row per pixel
+        :type pixels: np.ndarray
+        :return: Moments of the given pixels
+        :rtype: ChannelMoments
+        """
+        pixels = pixels.astype(np.float64, copy=False)
+        moments = ChannelMoments(pixels.shape[1])
+        moments.count = pixels.shape[0]
+        if moments.count > 0:
+            moments.mean = pixels.mean(axis=0)
+            moments.m2 = ((pixels - moments.mean) ** 2).sum(axis=0)
+        return moments
+
+    def merge(self, other: "ChannelMoments") -> "ChannelMoments":
+        """
+        Merge other into self in-place (Chan et al. parallel variance update).
+
+        :param other: Moments of a disjoint set of pixels
+        :type other: ChannelMoments
+        :return: self
+        :rtype: ChannelMoments
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = (
+                other.count,
+                other.mean.copy(),
+                other.m2.copy(),
+            )
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.m2 = self.m2 + other.m2 + delta**2 * (self.count * other.count / count)
+        self.count = count
+        return self
+
+    @property
+    def variance(self) -> np.ndarray:
+        if self.count == 0:
+            return np.zeros_like(self.m2)
+        return self.m2 / self.count
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+
+class DatasetStatistics:
+    """
+    Per-channel normalization statistics (in [0, 1] scale) and per-class colour
+    histograms of a set of samples.
+    """
+
+    def __init__(
+        self,
+        moments: ChannelMoments,
+        histograms: Dict[FindingClass, np.ndarray],
+        bins: int,
+    ):
+        self.moments = moments
+        self.histograms = histograms
+        self.bins = bins
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.moments.mean
+
+    @property
+    def std(self) -> np.ndarray:
+        return self.moments.std
+
+    @property
+    def num_pixels(self) -> int:
+        return self.moments.count
+
+    def transforms(self) -> Dict[str, A.BaseCompose]:
+        """
+        Build the default augmentation pipelines normalized with these statistics.
+
+        :return: Mapping of phase names to transform pipelines
+        :rtype: Dict[str, A.BaseCompose]
+        """
+        return make_transforms(self.mean.tolist(), self.std.tolist())
+
+    def save(self, path: Path):
+        """
+        Save statistics to a .npz file.
+
+        :param path: Output path, parent directories are created
+        :type path: Path
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        classes = sorted(self.histograms, key=lambda c: c.value)
+        # write to a temporary file first so readers never see partial caches
+        tmp_path = temporary_path(path)
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                count=np.array(self.moments.count, dtype=np.int64),
+                mean=self.moments.mean,
+                m2=self.moments.m2,
+                bins=np.array(self.bins),
+                classes=np.array([c.value for c in classes], dtype=np.int64),
+                histograms=(
+                    np.stack([self.histograms[c] for c in classes])
+                    if classes
+                    else np.zeros(
+                        (0, len(self.moments.mean), self.bins), dtype=np.int64
+                    )
+                ),
+            )
+        tmp_path.replace(path)
+
+    @staticmethod
+    def load(path: Path) -> "DatasetStatistics":
+        """
+        Load statistics from a .npz file written by save().
+
+        :param path: Input path
+        :type path: Path
+        :return: Loaded statistics
+        :rtype: DatasetStatistics
+        """
+        with np.load(path) as data:
+            moments = ChannelMoments(len(data["mean"]))
+            moments.count = int(data["count"])
+            moments.mean = data["mean"]
+            moments.m2 = data["m2"]
+            histograms = {
+                FindingClass(int(c)): h
+                for c, h in zip(data["classes"], data["histograms"])
+            }
+            return DatasetStatistics(moments, histograms, int(data["bins"]))
+
+
+def _chunk_statistics(
+    samples: Sequence[KvasirCapsuleSample], bins: int
+) -> DatasetStatistics:
+    """
+    Compute partial statistics for a chunk of samples, executed by one worker.
+    """
+    moments = ChannelMoments()
+    histograms: Dict[FindingClass, np.ndarray] = {}
+    channel_offset = np.arange(3) * bins
+    for sample in samples:
+        pixels = sample.load_image(scale=False).reshape(-1, 3)
+        moments.merge(ChannelMoments.from_pixels(pixels / 255.0))
+        # one bincount over (channel, bin) pairs instead of one histogram per channel
+        binned = (pixels.astype(np.int64) * bins // 256) + channel_offset
+        hist = np.bincount(binned.ravel(), minlength=3 * bins).reshape(3, bins)
+        if sample.finding_class not in histograms:
+            histograms[sample.finding_class] = hist
+        else:
+            histograms[sample.finding_class] += hist
+    return DatasetStatistics(moments, histograms, bins)
+
+
+def compute_statistics(
+    samples: Sequence[KvasirCapsuleSample],
+    num_workers: Optional[int] = None,
+    bins: int = 256,
+    chunk_size: int = 256,
+) -> DatasetStatistics:
+    """
+    Stream samples through a worker pool and merge partial moments and histograms.
+
+    :param samples: Samples to compute statistics for, e.g. KvasirCapsuleSubset.samples
+    :type samples: Sequence[KvasirCapsuleSample]
+    :param num_workers: Number of workers, defaults to the number of CPUs
+    :type num_workers: int, optional
+    :param bins: Number of histogram bins per channel, must divide 256, defaults to 256
+    :type bins: int, optional
+    :param chunk_size: Number of samples per worker task, defaults to 256
+    :type chunk_size: int, optional
+    :raises ValueError: If bins does not divide 256
+    :return: Merged statistics
+    :rtype: DatasetStatistics
+    """
+    if bins <= 0 or 256 % bins != 0:
+        raise ValueError(f"Number of bins must divide 256, is: {bins}")
+    chunks: List[Sequence[KvasirCapsuleSample]] = [
+        samples[i : i + chunk_size] for i in range(0, len(samples), chunk_size)
+    ]
+    partials = parallel_map(
+        lambda chunk: _chunk_statistics(chunk, bins),
+        chunks,
+        num_workers=num_workers,
+        desc="Computing statistics",
+    )
+    result = DatasetStatistics(ChannelMoments(), {}, bins)
+    for partial in partials:
+        result.moments.merge(partial.moments)
+        for finding_class, hist in partial.histograms.items():
+            if finding_class not in result.histograms:
+                result.histograms[finding_class] = hist
+            else:
+                result.histograms[finding_class] += hist
+    return result
+
+
+def statistics_cache_path(
+    samples: Sequence[KvasirCapsuleSample], bins: int = 256
+) -> Path:
+    """
+    Return the cache file used for the statistics of the given samples.
+
+    :param samples: Samples the statistics are computed for
+    :type samples: Sequence[KvasirCapsuleSample]
+    :param bins: Number of histogram bins per channel, defaults to 256
+    :type bins: int, optional
+    :return: Path of the .npz cache file
+    :rtype: Path
+    """
+    key = hash_strings(sorted(sample.filename for sample in samples))
+    return KVASIR_CAPSULE_CACHE_PATH / "statistics" / f"{key[:16]}_{bins}.npz"
+
+
+def load_statistics(
+    samples: Sequence[KvasirCapsuleSample],
+    num_workers: Optional[int] = None,
+    bins: int = 256,
+    overwrite: bool = False,
+) -> DatasetStatistics:
+    """
+    Return cached statistics for the given samples or compute and cache them.
+
+    :param samples: Samples to compute statistics for
+    :type samples: Sequence[KvasirCapsuleSample]
+    :param num_workers: Number of workers, defaults to the number of CPUs
+    :type num_workers: int, optional
+    :param bins: Number of histogram bins per channel, defaults to 256
+    :type bins: int, optional
+    :param overwrite: Recompute even if a cache file exists, defaults to False
+    :type overwrite: bool, optional
+    :return: Statistics of the samples
+    :rtype: DatasetStatistics
+    """
+    path = statistics_cache_path(samples, bins)
+    if path.is_file() and not overwrite:
+        return DatasetStatistics.load(path)
+    statistics = compute_statistics(samples, num_workers=num_workers, bins=bins)
+    statistics.save(path)
+    return statistics
@@ -0,0 +1,242 @@
+import fcntl
+import io
+import os
+import shutil
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .config import (
+    KVASIR_CAPSULE_PATH,
+    KVASIR_CAPSULE_SCRATCH_PATH,
+    KVASIR_CAPSULE_SCRATCH_SIZE,
+)
+from .utils import parallel_map, temporary_path
+
+_NUM_LOCK_STRIPES = 64
+_LOCK_DIRNAME = ".locks"
+# suffix of temporary_path()
+_TMP_SUFFIX = ".tmp"
+
+
+class TieredStorage:
+    """
+    Read-only primary root (e.g. an NFS mount) with a local scratch root that is
+    filled lazily on first read and bounded in size by LRU eviction.
+
+    Files are copied to a temporary name and renamed into place, so readers never
+    observe partial files. Fills and evictions are serialized across processes with
+    flock-based locks inside the scratch root, so several DataLoader workers and
+    several jobs on the same node can share one scratch directory.
+    """
+
+    def __init__(
+        self,
+        primary: Path,
+        scratch: Path,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        :param primary: Root of the dataset, never written to
+        :type primary: Path
+        :param scratch: Local root that mirrors the primary directory structure
+        :type scratch: Path
+        :param max_bytes: Size limit of the scratch root, unbounded if None
+        :type max_bytes: int, optional
+        """
+        self.primary = Path(primary).expanduser()
+        self.scratch = Path(scratch).expanduser()
+        self.max_bytes = max_bytes
+        (self.scratch / _LOCK_DIRNAME).mkdir(parents=True, exist_ok=True)
+        self._usage_lock = threading.Lock()
+        self._usage = self.usage()
+
+    @contextmanager
+    def _lock(self, name: str) -> Iterator[None]:
+        """
+        Exclusive inter-process lock on a lock file inside the scratch root.
+        """
+        with open(self.scratch / _LOCK_DIRNAME / name, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _files(self) -> List[Tuple[float, int, Path]]:
+        """
+        Return (mtime, size, path) of all cached files in the scratch root.
+        """
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.scratch):
+            if _LOCK_DIRNAME in dirnames:
+                dirnames.remove(_LOCK_DIRNAME)
+            for filename in filenames:
+                if filename.endswith(_TMP_SUFFIX):
+                    continue
+                path = Path(dirpath) / filename
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def usage(self) -> int:
+        """
+        Return the number of bytes currently cached in the scratch root.
+
+        :return: Size in bytes
+        :rtype: int
+        """
+        return sum(size for _, size, _ in self._files())
+
+    def resolve(self, relative_path: Path) -> Path:
+        """
+        Return a local path for a file of the primary root, copying it to the
+        scratch root first if necessary.
+
+        :param relative_path: Path relative to the primary root
+        :type relative_path: Path
+        :return: Path inside the scratch root
+        :rtype: Path
+        """
+        local_path = self.scratch / relative_path
+        try:
+            # mtime is the LRU timestamp, shared by all processes
+            os.utime(local_path)
+            return local_path
+        except FileNotFoundError:
+            pass
+        return self.fill(relative_path)
+
+    def open_file(self, relative_path: Path) -> io.BufferedReader:
+        """
+        Open a file for binary reading through the scratch root. A file that another
+        process evicts between resolve() and opening is filled again once; an open
+        file stays readable even if it is evicted afterwards.
+
+        :param relative_path: Path relative to the primary root
+        :type relative_path: Path
+        :return: File object of the file inside the scratch root
+        :rtype: io.BufferedReader
+        """
+        try:
+            return open(self.resolve(relative_path), "rb")
+        except FileNotFoundError:
+            return open(self.fill(relative_path), "rb")
+
+    def fill(self, relative_path: Path) -> Path:
+        """
+        Copy a file from the primary to the scratch root atomically, unless another
+        process already did so.
+
+        :param relative_path: Path relative to the primary root
+        :type relative_path: Path
+        :return: Path inside the scratch root
+        :rtype: Path
+        """
+        local_path = self.scratch / relative_path
+        stripe = zlib.crc32(str(relative_path).encode("utf-8")) % _NUM_LOCK_STRIPES
+        with self._lock(f"fill_{stripe}.lock"):
+            if local_path.exists():
+                return local_path
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = temporary_path(local_path)
+            shutil.copyfile(self.primary / relative_path, tmp_path)
+            size = tmp_path.stat().st_size
+            os.replace(tmp_path, local_path)
+        with self._usage_lock:
+            self._usage += size
+            exceeded = self.max_bytes is not None and self._usage > self.max_bytes
+        if exceeded:
+            self.evict()
+        return local_path
+
+    def evict(self, target_ratio: float = 0.9):
+        """
+        Delete least recently used files until the scratch root is below
+        target_ratio * max_bytes. Eviction frees some headroom, so it does not run
+        on every fill once the limit is reached.
+
+        :param target_ratio: Fraction of max_bytes to shrink to, defaults to 0.9
+        :type target_ratio: float, optional
+        """
+        if self.max_bytes is None:
+            return
+        with self._lock("evict.lock"):
+            # rescan, the local estimate does not see fills of other processes
+            files = sorted(self._files())
+            usage = sum(size for _, size, _ in files)
+            target = int(self.max_bytes * target_ratio)
+            for _, size, path in files:
+                if usage <= target:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                usage -= size
+        with self._usage_lock:
+            self._usage = usage
+
+    def prewarm(
+        self,
+        relative_paths: Iterable[Path],
+        num_workers: Optional[int] = None,
+    ):
+        """
+        Copy files to the scratch root in parallel, e.g. before training starts.
+
+        :param relative_paths: Paths relative to the primary root
+        :type relative_paths: Iterable[Path]
+        :param num_workers: Number of parallel copies, defaults to the number of CPUs
+        :type num_workers: int, optional
+        """
+        parallel_map(
+            self.resolve, relative_paths, num_workers=num_workers, desc="Prewarming"
+        )
+
+
+_storage: Optional[TieredStorage] = None
+_storage_initialized = False
+_storage_lock = threading.Lock()
+
+
+def get_tiered_storage() -> Optional[TieredStorage]:
+    """
+    Return the tiered storage used by KvasirCapsuleSample.load_image(), if any.
+
+    Configured with "kvasir-capsule-scratch-path" and "kvasir-capsule-scratch-size-gb".
+    The configured storage is created on first use, as that scans the scratch root.
+
+    :return: Active tiered storage or None if images are read from the primary root
+    :rtype: TieredStorage | None
+    """
+    global _storage, _storage_initialized
+    if not _storage_initialized:
+        with _storage_lock:
+            if not _storage_initialized:
+                if KVASIR_CAPSULE_SCRATCH_PATH is not None:
+                    _storage = TieredStorage(
+                        KVASIR_CAPSULE_PATH,
+                        KVASIR_CAPSULE_SCRATCH_PATH,
+                        KVASIR_CAPSULE_SCRATCH_SIZE,
+                    )
+                _storage_initialized = True
+    return _storage
+
+
+def set_tiered_storage(storage: Optional[TieredStorage]):
+    """
+    Set (or disable with None) the tiered storage used to load images.
+
+    :param storage: Tiered storage
+    :type storage: TieredStorage | None
+    """
+    global _storage, _storage_initialized
+    with _storage_lock:
+        _storage = storage
+        _storage_initialized = True
@@ -1,31 +1,57 @@
+from typing import Dict, Sequence
+
 import albumentations as A  # type: ignore[import-untyped]
 from albumentations.pytorch import ToTensorV2  # type: ignore[import-untyped]
 
-_T_train = A.Compose(
-    [
-        A.ColorJitter(),
-        A.Resize(224, 224),
-        A.RandomRotate90(),
-        A.HorizontalFlip(),
-        A.Normalize((0.5,), (0.225,)),
-        ToTensorV2(),
-    ],
-    bbox_params=A.BboxParams(format="yolo"),
-)
-_T_val = A.Compose(
-    [
-        A.Resize(224, 224),
-        A.Normalize((0.5,), (0.225,)),
-        ToTensorV2(),
-    ],
-    bbox_params=A.BboxParams(format="yolo"),
-)
-_T_test = _T_val
-_T_id = _T_val  # for in-distribution test sets
-
-kvasir_capsule_transforms = {
-    "train": _T_train,
-    "val": _T_val,
-    "test": _T_test,
-    "id": _T_id,
-}
+# Placeholder statistics, use KvasirCapsuleDataset.statistics() for the real ones
+DEFAULT_MEAN = (0.5,)
+DEFAULT_STD = (0.225,)
+
+
+def make_transforms(
+    mean: Sequence[float] = DEFAULT_MEAN,
+    std: Sequence[float] = DEFAULT_STD,
+) -> Dict[str, A.BaseCompose]:
+    """
+    Build the default augmentation pipelines for all phases with the given
+    normalization statistics.
+
+    Statistics are expected in [0, 1] scale, matching the float32 images returned by
+    KvasirCapsuleSample.load_image().
+
+    :param mean: Per-channel mean, defaults to DEFAULT_MEAN
+    :type mean: Sequence[float], optional
+    :param std: Per-channel standard deviation, defaults to DEFAULT_STD
+    :type std: Sequence[float], optional
+    :return: Mapping of phase names to transform pipelines
+    :rtype: Dict[str, A.BaseCompose]
+    """
+    mean, std = tuple(mean), tuple(std)
+    T_train = A.Compose(
+        [
+            A.ColorJitter(),
+            A.Resize(224, 224),
+            A.RandomRotate90(),
+            A.HorizontalFlip(),
+            A.Normalize(mean, std, max_pixel_value=1.0),
+            ToTensorV2(),
+        ],
+        bbox_params=A.BboxParams(format="yolo"),
+    )
+    T_val = A.Compose(
+        [
+            A.Resize(224, 224),
+            A.Normalize(mean, std, max_pixel_value=1.0),
+            ToTensorV2(),
+        ],
+        bbox_params=A.BboxParams(format="yolo"),
+    )
+    return {
+        "train": T_train,
+        "val": T_val,
+        "test": T_val,
+        "id": T_val,  # for in-distribution test sets
+    }
+
+
+kvasir_capsule_transforms = make_transforms()
@@ -1,11 +1,22 @@
+import hashlib
 import os
 import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, TypeVar
+from uuid import uuid4
 
 import numpy as np
 import torch
+from tqdm import tqdm
 
 from .config import DEFAULT_RANDOM_SEED
 
+T = TypeVar("T")
+R = TypeVar("R")
+
 
 def fix_random_seed(seed: int = DEFAULT_RANDOM_SEED):
     """
@@ -22,3 +33,122 @@ def fix_random_seed(seed: int = DEFAULT_RANDOM_SEED):
     torch.cuda.manual_seed(seed)
     torch.backends.cudnn.deterministic = True
     torch.backends.cudnn.benchmark = False
+
+
+def default_num_workers() -> int:
+    """
+    Return the number of workers used by parallel helpers if none is given.
+
+    :return: Number of available CPUs, at least 1
+    :rtype: int
+    """
+    return os.cpu_count() or 1
+
+
+def parallel_map(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    num_workers: Optional[int] = None,
+    desc: Optional[str] = None,
+) -> List[R]:
+    """
+    Apply fn to all items in a thread pool and return results in input order.
+
+    Image decoding (PIL) and file I/O release the GIL, so threads scale well for
+    the workloads in this package without the pickling overhead of processes.
+
+    :param fn: Function applied to each item
+    :type fn: Callable[[T], R]
+    :param items: Items to process
+    :type items: Iterable[T]
+    :param num_workers: Number of threads, defaults to the number of CPUs
+    :type num_workers: int, optional
+    :param desc: Progress bar description, no progress bar if None
+    :type desc: str, optional
+    :return: Results of fn for each item
+    :rtype: List[R]
+    """
+    items = list(items)
+    num_workers = default_num_workers() if num_workers is None else num_workers
+    if num_workers <= 1:
+        return [fn(item) for item in tqdm(items, desc=desc, disable=desc is None)]
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        return list(
+            tqdm(
+                executor.map(fn, items),
+                total=len(items),
+                desc=desc,
+                disable=desc is None,
+            )
+        )
+
+
+def hash_strings(strings: Iterable[str]) -> str:
+    """
+    Return a stable SHA256 hex digest over an ordered sequence of strings.
+
+    Used to key on-disk caches by the exact set of samples they were built from.
+
+    :param strings: Strings to hash, e.g. sample filenames
+    :type strings: Iterable[str]
+    :return: Hex digest
+    :rtype: str
+    """
+    sha256 = hashlib.sha256()
+    for s in strings:
+        sha256.update(s.encode("utf-8"))
+        sha256.update(b"\0")
+    return sha256.hexdigest()
+
+
+def temporary_path(path: Path) -> Path:
+    """
+    Return a temporary name next to path to write to before renaming it into
+    place. The name is unique per process and call, and thus also between hosts
+    that share a cache directory.
+
+    :param path: Final path
+    :type path: Path
+    :return: Temporary path ending with ".tmp"
+    :rtype: Path
+    """
+    return path.with_name(f"{path.name}.{os.getpid()}.{uuid4().hex}.tmp")
+
+
+@contextmanager
+def publish_directory(path: Path, overwrite: bool = False) -> Iterator[Path]:
+    """
+    Yield an empty temporary directory next to path and rename it to path once the
+    block completes, so readers only ever see complete directories.
+
+    The temporary name is unique, see temporary_path(). If another process has
+    published path in the meantime, its directory is kept and ours is discarded.
+    With overwrite, an existing directory is moved aside before the rename and
+    deleted afterwards. On errors, the temporary directory is deleted.
+
+    :param path: Directory to publish
+    :type path: Path
+    :param overwrite: Replace an existing directory, defaults to False
+    :type overwrite: bool, optional
+    :return: Temporary directory to write into
+    :rtype: Iterator[Path]
+    """
+    tmp_path = temporary_path(path)
+    old_path = tmp_path.with_suffix(".old")
+    tmp_path.mkdir(parents=True)
+    try:
+        yield tmp_path
+        if overwrite:
+            try:
+                path.rename(old_path)
+            except FileNotFoundError:
+                pass
+        try:
+            tmp_path.rename(path)
+        except OSError:
+            # published by another process, which also wrote a complete directory
+            if not path.is_dir():
+                raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.rmtree(old_path, ignore_errors=True)
@@ -0,0 +1,431 @@
+import json
+import os
+import struct
+from collections import OrderedDict
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import albumentations as A  # type: ignore[import-untyped]
+import cv2
+import numpy as np
+from torch.utils.data import Dataset
+
+from .config import KVASIR_CAPSULE_CACHE_PATH, KVASIR_CAPSULE_VIDEO_PATH
+from .utils import hash_strings, parallel_map, temporary_path
+
+VIDEO_EXTENSIONS = (".mp4", ".m4v", ".mov")
+
+# boxes on the path moov/trak/mdia/minf/stbl that hold the sample tables
+_CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+def _iter_boxes(f: IO[bytes], start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Yield (type, payload start, box end) of the ISO BMFF boxes in [start, end).
+    """
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _read_tables(
+    f: IO[bytes], start: int, end: int, tables: Dict[bytes, bytes]
+) -> List[Dict[bytes, bytes]]:
+    """
+    Collect the payloads of hdlr, mdhd, stts and stss boxes per track.
+    """
+    tracks = []
+    for kind, payload, box_end in _iter_boxes(f, start, end):
+        if kind == b"trak":
+            track: Dict[bytes, bytes] = {}
+            _read_tables(f, payload, box_end, track)
+            tracks.append(track)
+        elif kind in _CONTAINER_BOXES:
+            tracks += _read_tables(f, payload, box_end, tables)
+        elif kind in (b"hdlr", b"mdhd", b"stts", b"stss"):
+            f.seek(payload)
+            tables[kind] = f.read(box_end - payload)
+    return tracks
+
+
+def read_mp4_index(path: Path) -> Tuple[int, float, np.ndarray]:
+    """
+    Read frame count, frame rate and keyframe positions of the video track of an
+    MP4/MOV file from its sample tables, without decoding any frame.
+
+    :param path: Path to the video file
+    :type path: Path
+    :raises ValueError: If the file has no video track
+    :return: Number of frames, frames per second and sorted 0-based keyframe
+        numbers
+    :rtype: Tuple[int, float, np.ndarray]
+    """
+    with open(path, "rb") as f:
+        tracks = _read_tables(f, 0, os.fstat(f.fileno()).st_size, {})
+    for track in tracks:
+        # hdlr: version/flags, pre_defined, handler type
+        if track.get(b"hdlr", b"")[8:12] == b"vide" and b"stts" in track:
+            break
+    else:
+        raise ValueError(f"No video track in {path}.")
+    mdhd = track[b"mdhd"]
+    timescale = struct.unpack(">I", mdhd[20:24] if mdhd[0] == 1 else mdhd[12:16])[0]
+    (num_entries,) = struct.unpack(">I", track[b"stts"][4:8])
+    stts = np.frombuffer(track[b"stts"], dtype=">u4", count=2 * num_entries, offset=8)
+    counts, deltas = stts[0::2].astype(np.int64), stts[1::2].astype(np.int64)
+    num_frames = int(counts.sum())
+    duration = int((counts * deltas).sum())
+    fps = timescale * num_frames / duration if duration > 0 else 0.0
+    if b"stss" in track:
+        (num_keyframes,) = struct.unpack(">I", track[b"stss"][4:8])
+        # sync sample numbers are 1-based
+        keyframes = (
+            np.frombuffer(
+                track[b"stss"], dtype=">u4", count=num_keyframes, offset=8
+            ).astype(np.int64)
+            - 1
+        )
+    else:
+        # without a sync sample table every frame is a keyframe
+        keyframes = np.arange(num_frames, dtype=np.int64)
+    return num_frames, fps, keyframes
+
+
+class VideoIndex:
+    """
+    Frame count, frame rate and keyframe positions of one video.
+    """
+
+    def __init__(
+        self,
+        video_id: str,
+        path: Path,
+        num_frames: int,
+        fps: float,
+        keyframes: np.ndarray,
+    ):
+        self.video_id = video_id
+        self.path = path
+        self.num_frames = num_frames
+        self.fps = fps
+        self.keyframes = np.asarray(keyframes, dtype=np.int64)
+
+    @staticmethod
+    def from_file(path: Path) -> "VideoIndex":
+        """
+        Index a video file, the video ID is the file name without extension.
+
+        :param path: Path to the video file
+        :type path: Path
+        :return: Index of the video
+        :rtype: VideoIndex
+        """
+        num_frames, fps, keyframes = read_mp4_index(path)
+        return VideoIndex(path.stem, path, num_frames, fps, keyframes)
+
+    def keyframe_before(self, frame: int) -> int:
+        """
+        Return the closest keyframe at or before a frame.
+
+        :param frame: 0-based frame number
+        :type frame: int
+        :return: 0-based keyframe number
+        :rtype: int
+        """
+        i = np.searchsorted(self.keyframes, frame, side="right") - 1
+        return int(self.keyframes[i]) if i >= 0 else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "video_id": self.video_id,
+            "path": str(self.path),
+            "num_frames": self.num_frames,
+            "fps": self.fps,
+            "keyframes": self.keyframes.tolist(),
+        }
+
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> "VideoIndex":
+        return VideoIndex(
+            d["video_id"], Path(d["path"]), d["num_frames"], d["fps"], d["keyframes"]
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"VideoIndex({self.video_id}, frames={self.num_frames}, "
+            f"keyframes={len(self.keyframes)})"
+        )
+
+
+def index_videos(
+    video_dir: Optional[Path] = None,
+    num_workers: Optional[int] = None,
+    overwrite: bool = False,
+) -> List[VideoIndex]:
+    """
+    Index all videos in a directory in parallel.
+
+    The index is cached as JSON in KVASIR_CAPSULE_CACHE_PATH, keyed by the paths,
+    sizes and modification times of the video files.
+
+    :param video_dir: Directory with video files, defaults to KVASIR_CAPSULE_VIDEO_PATH
+    :type video_dir: Path, optional
+    :param num_workers: Number of parallel workers, defaults to the number of CPUs
+    :type num_workers: int, optional
+    :param overwrite: Index again even if a cached index exists, defaults to False
+    :type overwrite: bool, optional
+    :raises FileNotFoundError: If the directory does not exist
+    :return: Index per video, sorted by path
+    :rtype: List[VideoIndex]
+    """
+    video_dir = KVASIR_CAPSULE_VIDEO_PATH if video_dir is None else video_dir
+    if not video_dir.is_dir():
+        raise FileNotFoundError(
+            f"No video directory {video_dir}, see download_unlabelled_videos()."
+        )
+    paths = sorted(
+        p for p in video_dir.rglob("*") if p.suffix.lower() in VIDEO_EXTENSIONS
+    )
+    stats = [p.stat() for p in paths]
+    key = hash_strings(
+        f"{p.resolve()}|{s.st_size}|{s.st_mtime_ns}" for p, s in zip(paths, stats)
+    )
+    cache_path = KVASIR_CAPSULE_CACHE_PATH / "videos" / f"{key[:16]}.json"
+    if cache_path.is_file() and not overwrite:
+        with open(cache_path, "r") as f:
+            return [VideoIndex.from_dict(d) for d in json.load(f)]
+
+    videos = parallel_map(
+        VideoIndex.from_file, paths, num_workers=num_workers, desc="Indexing videos"
+    )
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = temporary_path(cache_path)
+    with open(tmp_path, "w") as f:
+        json.dump([video.to_dict() for video in videos], f)
+    tmp_path.replace(cache_path)
+    return videos
+
+
+class VideoFrameReader:
+    """
+    Random-access frame reader that keeps a few videos open.
+
+    A read continues decoding from the current position of an open video if that
+    position lies between the closest preceding keyframe and the requested frame.
+    Otherwise it seeks to that keyframe, so at most one group of pictures is decoded
+    to reach any frame. Readers are not shared between processes, every DataLoader
+    worker opens its own videos.
+    """
+
+    def __init__(self, max_open: int = 4):
+        """
+        :param max_open: Maximum number of open videos, defaults to 4
+        :type max_open: int, optional
+        """
+        self.max_open = max_open
+        # open capture and number of the next frame it decodes, by path
+        self._captures: OrderedDict[Path, Tuple[cv2.VideoCapture, int]] = OrderedDict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_captures"] = OrderedDict()
+        return state
+
+    def _capture(self, video: VideoIndex) -> Tuple[cv2.VideoCapture, int]:
+        if video.path in self._captures:
+            self._captures.move_to_end(video.path)
+            return self._captures[video.path]
+        if len(self._captures) >= self.max_open:
+            _, (capture, _) = self._captures.popitem(last=False)
+            capture.release()
+        capture = cv2.VideoCapture(str(video.path))
+        if not capture.isOpened():
+            raise IOError(f"Cannot open video {video.path}")
+        self._captures[video.path] = (capture, 0)
+        return capture, 0
+
+    def read(self, video: VideoIndex, start: int, count: int = 1) -> np.ndarray:
+        """
+        Decode consecutive frames of a video.
+
+        :param video: Video to read from
+        :type video: VideoIndex
+        :param start: 0-based number of the first frame
+        :type start: int
+        :param count: Number of frames, defaults to 1
+        :type count: int, optional
+        :raises IndexError: If the frames are out of range
+        :raises IOError: If a frame cannot be decoded
+        :return: RGB frames as uint8 array (count, H, W, 3)
+        :rtype: np.ndarray
+        """
+        if start < 0 or count < 1 or start + count > video.num_frames:
+            raise IndexError(
+                f"Frames [{start}, {start + count}) out of range for {video}"
+            )
+        capture, position = self._capture(video)
+        keyframe = video.keyframe_before(start)
+        if not keyframe <= position <= start:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            position = keyframe
+        while position < start:
+            # grab() decodes without converting the frame
+            if not capture.grab():
+                raise IOError(f"Cannot decode frame {position} of {video.path}")
+            position += 1
+        frames = []
+        for _ in range(count):
+            ok, frame = capture.read()
+            if not ok:
+                raise IOError(f"Cannot decode frame {position} of {video.path}")
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            position += 1
+        self._captures[video.path] = (capture, position)
+        return np.stack(frames)
+
+    def close(self):
+        """
+        Release all open videos.
+        """
+        for capture, _ in self._captures.values():
+            capture.release()
+        self._captures.clear()
+
+
+def read_frames(
+    requests: Sequence[Tuple[VideoIndex, int]], num_workers: Optional[int] = None
+) -> List[np.ndarray]:
+    """
+    Decode single frames of many videos in a worker pool.
+
+    Requests are grouped per video and read in frame order, so frames of the same
+    group of pictures are decoded once.
+
+    :param requests: (video, frame number) pairs
+    :type requests: Sequence[Tuple[VideoIndex, int]]
+    :param num_workers: Number of decoding workers, defaults to the number of CPUs
+    :type num_workers: int, optional
+    :return: RGB frames (H, W, 3) as uint8 arrays in the order of the requests
+    :rtype: List[np.ndarray]
+    """
+    groups: Dict[Path, List[int]] = {}
+    for i, (video, _) in enumerate(requests):
+        groups.setdefault(video.path, []).append(i)
+
+    def decode(indices: List[int]) -> List[Tuple[int, np.ndarray]]:
+        reader = VideoFrameReader(max_open=1)
+        indices = sorted(indices, key=lambda i: requests[i][1])
+        try:
+            return [(i, reader.read(*requests[i])[0]) for i in indices]
+        finally:
+            reader.close()
+
+    frames: List[np.ndarray] = [np.empty(0, dtype=np.uint8)] * len(requests)
+    for group in parallel_map(
+        decode, list(groups.values()), num_workers=num_workers, desc="Decoding frames"
+    ):
+        for i, frame in group:
+            frames[i] = frame
+    return frames
+
+
+class KvasirCapsuleVideoDataset(Dataset):
+    """
+    Unlabelled frames or clips of consecutive frames, decoded on the fly from the
+    videos instead of extracting them to images first.
+
+    Items are returned as (image, video_id, frame_id), with a float32 image in
+    [0, 1] like KvasirCapsuleSample.load_image(), or a clip (clip_length, H, W, 3)
+    if clip_length > 1. Clips are augmented consistently via albumentations'
+    "images" target. Shuffled access is served by seeking to keyframes, sequential
+    access decodes forward without seeking.
+    """
+
+    def __init__(
+        self,
+        videos: Optional[Sequence[VideoIndex]] = None,
+        clip_length: int = 1,
+        stride: int = 1,
+        transform: Optional[A.BaseCompose] = None,
+        max_open_videos: int = 4,
+    ):
+        """
+        :param videos: Indexed videos, defaults to index_videos()
+        :type videos: Sequence[VideoIndex], optional
+        :param clip_length: Number of consecutive frames per item, defaults to 1
+        :type clip_length: int, optional
+        :param stride: Frames between the starts of consecutive items, defaults to 1
+        :type stride: int, optional
+        :param transform: Transform applied to every item, defaults to None
+        :type transform: A.BaseCompose, optional
+        :param max_open_videos: Open videos per process, defaults to 4
+        :type max_open_videos: int, optional
+        """
+        self.videos = list(index_videos() if videos is None else videos)
+        self.clip_length = clip_length
+        self.stride = stride
+        self.transform = transform
+        self.reader = VideoFrameReader(max_open_videos)
+        self._by_id = {video.video_id: video for video in self.videos}
+        num_items = [
+            max((video.num_frames - clip_length) // stride + 1, 0)
+            for video in self.videos
+        ]
+        self.offsets = np.zeros(len(self.videos) + 1, dtype=np.int64)
+        np.cumsum(num_items, out=self.offsets[1:])
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def locate(self, index: int) -> Tuple[VideoIndex, int]:
+        """
+        Return the video and first frame number of an item.
+
+        :param index: Item index
+        :type index: int
+        :return: Video and 0-based frame number
+        :rtype: Tuple[VideoIndex, int]
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(f"Index {index} out of range")
+        v = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        return self.videos[v], int(index - self.offsets[v]) * self.stride
+
+    def frames(self, video_id: str, start: int, count: int = 1) -> np.ndarray:
+        """
+        Decode a range of frames of a video, without transform.
+
+        :param video_id: Video ID
+        :type video_id: str
+        :param start: 0-based number of the first frame
+        :type start: int
+        :param count: Number of frames, defaults to 1
+        :type count: int, optional
+        :return: RGB frames as uint8 array (count, H, W, 3)
+        :rtype: np.ndarray
+        """
+        return self.reader.read(self._by_id[video_id], start, count)
+
+    def __getitem__(self, index):
+        video, start = self.locate(index)
+        clip = self.reader.read(video, start, self.clip_length)
+        clip = clip.astype(np.float32) / np.float32(255.0)
+        if self.clip_length == 1:
+            image = clip[0]
+            if self.transform is not None:
+                image = self.transform(image=image)["image"]
+            return image, video.video_id, start
+        if self.transform is not None:
+            clip = self.transform(images=clip)["images"]
+        return clip, video.video_id, start
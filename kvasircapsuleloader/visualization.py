@@ -0,0 +1,246 @@
+import json
+import math
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Sequence
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .config import KVASIR_CAPSULE_CACHE_PATH
+from .sample import KvasirCapsuleSample
+from .types import findingclass_to_dirname
+from .utils import hash_strings, parallel_map, temporary_path
+
+
+def _decode_thumbnail(sample: KvasirCapsuleSample, size: int) -> np.ndarray:
+    """
+    Decode an image at reduced resolution and resize it to (size, size).
+    """
+    image = sample.open_image()
+    # JPEG DCT scaling decodes directly at 1/2, 1/4 or 1/8 resolution
+    image.draft("RGB", (size, size))
+    image = image.convert("RGB").resize((size, size), Image.Resampling.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
+
+
+class ThumbnailCache:
+    """
+    Append-only on-disk store of square uint8 thumbnails, keyed by sample filename.
+
+    Thumbnails are kept in one flat file that is read via np.memmap, so assembling
+    an atlas from cached thumbnails is a single gather. Only samples that are not
+    cached yet are decoded. The store is meant to be written by one process at a
+    time.
+    """
+
+    def __init__(self, size: int = 64, path: Optional[Path] = None):
+        """
+        :param size: Edge length of the thumbnails in pixels, defaults to 64
+        :type size: int, optional
+        :param path: Directory of the store, defaults to a directory in
+            KVASIR_CAPSULE_CACHE_PATH
+        :type path: Path, optional
+        """
+        self.size = size
+        self.path = (
+            KVASIR_CAPSULE_CACHE_PATH / "thumbnails" / str(size)
+            if path is None
+            else path
+        )
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._data_path = self.path / "thumbnails.u8"
+        self._index_path = self.path / "index.json"
+        self._index: Dict[str, int] = {}
+        if self._index_path.is_file():
+            with open(self._index_path, "r") as f:
+                self._index = json.load(f)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _add(self, samples: Sequence[KvasirCapsuleSample], num_workers: Optional[int]):
+        thumbnails = parallel_map(
+            lambda s: _decode_thumbnail(s, self.size),
+            samples,
+            num_workers=num_workers,
+            desc="Rendering thumbnails",
+        )
+        # truncate a partially written tail left behind by an interrupted run
+        thumb_bytes = self.size * self.size * 3
+        with open(self._data_path, "ab") as f:
+            f.truncate(len(self._index) * thumb_bytes)
+            for thumbnail in thumbnails:
+                f.write(thumbnail.tobytes())
+        for sample in samples:
+            self._index[sample.filename] = len(self._index)
+        tmp_path = temporary_path(self._index_path)
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        tmp_path.replace(self._index_path)
+
+    def get(
+        self,
+        samples: Sequence[KvasirCapsuleSample],
+        num_workers: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Return thumbnails of samples, decoding missing ones in parallel.
+
+        :param samples: Samples to return thumbnails for
+        :type samples: Sequence[KvasirCapsuleSample]
+        :param num_workers: Number of decoding workers, defaults to the number of CPUs
+        :type num_workers: int, optional
+        :return: Uint8 array (N, size, size, 3)
+        :rtype: np.ndarray
+        """
+        missing = list(
+            {s.filename: s for s in samples if s.filename not in self._index}.values()
+        )
+        if missing:
+            self._add(missing, num_workers)
+        if not samples:
+            return np.zeros((0, self.size, self.size, 3), dtype=np.uint8)
+        data = np.memmap(
+            self._data_path,
+            dtype=np.uint8,
+            mode="r",
+            shape=(len(self._index), self.size, self.size, 3),
+        )
+        rows = np.fromiter((self._index[s.filename] for s in samples), dtype=np.int64)
+        return data[rows]
+
+
+def render_atlas(
+    samples: Sequence[KvasirCapsuleSample],
+    thumb_size: int = 64,
+    columns: Optional[int] = None,
+    draw_bboxes: bool = True,
+    num_workers: Optional[int] = None,
+    cache: Optional[ThumbnailCache] = None,
+    path: Optional[Path] = None,
+) -> Image.Image:
+    """
+    Render a tiled thumbnail atlas of samples in the given order.
+
+    :param samples: Samples to render, e.g. KvasirCapsuleSubset.samples
+    :type samples: Sequence[KvasirCapsuleSample]
+    :param thumb_size: Edge length of a tile in pixels, defaults to 64
+    :type thumb_size: int, optional
+    :param columns: Number of tiles per row, defaults to a square atlas
+    :type columns: int, optional
+    :param draw_bboxes: Draw bounding boxes on the tiles, defaults to True
+    :type draw_bboxes: bool, optional
+    :param num_workers: Number of decoding workers, defaults to the number of CPUs
+    :type num_workers: int, optional
+    :param cache: Thumbnail cache, defaults to the cache for thumb_size
+    :type cache: ThumbnailCache, optional
+    :param path: Save the atlas as image to this path, defaults to None
+    :type path: Path, optional
+    :return: Atlas image
+    :rtype: Image.Image
+    """
+    if cache is None:
+        cache = ThumbnailCache(thumb_size)
+    thumbnails = cache.get(samples, num_workers=num_workers)
+    N, s = len(samples), cache.size
+    columns = max(math.ceil(math.sqrt(N)), 1) if columns is None else columns
+    rows = max(math.ceil(N / columns), 1)
+    grid = np.zeros((rows * columns, s, s, 3), dtype=np.uint8)
+    grid[:N] = thumbnails
+    atlas = Image.fromarray(
+        grid.reshape(rows, columns, s, s, 3)
+        .transpose(0, 2, 1, 3, 4)
+        .reshape(rows * s, columns * s, 3)
+    )
+    if draw_bboxes:
+        draw = ImageDraw.Draw(atlas)
+        for i, sample in enumerate(samples):
+            if sample.bbox is None:
+                continue
+            x0, y0, x1, y1 = sample.bbox.to_pascal_voc()
+            left, top = (i % columns) * s, (i // columns) * s
+            sx, sy = s / sample.bbox.norm_x, s / sample.bbox.norm_y
+            draw.rectangle(
+                (left + x0 * sx, top + y0 * sy, left + x1 * sx, top + y1 * sy),
+                outline=(0, 255, 0),
+            )
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # an interrupted save must not leave a truncated image at path
+        tmp_path = temporary_path(path)
+        atlas.save(tmp_path, format=Image.registered_extensions().get(path.suffix))
+        tmp_path.replace(path)
+    return atlas
+
+
+def _atlas_key(sample: KvasirCapsuleSample) -> str:
+    """
+    Part of the atlas cache key of a sample: filename and bounding box.
+    """
+    if sample.bbox is None:
+        return sample.filename
+    bbox = [*sample.bbox.to_pascal_voc(), sample.bbox.norm_x, sample.bbox.norm_y]
+    return f"{sample.filename}|{','.join(str(float(v)) for v in bbox)}"
+
+
+def render_atlases(
+    samples: Sequence[KvasirCapsuleSample],
+    group_by: Literal["class", "patient"] = "class",
+    thumb_size: int = 64,
+    draw_bboxes: bool = True,
+    num_workers: Optional[int] = None,
+    output_dir: Optional[Path] = None,
+) -> Dict[str, Image.Image]:
+    """
+    Render one atlas per finding class or per patient (video ID).
+
+    Rendered atlases are cached as PNG in KVASIR_CAPSULE_CACHE_PATH, keyed by the
+    samples of the group, their bounding boxes and the rendering settings, so only
+    groups whose samples changed are rendered again.
+
+    :param samples: Samples to render, e.g. KvasirCapsuleSubset.samples
+    :type samples: Sequence[KvasirCapsuleSample]
+    :param group_by: Grouping, defaults to "class"
+    :type group_by: Literal["class", "patient"], optional
+    :param thumb_size: Edge length of a tile in pixels, defaults to 64
+    :type thumb_size: int, optional
+    :param draw_bboxes: Draw bounding boxes on the tiles, defaults to True
+    :type draw_bboxes: bool, optional
+    :param num_workers: Number of decoding workers, defaults to the number of CPUs
+    :type num_workers: int, optional
+    :param output_dir: Additionally save atlases as <group>.png here, defaults to None
+    :type output_dir: Path, optional
+    :return: Atlas by group name
+    :rtype: Dict[str, Image.Image]
+    """
+    groups: Dict[str, List[KvasirCapsuleSample]] = {}
+    for sample in samples:
+        if group_by == "class":
+            name = findingclass_to_dirname(sample.finding_class)
+        else:
+            name = str(sample.video_id)
+        groups.setdefault(name, []).append(sample)
+
+    cache = ThumbnailCache(thumb_size)
+    atlas_dir = KVASIR_CAPSULE_CACHE_PATH / "atlases"
+    atlases: Dict[str, Image.Image] = {}
+    for name, group in sorted(groups.items()):
+        key = hash_strings(
+            [str(thumb_size), str(draw_bboxes)] + [_atlas_key(s) for s in group]
+        )
+        atlas_path = atlas_dir / f"{key[:16]}.png"
+        if atlas_path.is_file():
+            atlases[name] = Image.open(atlas_path)
+            atlases[name].load()
+        else:
+            atlases[name] = render_atlas(
+                group,
+                draw_bboxes=draw_bboxes,
+                num_workers=num_workers,
+                cache=cache,
+                path=atlas_path,
+            )
+        if output_dir is not None:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            atlases[name].save(output_dir / f"{name}.png")
+    return atlases
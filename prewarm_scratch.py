@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+from typing import Optional
+
+import click
+
+from kvasircapsuleloader import KvasirCapsuleDataset
+
+
+@click.command()
+@click.option("--phase", "-P", multiple=True, default=["train"])
+@click.option("--workers", "-W", type=int, default=None)
+def main(phase: tuple, workers: Optional[int]):
+    dataset = KvasirCapsuleDataset()
+    for p in phase:
+        click.secho(f"Prewarming phase {p}...", fg="blue")
+        dataset.prewarm(p, num_workers=workers)
+    click.secho("Done.", fg="green")
+
+
+if __name__ == "__main__":
+    main()
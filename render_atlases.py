@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from kvasircapsuleloader import KvasirCapsuleDataset, render_atlases
+
+
+@click.command()
+@click.option(
+    "--phase", "-P", default=None, help="Split phase, defaults to all samples"
+)
+@click.option(
+    "--group-by", "-G", type=click.Choice(["class", "patient"]), default="class"
+)
+@click.option("--thumb-size", "-T", type=int, default=64)
+@click.option("--workers", "-W", type=int, default=None)
+@click.option("--out", "-O", type=click.Path(path_type=Path), default=Path("atlases"))
+def main(
+    phase: Optional[str],
+    group_by: str,
+    thumb_size: int,
+    workers: Optional[int],
+    out: Path,
+):
+    dataset = KvasirCapsuleDataset()
+    samples = (
+        dataset.metadata.samples if phase is None else dataset.split.samples[phase]
+    )
+    render_atlases(
+        samples,
+        group_by=group_by,  # type: ignore[arg-type]
+        thumb_size=thumb_size,
+        num_workers=workers,
+        output_dir=out,
+    )
+    click.secho(f"Atlases written to {out}.", fg="green")
+
+
+if __name__ == "__main__":
+    main()
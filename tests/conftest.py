@@ -0,0 +1,81 @@
+from typing import List
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import kvasircapsuleloader.metadata
+import kvasircapsuleloader.sample
+from kvasircapsuleloader import BoundingBox, FindingClass, findingclass_to_dirname
+from kvasircapsuleloader.metadata import KvasirCapsuleMetadata
+from kvasircapsuleloader.sample import KvasirCapsuleSample
+from kvasircapsuleloader.types import CategoryByClass
+
+
+@pytest.fixture
+def fake_samples(tmp_path, monkeypatch) -> List[KvasirCapsuleSample]:
+    """
+    Small KvasirCapsule-like directory tree with random lossless images, three
+    patients and three classes, every other sample with a bounding box.
+    """
+    monkeypatch.setattr(kvasircapsuleloader.sample, "KVASIR_CAPSULE_PATH", tmp_path)
+    rng = np.random.default_rng(0)
+    classes = [
+        FindingClass.NORMAL_CLEAN_MUCOSA,
+        FindingClass.POLYP,
+        FindingClass.PYLORUS,
+    ]
+    samples = []
+    for i in range(24):
+        finding_class = classes[i % len(classes)]
+        directory = tmp_path / findingclass_to_dirname(finding_class)
+        directory.mkdir(exist_ok=True)
+        filename = f"sample_{i:03d}.jpg"
+        pixels = rng.integers(0, 256, size=(32, 32, 3), dtype=np.uint8)
+        # PIL detects the format from content, PNG keeps pixels exact
+        Image.fromarray(pixels).save(directory / filename, format="PNG")
+        bbox = BoundingBox.from_kvasir_capsule(4, 4, 20, 4, 20, 16, 4, 16)
+        bbox.norm_x = bbox.norm_y = 32
+        samples.append(
+            KvasirCapsuleSample(
+                filename,
+                f"video_{i % 3}",
+                i,
+                CategoryByClass[finding_class],
+                finding_class,
+                bbox if i % 2 == 0 else None,
+            )
+        )
+    return samples
+
+
+@pytest.fixture
+def fake_metadata(tmp_path, monkeypatch) -> KvasirCapsuleMetadata:
+    """
+    metadata.csv of 30 patients with skewed class frequencies, a rare class with
+    four patients and a class with a single patient.
+    """
+    monkeypatch.setattr(kvasircapsuleloader.metadata, "KVASIR_CAPSULE_PATH", tmp_path)
+    rng = np.random.default_rng(0)
+    classes = {
+        "Normal clean mucosa": (30, 40),
+        "Reduced mucosal view": (20, 10),
+        "Pylorus": (25, 10),
+        "Polyp": (8, 5),
+        "Ulcer": (4, 3),
+        "Blood - hematin": (1, 5),
+    }
+    rows: List[str] = []
+    for finding_class, (num_patients, mean_count) in classes.items():
+        category = "Anatomy" if finding_class == "Pylorus" else "Luminal"
+        patients = rng.choice(30, num_patients, replace=False)
+        for patient in patients:
+            for _ in range(1 + rng.poisson(mean_count)):
+                rows.append(
+                    f"frame_{len(rows):05d}.jpg;video_{patient:02d};{len(rows)};"
+                    f"{category};{finding_class}" + ";" * 8
+                )
+    header = "filename;video_id;frame_number;finding_category;finding_class;"
+    header += "x1;y1;x2;y2;x3;y3;x4;y4"
+    (tmp_path / "metadata.csv").write_text("\n".join([header] + rows) + "\n")
+    return KvasirCapsuleMetadata()
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import albumentations as A  # type: ignore[import-untyped]
+import numpy as np
+from albumentations.pytorch import ToTensorV2  # type: ignore[import-untyped]
+
+import kvasircapsuleloader.augmentation
+from kvasircapsuleloader import (
+    KvasirCapsuleAugmentedDataset,
+    build_augmentation_bank,
+)
+from kvasircapsuleloader.dataset import KvasirCapsuleSubset
+
+
+def test_augmentation_bank(fake_samples, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        kvasircapsuleloader.augmentation, "KVASIR_CAPSULE_CACHE_PATH", tmp_path
+    )
+    transform = A.Compose(
+        [
+            A.ColorJitter(),
+            A.Resize(16, 16),
+            A.RandomRotate90(),
+            A.HorizontalFlip(),
+            A.Normalize((0.5,), (0.25,), max_pixel_value=1.0),
+            ToTensorV2(),
+        ],
+        bbox_params=A.BboxParams(format="yolo"),
+    )
+    parent = SimpleNamespace(transforms={"train": transform})
+    subset = KvasirCapsuleSubset("train", parent, fake_samples)  # type: ignore[arg-type]
+
+    bank = build_augmentation_bank(subset, num_variants=3, num_workers=4)
+    assert bank.images.shape == (len(fake_samples), 3, 16, 16, 3)
+    assert np.array_equal(
+        bank.has_bbox.any(axis=1), [s.bbox is not None for s in fake_samples]
+    )
+    images = np.array(bank.images)
+    # variants differ, rebuilding reproduces them bit by bit
+    assert not np.array_equal(images[:, 0], images[:, 1])
+    rebuilt = build_augmentation_bank(
+        subset, num_variants=3, num_workers=1, overwrite=True
+    )
+    assert np.array_equal(np.array(rebuilt.images), images)
+    assert np.array_equal(rebuilt.bboxes, bank.bboxes)
+
+    dataset = KvasirCapsuleAugmentedDataset(bank, seed=1)
+    schedule = np.stack([dataset.schedule(epoch) for epoch in range(3)], axis=1)
+    assert np.all(np.sort(schedule, axis=1) == np.arange(3))
+    dataset.set_epoch(4)
+    image, bboxes, label = dataset[2]
+    assert tuple(image.shape) == (3, 16, 16)
+    assert label == fake_samples[2].finding_class.value
+    assert np.array_equal(bboxes[0], bank.bboxes[2, dataset.variants[2]])
+    raw = KvasirCapsuleAugmentedDataset(bank, seed=1, tail=False)
+    raw.set_epoch(4)
+    assert np.array_equal(raw[2][0], images[2, dataset.variants[2]])
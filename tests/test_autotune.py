@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+import kvasircapsuleloader.autotune
+from kvasircapsuleloader.autotune import LoaderConfig, autotune_loader
+from kvasircapsuleloader.dataset import KvasirCapsuleSubset
+from kvasircapsuleloader.transforms import make_transforms
+
+
+def test_autotune_loader(fake_samples, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        kvasircapsuleloader.autotune, "AUTOTUNE_CACHE_PATH", tmp_path / "autotune.json"
+    )
+    parent = SimpleNamespace(path=tmp_path, transforms=make_transforms())
+    subset = KvasirCapsuleSubset("val", parent, fake_samples)  # type: ignore[arg-type]
+    config = autotune_loader(
+        subset, batch_sizes=(2, 4), worker_counts=(0, 1), num_batches=2
+    )
+    assert config.batch_size in (2, 4)
+    assert config.num_workers in (0, 1)
+    assert config.throughput > 0
+    assert config.bottleneck in ("io", "decode", "augment")
+
+    cached = autotune_loader(
+        subset, batch_sizes=(2, 4), worker_counts=(0, 1), num_batches=2
+    )
+    assert cached.to_dict() == config.to_dict()
+    # a different candidate grid is probed again
+    other = autotune_loader(subset, batch_sizes=(3,), worker_counts=(0,), num_batches=2)
+    assert other.batch_size == 3
+    images, _, labels = next(iter(cached.dataloader(subset, shuffle=True)))
+    assert len(labels) == config.batch_size
+
+
+def test_loader_config_kwargs():
+    config = LoaderConfig(16, 0, 4, False)
+    assert config.kwargs()["prefetch_factor"] is None
+    assert not config.kwargs()["persistent_workers"]
@@ -0,0 +1,40 @@
+import numpy as np
+import torch
+
+from kvasircapsuleloader import BatchAssembler
+
+
+def test_batch_assembler():
+    assembler = BatchAssembler(4, image_size=(8, 8), num_buffers=2, pin_memory=False)
+    batch = [
+        (torch.rand(3, 8, 8), [[0.5, 0.5, 0.2, 0.2]], 3),
+        (torch.rand(3, 8, 8), [[0, 0, 0, 0]], 9),
+        (torch.rand(3, 8, 8), [], 1),
+    ]
+    images, bboxes, labels = assembler(batch)
+    assert images.shape == (3, 3, 8, 8)
+    assert images.dtype == torch.float16
+    assert images.is_contiguous(memory_format=torch.channels_last)
+    assert torch.allclose(images[1].float(), batch[1][0], atol=1e-3)
+    assert bboxes.shape == (3, 1, 4)
+    assert torch.equal(bboxes[0, 0], torch.tensor([0.5, 0.5, 0.2, 0.2]))
+    assert labels.tolist() == [3, 9, 1]
+
+    # ring of two buffers: the third batch reuses the first buffer
+    second, _, _ = assembler(batch)
+    third, _, _ = assembler(batch)
+    assert third.data_ptr() == images.data_ptr() != second.data_ptr()
+
+
+def test_batch_assembler_uint8_hwc():
+    assembler = BatchAssembler(
+        2, image_size=(4, 4), dtype=torch.uint8, channels_last=False, pin_memory=False
+    )
+    image = np.random.default_rng(0).random((4, 4, 3), dtype=np.float32)
+    images, _, _ = assembler([(image, [], 0)])
+    assert images.dtype == torch.uint8
+    assert images.is_contiguous()
+    assert torch.equal(
+        images[0],
+        torch.from_numpy(np.round(image * 255).astype(np.uint8)).permute(2, 0, 1),
+    )
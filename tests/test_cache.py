@@ -0,0 +1,74 @@
+import pickle
+
+import numpy as np
+
+from kvasircapsuleloader import DecodedImageCache, EncodedImageArena
+from kvasircapsuleloader.storage import TieredStorage, set_tiered_storage
+
+
+def test_decoded_image_cache(fake_samples, tmp_path):
+    cache = DecodedImageCache(fake_samples, tmp_path / "cache", image_shape=(32, 32, 3))
+    sample = fake_samples[3]
+    assert sample not in cache
+    assert np.array_equal(cache.load(sample), sample.load_image())
+    assert sample in cache
+
+    cache.fill(num_workers=4)
+    assert all(s in cache for s in fake_samples)
+
+    # reopened (e.g. in a spawned worker) without decoding again
+    restored = pickle.loads(pickle.dumps(cache))
+    assert np.array_equal(
+        restored.load(fake_samples[5], scale=False),
+        fake_samples[5].load_image(scale=False),
+    )
+
+
+def test_decoded_image_cache_concurrent_open(fake_samples, tmp_path):
+    path = tmp_path / "cache"
+    cache = DecodedImageCache(fake_samples, path, image_shape=(32, 32, 3))
+    cache.load(fake_samples[3])
+    cache.flush()
+    del cache
+    # another process opens the cache while only the data file exists
+    (path / "filled.u8").unlink()
+    reopened = DecodedImageCache(fake_samples, path, image_shape=(32, 32, 3))
+    assert np.array_equal(reopened._data[3], fake_samples[3].load_image(scale=False))
+    assert not list(path.glob("*.tmp"))
+
+
+def test_encoded_image_arena(fake_samples):
+    arena = EncodedImageArena(fake_samples, num_workers=4)
+    assert len(arena) == len(fake_samples)
+    assert arena.nbytes == sum(s.image_path.stat().st_size for s in fake_samples)
+    for sample in fake_samples[:4]:
+        assert bytes(arena.encoded(sample)) == sample.image_path.read_bytes()
+        assert np.array_equal(arena.load(sample), sample.load_image())
+
+
+def test_encoded_image_arena_shared(fake_samples):
+    arena = EncodedImageArena(fake_samples, shared=True)
+    # a spawned worker attaches to the same segment by name
+    restored = pickle.loads(pickle.dumps(arena))
+    assert np.array_equal(
+        restored.load(fake_samples[7], scale=False),
+        fake_samples[7].load_image(scale=False),
+    )
+    restored.close()
+    arena.close()
+
+
+def test_encoded_image_arena_small_scratch(fake_samples, tmp_path):
+    total = sum(s.image_path.stat().st_size for s in fake_samples)
+    storage = TieredStorage(
+        fake_samples[0].image_path.parents[1], tmp_path / "scratch", total // 4
+    )
+    set_tiered_storage(storage)
+    try:
+        # files are evicted while the arena is still being read
+        arena = EncodedImageArena(fake_samples, num_workers=4)
+    finally:
+        set_tiered_storage(None)
+    assert storage.usage() <= total // 4
+    for sample in fake_samples:
+        assert bytes(arena.encoded(sample)) == sample.image_path.read_bytes()
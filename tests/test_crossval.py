@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from kvasircapsuleloader import CrossValidation
+from kvasircapsuleloader.split import generate_kfold_split, make_kfold_split
+
+
+def test_folds_are_patient_disjoint(fake_metadata):
+    dataset = SimpleNamespace(metadata=fake_metadata)
+    patient_of = np.array([s.video_id for s in fake_metadata.samples])
+    for strategy in ["shuffle", "sort", "solve"]:
+        cv = CrossValidation(dataset, k=3, strategy=strategy, cache_images=False)
+        patients = [set(patient_of[fold]) for fold in cv.folds]
+        for i in range(len(cv)):
+            for j in range(i + 1, len(cv)):
+                assert not patients[i] & patients[j], strategy
+            assert not set(patient_of[cv.train_indices(i)]) & patients[i]
+        # every row is in exactly one fold
+        rows = np.sort(np.concatenate(cv.folds))
+        assert np.array_equal(rows, np.arange(len(fake_metadata.samples)))
+
+
+def test_default_folds_balance_classes(fake_metadata):
+    cv = CrossValidation(
+        SimpleNamespace(metadata=fake_metadata), k=3, cache_images=False
+    )
+    assert cv.split._strategy == "solve"
+    patient_of = np.array([s.video_id for s in fake_metadata.samples])
+    patients = [set(patient_of[fold]) for fold in cv.folds]
+    assert sum(len(p) for p in patients) == len(set(patient_of))
+    # every class with at least k patients is present in every fold
+    labels = np.array([s.finding_class.value for s in fake_metadata.samples])
+    for c in np.unique(labels):
+        if len(set(patient_of[labels == c])) >= 3:
+            assert all((labels[fold] == c).any() for fold in cv.folds)
+
+
+def test_leaking_split_is_rejected(fake_metadata):
+    # per-class assignment puts patients with several classes into several folds
+    split = make_kfold_split(3)
+    split.generate(fake_metadata, strategy="shuffle")
+    with pytest.raises(ValueError, match="share the patients: video_"):
+        CrossValidation(
+            SimpleNamespace(metadata=fake_metadata), 3, split=split, cache_images=False
+        )
+    with pytest.raises(ValueError, match="phases"):
+        CrossValidation(
+            SimpleNamespace(metadata=fake_metadata), 2, split=split, cache_images=False
+        )
+    # a precomputed patient-disjoint split is used as is
+    split = generate_kfold_split(fake_metadata, 3, strategy="sort")
+    cv = CrossValidation(
+        SimpleNamespace(metadata=fake_metadata), 3, split=split, cache_images=False
+    )
+    assert cv.split is split
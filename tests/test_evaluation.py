@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import torch
+
+from kvasircapsuleloader.evaluation import Evaluator
+from kvasircapsuleloader.types import FindingCategory, FindingClass
+
+
+def test_evaluator_frame_metrics():
+    rng = np.random.default_rng(0)
+    targets = torch.from_numpy(rng.integers(0, 4, 100))
+    logits = torch.from_numpy(rng.random((100, 4)))
+    evaluator = Evaluator(4)
+    for start in range(0, 100, 32):
+        evaluator.update(logits[start : start + 32], targets[start : start + 32])
+    predictions = logits.argmax(dim=1)
+    metrics = evaluator.compute()
+    recalls = [
+        float((predictions[targets == c] == c).double().mean()) for c in range(4)
+    ]
+    assert np.isclose(
+        metrics["accuracy_micro"], float((predictions == targets).double().mean())
+    )
+    assert np.isclose(metrics["accuracy_macro"], np.mean(recalls))
+    assert np.isclose(metrics["accuracy_weighted"], metrics["accuracy_micro"])
+    assert int(evaluator.confusion.sum()) == 100
+
+
+def test_evaluator_patient_metrics(fake_samples):
+    evaluator = Evaluator(14, fake_samples)
+    targets = torch.tensor([s.finding_class.value for s in fake_samples])
+    predictions = targets.clone()
+    # one wrong frame is outvoted within its finding
+    predictions[0] = 0
+    evaluator.update(predictions[:10], targets[:10])
+    evaluator.update(predictions[10:], targets[10:])
+    metrics = evaluator.compute()
+    assert metrics["accuracy_micro"] < 1.0
+    assert metrics["patient_accuracy_micro"] == 1.0
+    accuracies = evaluator.patient_accuracies()
+    assert accuracies["video_0"] < 1.0 and accuracies["video_1"] == 1.0
+
+
+def test_evaluator_category_metrics():
+    # pylorus (anatomy) confused with polyp (luminal) and with ampulla (anatomy)
+    targets = torch.tensor([FindingClass.PYLORUS.value] * 4)
+    predictions = torch.tensor(
+        [FindingClass.PYLORUS.value, FindingClass.AMPULLA_OF_VATER.value]
+        + [FindingClass.POLYP.value] * 2
+    )
+    evaluator = Evaluator(len(FindingClass))
+    evaluator.update(predictions, targets)
+    anatomy, luminal = FindingCategory.ANATOMY.value, FindingCategory.LUMINAL.value
+    confusion = evaluator.category_confusion()
+    assert confusion[anatomy, anatomy] == 2 and confusion[anatomy, luminal] == 2
+    metrics = evaluator.compute()
+    assert metrics["accuracy_micro"] == 0.25
+    assert metrics["category_accuracy_micro"] == 0.5
+
+
+def test_evaluator_without_updates(fake_samples):
+    with pytest.raises(ValueError):
+        Evaluator(14).patient_confusion()
+    evaluator = Evaluator(14, fake_samples)
+    assert int(evaluator.patient_confusion().sum()) == 0
+    assert evaluator.patient_accuracies() == {}
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+import albumentations as A  # type: ignore[import-untyped]
+import numpy as np
+import torch.nn as nn
+from albumentations.pytorch import ToTensorV2  # type: ignore[import-untyped]
+
+import kvasircapsuleloader.features
+from kvasircapsuleloader.dataset import KvasirCapsuleSubset
+from kvasircapsuleloader.features import KvasirCapsuleFeatureDataset, extract_features
+
+
+def test_feature_store(fake_samples, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        kvasircapsuleloader.features, "KVASIR_CAPSULE_CACHE_PATH", tmp_path
+    )
+    transform = A.Compose(
+        [A.Resize(16, 16), ToTensorV2()], bbox_params=A.BboxParams(format="yolo")
+    )
+    parent = SimpleNamespace(transforms={"val": transform})
+    subset = KvasirCapsuleSubset("val", parent, fake_samples)  # type: ignore[arg-type]
+    model = nn.Sequential(nn.AdaptiveAvgPool2d(1), nn.Flatten())
+
+    store = extract_features(model, "avgpool", subset, batch_size=5)
+    assert len(store) == len(fake_samples)
+    assert store.dim == 3
+    assert store.features.dtype == np.float16
+    assert extract_features(model, "avgpool", subset).path == store.path
+    # the caller's training mode is restored
+    model.train()
+    extract_features(model, "avgpool", subset, overwrite=True)
+    assert all(module.training for module in model.modules())
+
+    dataset = KvasirCapsuleFeatureDataset(store)
+    feature, label, video_id = dataset[4]
+    assert np.allclose(
+        feature.numpy(), fake_samples[4].load_image().mean(axis=(0, 1)), atol=1e-2
+    )
+    assert label == fake_samples[4].finding_class.value
+    assert video_id == fake_samples[4].video_id
+    batches = list(dataset.iter_batches(10, seed=0))
+    assert sum(len(labels) for _, labels, _ in batches) == len(fake_samples)
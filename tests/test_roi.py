@@ -0,0 +1,34 @@
+import numpy as np
+
+import kvasircapsuleloader.roi
+from kvasircapsuleloader import KvasirCapsuleRoiDataset, extract_rois
+
+
+def test_roi_store(fake_samples, tmp_path, monkeypatch):
+    monkeypatch.setattr(kvasircapsuleloader.roi, "KVASIR_CAPSULE_CACHE_PATH", tmp_path)
+    # bbox (4, 4, 20, 16) in 32x32 frames, no margin and no border: exact crop
+    store = extract_rois(fake_samples, margin=0.0, output_size=16, pad=0.0)
+    assert len(store) == 12
+    assert extract_rois(fake_samples, margin=0.0, output_size=16, pad=0.0).path == (
+        store.path
+    )
+    sample = fake_samples[2]
+    i = store.index(sample)
+    # the context square is centred on the bbox, rows 2..18 of the frame
+    assert np.array_equal(store.crops[i], sample.load_image(scale=False)[2:18, 4:20])
+    assert np.allclose(store.bboxes[i], [0.5, 0.5, 1.0, 0.75])
+    assert store.labels[i] == sample.finding_class.value
+
+    padded = extract_rois(fake_samples, margin=0.25, output_size=16, pad=0.25)
+    assert padded.stored_size == 24
+    dataset = KvasirCapsuleRoiDataset(padded)
+    image, bboxes, label = dataset[i]
+    assert image.shape == (16, 16, 3) and image.dtype == np.float32
+    assert np.allclose(bboxes[0], [0.5, 0.5, 2 / 3, 0.5], atol=1e-5)
+
+    jittered = KvasirCapsuleRoiDataset(padded, jitter=0.25, scale_jitter=0.2)
+    np.random.seed(0)
+    for _ in range(10):
+        image, bboxes, _ = jittered[i]
+        assert image.shape == (16, 16, 3)
+        assert np.all((bboxes[0] >= 0) & (bboxes[0] <= 1))
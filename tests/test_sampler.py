@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from kvasircapsuleloader import PatientBlockDistributedSampler, PrioritySampler
+from kvasircapsuleloader.sampler import SumTree
+
+
+def test_patient_block_sampler(fake_samples):
+    dataset = SimpleNamespace(samples=fake_samples[:23])
+    samplers = [
+        PatientBlockDistributedSampler(dataset, num_replicas=3, rank=r)
+        for r in range(3)
+    ]
+    assert all(len(s) == 8 for s in samplers)
+    # blocks are disjoint apart from padding and cover the dataset
+    blocks = [set(s.block.tolist()) for s in samplers]
+    assert set.union(*blocks) == set(range(23))
+    assert sum(len(b) for b in blocks) == 23
+    # 3 patients on 3 ranks: every rank reads exactly one patient
+    assert [s.video_ids() for s in samplers] == [["video_0"], ["video_1"], ["video_2"]]
+
+    sampler = samplers[0]
+    first = list(sampler)
+    assert sorted(set(first)) == sorted(blocks[0])
+    assert list(sampler) == first
+    sampler.set_epoch(1)
+    assert list(sampler) != first
+    assert set(sampler) <= blocks[0]
+
+
+def test_patient_block_sampler_balanced(fake_samples):
+    dataset = SimpleNamespace(samples=fake_samples)
+    sampler = PatientBlockDistributedSampler(
+        dataset, num_replicas=2, rank=1, balance_classes=True, drop_last=True
+    )
+    indices = list(sampler)
+    assert len(indices) == 12
+    assert set(indices) <= set(sampler.block.tolist())
+
+
+def test_sum_tree():
+    rng = np.random.default_rng(0)
+    tree = SumTree(1000)
+    priorities = rng.random(1000)
+    tree.update(np.arange(1000), priorities)
+    assert np.isclose(tree.total, priorities.sum())
+    tree.update(np.array([3, 500]), np.array([100.0, 0.0]))
+    priorities[[3, 500]] = [100.0, 0.0]
+    assert np.isclose(tree.total, priorities.sum())
+    assert np.array_equal(tree.priorities(), priorities)
+
+    indices = tree.sample(200000, rng)
+    frequencies = np.bincount(indices, minlength=1000) / len(indices)
+    assert np.allclose(frequencies, priorities / priorities.sum(), atol=2e-3)
+    assert frequencies[500] == 0
+
+
+def test_priority_sampler(fake_samples):
+    dataset = SimpleNamespace(samples=fake_samples)
+    sampler = PrioritySampler(dataset, batch_size=5, min_class_probability=0.2)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 5
+    assert sum(len(b) for b in batches) == len(fake_samples)
+
+    indices, weights = sampler.pop_batch()
+    assert indices.tolist() == batches[0]
+    assert len(weights) == 5 and float(weights.max()) <= 1.0
+
+    # all mass on one sample, classes still keep their minimum probability
+    losses = np.zeros(len(fake_samples))
+    losses[0] = 1000.0
+    sampler.update(np.arange(len(fake_samples)), losses)
+    probabilities = sampler.probabilities(np.arange(len(fake_samples)))
+    assert np.isclose(probabilities.sum(), 1.0)
+    labels = np.array([s.finding_class.value for s in fake_samples])
+    for label in np.unique(labels):
+        assert probabilities[labels == label].sum() >= 0.2 - 1e-9
+
+
+def test_patient_block_sampler_uneven(fake_samples):
+    dataset = SimpleNamespace(samples=fake_samples[:22])
+    samplers = [
+        PatientBlockDistributedSampler(dataset, num_replicas=4, rank=r)
+        for r in range(4)
+    ]
+    # blocks of 6, 6, 5 and 5 samples, the short ones padded from their own block
+    assert all(len(s) == len(s.block) == 6 for s in samplers)
+    blocks = [set(s.block.tolist()) for s in samplers]
+    assert [len(b) for b in blocks] == [6, 6, 5, 5]
+    assert set.union(*blocks) == set(range(22))
+    assert sum(len(b) for b in blocks) == 22
+
+
+def test_patient_block_sampler_balanced_padding(fake_samples):
+    dataset = SimpleNamespace(samples=fake_samples[:23])
+    sampler = PatientBlockDistributedSampler(
+        dataset, num_replicas=3, rank=2, balance_classes=True
+    )
+    own = set(sampler.block[:7].tolist())
+    assert len(own) == 7 and len(sampler) == 8
+    for epoch in range(5):
+        sampler.set_epoch(epoch)
+        indices = list(sampler)
+        assert len(indices) == 8 and set(indices) <= own
+    # the repeated padding sample is not drawn more often than the others
+    assert float(sampler._weights[7:].sum()) == 0.0
+
+
+def test_patient_block_sampler_too_few_samples(fake_samples):
+    dataset = SimpleNamespace(samples=fake_samples[:3])
+    with pytest.raises(ValueError):
+        PatientBlockDistributedSampler(dataset, num_replicas=4, rank=0)
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from kvasircapsuleloader import (
+    FindingClass,
+    PatientRatioSplit,
+    SplitArchive,
+    save_splits,
+)
+from kvasircapsuleloader.split import make_kfold_split, solve_patient_assignment
+
+
+def test_solve_patient_assignment():
+    rng = np.random.default_rng(0)
+    counts = rng.poisson(5, size=(40, 6)) * (rng.random((40, 6)) < 0.5)
+    ratios = np.array([0.6, 0.2, 0.2])
+    assignment = solve_patient_assignment(counts, ratios, seed=1)
+    achieved = np.stack([counts[assignment == f].sum(axis=0) for f in range(3)])
+    achieved = achieved / counts.sum(axis=0)
+    assert np.all(achieved > 0)
+    assert np.abs(achieved - ratios[:, None]).max() < 0.1
+    assert np.array_equal(assignment, solve_patient_assignment(counts, ratios, 1))
+
+
+def test_patient_ratio_split_solve(fake_metadata):
+    split = PatientRatioSplit(train=0.8, val=0.1, test=0.1)
+    split.generate(fake_metadata, strategy="solve", seed=3)
+    # classes with fewer patients than phases are ignored
+    assert FindingClass.BLOOD_HEMATIN not in split.classes
+    assert len(split.classes) == 5
+    # every patient is in exactly one phase
+    patients = [
+        {s.video_id for s in split.samples[p]} for p in ("train", "val", "test")
+    ]
+    assert sum(len(p) for p in patients) == len(set.union(*patients))
+
+    report = split.report()
+    assert set(report.index.get_level_values("phase")) == {"train", "val", "test"}
+    assert (report.samples > 0).all()
+    assert np.allclose(report.groupby(level="finding_class").achieved.sum(), 1.0)
+    assert abs(report.loc[("ALL", "train"), "deviation"]) < 0.05
+
+    # seeded variance studies: solved splits deviate less on rare classes
+    sort_split = PatientRatioSplit(train=0.8, val=0.1, test=0.1)
+    sort_split.generate(fake_metadata, strategy="sort")
+    solved = [PatientRatioSplit(train=0.8, val=0.1, test=0.1) for _ in range(20)]
+    for seed, s in enumerate(solved):
+        s.generate(fake_metadata, strategy="solve", seed=seed)
+    assert len({tuple(x.filename for x in s.samples["val"]) for s in solved}) > 1
+    deviation = np.mean([s.report().deviation.abs().mean() for s in solved])
+    assert deviation < sort_split.report().deviation.abs().mean()
+
+
+def test_split_serialization(fake_metadata, tmp_path):
+    split = PatientRatioSplit(train=0.8, val=0.1, test=0.1)
+    split.generate(fake_metadata, strategy="solve")
+    split.save(tmp_path / "split.json")
+    loaded = PatientRatioSplit.load(tmp_path / "split.json", fake_metadata)
+    assert loaded.samples == split.samples
+    assert loaded.classes == split.classes
+
+    # k-fold and seed sweep in one archive
+    archive_path = tmp_path / "sweep.splits"
+    split.save(archive_path)
+    folds = make_kfold_split(3)
+    folds.generate(fake_metadata, strategy="shuffle")
+    sweep = {}
+    for seed in range(5):
+        sweep[f"seed{seed}"] = PatientRatioSplit(train=0.8, val=0.1, test=0.1)
+        sweep[f"seed{seed}"].generate(fake_metadata, strategy="solve", seed=seed)
+    save_splits(archive_path, {"kfold3": folds, **sweep})
+
+    archive = SplitArchive(archive_path)
+    assert archive.names() == ["default", "kfold3"] + list(sweep)
+    assert archive.metadata_hash == fake_metadata.content_hash()
+    indices = archive.indices("kfold3")
+    assert isinstance(indices["fold0"], np.memmap)
+    for phase, rows in folds.indices().items():
+        assert np.array_equal(indices[phase], rows)
+    for name, expected in [("default", split), ("seed3", sweep["seed3"])]:
+        loaded = PatientRatioSplit.load(archive_path, fake_metadata, name=name)
+        assert loaded.samples == expected.samples
+        assert loaded._seed == expected._seed
+
+    fake_metadata.samples.pop()
+    fake_metadata._content_hash = None
+    with pytest.raises(ValueError):
+        archive.load("default", fake_metadata)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from kvasircapsuleloader.statistics import (
+    ChannelMoments,
+    DatasetStatistics,
+    compute_statistics,
+)
+
+
+def test_moments_merge():
+    rng = np.random.default_rng(0)
+    pixels = rng.random((1000, 3))
+    merged = ChannelMoments()
+    for chunk in np.array_split(pixels, 7):
+        merged.merge(ChannelMoments.from_pixels(chunk))
+    assert merged.count == 1000
+    assert np.allclose(merged.mean, pixels.mean(axis=0))
+    assert np.allclose(merged.std, pixels.std(axis=0))
+
+
+def test_compute_statistics(fake_samples, tmp_path):
+    statistics = compute_statistics(fake_samples, num_workers=4, bins=16, chunk_size=5)
+    pixels = np.concatenate(
+        [s.load_image(scale=False).reshape(-1, 3) for s in fake_samples]
+    )
+    assert statistics.num_pixels == len(pixels)
+    assert np.allclose(statistics.mean, pixels.mean(axis=0) / 255.0)
+    assert np.allclose(statistics.std, pixels.std(axis=0) / 255.0)
+    assert sum(h.sum() for h in statistics.histograms.values()) == pixels.size
+    assert len(statistics.histograms) == 3
+
+    statistics.save(tmp_path / "stats.npz")
+    loaded = DatasetStatistics.load(tmp_path / "stats.npz")
+    assert np.allclose(loaded.mean, statistics.mean)
+    assert loaded.histograms.keys() == statistics.histograms.keys()
+    assert "train" in loaded.transforms()
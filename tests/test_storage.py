@@ -0,0 +1,44 @@
+from pathlib import Path
+
+import numpy as np
+
+from kvasircapsuleloader.storage import TieredStorage, set_tiered_storage
+
+
+def test_tiered_storage(tmp_path):
+    primary, scratch = tmp_path / "primary", tmp_path / "scratch"
+    (primary / "Polyp").mkdir(parents=True)
+    for i in range(10):
+        (primary / "Polyp" / f"{i}.jpg").write_bytes(bytes([i]) * 100)
+
+    storage = TieredStorage(primary, scratch, max_bytes=500)
+    path = storage.resolve(Path("Polyp/0.jpg"))
+    assert path == scratch / "Polyp" / "0.jpg"
+    assert path.read_bytes() == bytes([0]) * 100
+
+    storage.prewarm([Path(f"Polyp/{i}.jpg") for i in range(10)], num_workers=4)
+    assert storage.usage() <= 500
+    assert not list(scratch.rglob("*.tmp"))
+    # evicted files are transparently filled again
+    for i in range(10):
+        assert storage.resolve(Path(f"Polyp/{i}.jpg")).read_bytes() == bytes([i]) * 100
+
+
+def test_open_image_after_eviction(fake_samples, tmp_path, monkeypatch):
+    sample = fake_samples[0]
+    storage = TieredStorage(sample.image_path.parents[1], tmp_path / "scratch")
+    expected = sample.load_image()
+    resolve = storage.resolve
+
+    def resolve_and_evict(relative_path: Path) -> Path:
+        # another process evicts the file right after it was resolved
+        path = resolve(relative_path)
+        path.unlink()
+        return path
+
+    monkeypatch.setattr(storage, "resolve", resolve_and_evict)
+    set_tiered_storage(storage)
+    try:
+        assert np.array_equal(sample.load_image(), expected)
+    finally:
+        set_tiered_storage(None)
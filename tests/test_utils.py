@@ -0,0 +1,26 @@
+import pytest
+
+from kvasircapsuleloader.utils import publish_directory
+
+
+def test_publish_directory(tmp_path):
+    path = tmp_path / "store"
+    with publish_directory(path) as tmp:
+        (tmp / "data").write_text("first")
+    assert (path / "data").read_text() == "first"
+
+    # another process published first, its directory is kept
+    with publish_directory(path) as tmp:
+        (tmp / "data").write_text("second")
+    assert (path / "data").read_text() == "first"
+
+    with publish_directory(path, overwrite=True) as tmp:
+        (tmp / "data").write_text("third")
+    assert (path / "data").read_text() == "third"
+
+    with pytest.raises(RuntimeError):
+        with publish_directory(path, overwrite=True) as tmp:
+            (tmp / "data").write_text("fourth")
+            raise RuntimeError()
+    assert (path / "data").read_text() == "third"
+    assert [p.name for p in tmp_path.iterdir()] == ["store"]
@@ -0,0 +1,86 @@
+from pathlib import Path
+from typing import List
+
+import cv2
+import numpy as np
+import pytest
+
+import kvasircapsuleloader.video
+from kvasircapsuleloader import KvasirCapsuleVideoDataset, VideoIndex, index_videos
+from kvasircapsuleloader.video import read_frames
+
+
+def _decode_all(path: Path) -> np.ndarray:
+    capture = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    capture.release()
+    return np.stack(frames)
+
+
+@pytest.fixture
+def fake_videos(tmp_path, monkeypatch) -> List[Path]:
+    """
+    Two small MPEG-4 videos with a keyframe every 8 frames and a moving square.
+    """
+    monkeypatch.setattr(
+        kvasircapsuleloader.video, "KVASIR_CAPSULE_CACHE_PATH", tmp_path / "cache"
+    )
+    paths = []
+    for v, num_frames in enumerate([40, 27]):
+        path = tmp_path / "videos" / f"video_{v}.mp4"
+        path.parent.mkdir(exist_ok=True)
+        writer = cv2.VideoWriter(
+            str(path),
+            cv2.CAP_FFMPEG,
+            cv2.VideoWriter.fourcc(*"mp4v"),
+            25,
+            (32, 32),
+            [cv2.VIDEOWRITER_PROP_KEY_INTERVAL, 8],
+        )
+        for i in range(num_frames):
+            frame = np.full((32, 32, 3), 40 * v, dtype=np.uint8)
+            frame[i % 24 : i % 24 + 8, 4:12] = 255
+            writer.write(frame)
+        writer.release()
+        paths.append(path)
+    return paths
+
+
+def test_video_index(fake_videos, tmp_path):
+    videos = index_videos(tmp_path / "videos", num_workers=2)
+    assert [v.video_id for v in videos] == ["video_0", "video_1"]
+    assert [v.num_frames for v in videos] == [40, 27]
+    assert videos[0].fps == pytest.approx(25.0)
+    keyframes = videos[0].keyframes
+    assert keyframes[0] == 0 and len(keyframes) > 1
+    assert np.all(np.diff(keyframes) > 0)
+    assert videos[0].keyframe_before(int(keyframes[1]) + 1) == keyframes[1]
+    assert (tmp_path / "cache" / "videos").is_dir()
+    restored = VideoIndex.from_dict(videos[0].to_dict())
+    assert np.array_equal(restored.keyframes, keyframes)
+
+
+def test_video_dataset_random_access(fake_videos, tmp_path):
+    videos = index_videos(tmp_path / "videos")
+    expected = {path.stem: _decode_all(path) for path in fake_videos}
+    dataset = KvasirCapsuleVideoDataset(videos)
+    assert len(dataset) == 67
+    for index in np.random.default_rng(0).permutation(len(dataset))[:30]:
+        image, video_id, frame_id = dataset[int(index)]
+        assert np.allclose(image * 255, expected[video_id][frame_id], atol=1e-3)
+
+    clips = KvasirCapsuleVideoDataset(videos, clip_length=5, stride=4)
+    assert len(clips) == 9 + 6
+    clip, video_id, start = clips[len(clips) - 1]
+    assert (video_id, start) == ("video_1", 20)
+    assert np.array_equal(dataset.frames("video_1", 20, 5), expected["video_1"][20:25])
+
+    requests = [(videos[1], 3), (videos[0], 39), (videos[1], 26), (videos[0], 0)]
+    frames = read_frames(requests, num_workers=2)
+    for (video, frame_id), frame in zip(requests, frames):
+        assert np.array_equal(frame, expected[video.video_id][frame_id])
@@ -0,0 +1,34 @@
+import numpy as np
+
+import kvasircapsuleloader.visualization
+from kvasircapsuleloader.visualization import (
+    ThumbnailCache,
+    render_atlas,
+    render_atlases,
+)
+
+
+def test_render_atlas(fake_samples, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        kvasircapsuleloader.visualization, "KVASIR_CAPSULE_CACHE_PATH", tmp_path
+    )
+    cache = ThumbnailCache(16, tmp_path / "thumbs")
+    atlas = render_atlas(fake_samples[:10], columns=4, cache=cache, draw_bboxes=False)
+    assert atlas.size == (4 * 16, 3 * 16)
+    assert len(cache) == 10
+    tile = np.asarray(atlas)[16:32, 16:32]
+    assert np.array_equal(tile, cache.get([fake_samples[5]])[0])
+
+    # only new samples are decoded, the store is reopened from disk
+    render_atlas(fake_samples, cache=cache)
+    assert len(ThumbnailCache(16, tmp_path / "thumbs")) == len(fake_samples)
+
+    atlases = render_atlases(fake_samples, group_by="patient", thumb_size=16)
+    assert sorted(atlases) == ["video_0", "video_1", "video_2"]
+    assert len(list((tmp_path / "atlases").glob("*.png"))) == 3
+
+    # edited bounding boxes render the atlas of their group again
+    fake_samples[0].bbox.x += 2
+    render_atlases(fake_samples, group_by="patient", thumb_size=16)
+    assert len(list((tmp_path / "atlases").glob("*.png"))) == 4
+    assert not list((tmp_path / "atlases").glob("*.tmp"))